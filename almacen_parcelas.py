@@ -0,0 +1,271 @@
+# almacen_parcelas.py
+"""
+Almacén local de parcelas de Catastro (atributos + geometría), indexado por SMP.
+
+Lo llena cosechar_parcelas.py recorriendo sección/manzana; api_datos_catastrales
+lo consulta antes de ir a EPOK (catastro_parcela_by_smp / catastro_geometria_by_smp).
+
+SQLite en disco (cache/parcelas.sqlite3) + LRU en memoria de los registros ya
+decodificados, así un SMP consultado seguido sale a velocidad de memoria.
+Las parcelas más viejas que MAX_EDAD_S no se sirven (se va a EPOK).
+"""
+from __future__ import annotations
+
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from pathlib import Path
+
+import cache_local
+import geometria as geom
+
+ALMACEN_PATH = Path("cache") / "parcelas.sqlite3"
+# edad máxima de una parcela para servirla en lugar de EPOK
+MAX_EDAD_S = 90 * 24 * 3600
+# cada cuánto se vuelve a mirar si apareció el archivo (mientras no exista)
+_RECHEQUEO_S = 60
+
+_MEMORIA = cache_local.CacheTTL("almacen_parcelas", ttl_s=3600, max_items=50_000, persistente=False)
+_local = threading.local()
+_existe = False
+_ultimo_chequeo = float("-inf")
+
+
+# ====== SQLITE ======
+def _conexion() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(ALMACEN_PATH)
+    if conn is None:
+        ALMACEN_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(ALMACEN_PATH), timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS parcelas ("
+            " smp TEXT PRIMARY KEY, seccion TEXT NOT NULL, manzana TEXT NOT NULL, parcela TEXT NOT NULL,"
+            " huella TEXT NOT NULL, atributos BLOB NOT NULL, geometria BLOB,"
+            " minx REAL, miny REAL, maxx REAL, maxy REAL, ts REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS parcelas_manzana ON parcelas (seccion, manzana)")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS manzanas ("
+            " seccion TEXT NOT NULL, manzana TEXT NOT NULL, n_parcelas INTEGER NOT NULL,"
+            " huella TEXT NOT NULL, ts REAL NOT NULL, PRIMARY KEY (seccion, manzana))"
+        )
+        conns[ALMACEN_PATH] = conn
+    return conn
+
+
+def disponible() -> bool:
+    """
+    Hay almacén en disco. Mientras no exista no abrimos nada (ni creamos el archivo
+    en cada lookup); se vuelve a mirar cada _RECHEQUEO_S.
+    """
+    global _existe, _ultimo_chequeo
+    if _existe:
+        return True
+    ahora = time.monotonic()
+    if ahora - _ultimo_chequeo > _RECHEQUEO_S:
+        _ultimo_chequeo = ahora
+        _existe = ALMACEN_PATH.exists()
+    return _existe
+
+
+def _comprimir(obj) -> bytes:
+    return zlib.compress(json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+
+
+def _descomprimir(blob: bytes | None):
+    return None if blob is None else json.loads(zlib.decompress(blob))
+
+
+def huella_de(obj) -> str:
+    """
+    Hash estable del contenido (para detectar parcelas / manzanas que cambiaron).
+    """
+    s = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"))
+    return hashlib.sha1(s.encode("utf-8")).hexdigest()
+
+
+# ====== ESCRITURA (cosecha) ======
+def guardar(smp: str, atributos: dict, geometria: dict | None = None) -> None:
+    """
+    Inserta / actualiza una parcela. geometria=None conserva la geometría que ya hubiera.
+    """
+    seccion, manzana, parcela = smp.split("-")
+    bbox = (None, None, None, None)
+    if geometria is not None:
+        try:
+            b = geom.metricas(geometria)["bbox"]
+            if b:
+                bbox = tuple(b)
+        except (ValueError, KeyError, TypeError, IndexError):
+            pass
+
+    conn = _conexion()
+    with conn:
+        conn.execute(
+            "INSERT INTO parcelas (smp, seccion, manzana, parcela, huella, atributos, geometria,"
+            " minx, miny, maxx, maxy, ts) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)"
+            " ON CONFLICT(smp) DO UPDATE SET huella = excluded.huella, atributos = excluded.atributos,"
+            " geometria = COALESCE(excluded.geometria, parcelas.geometria),"
+            " minx = COALESCE(excluded.minx, parcelas.minx), miny = COALESCE(excluded.miny, parcelas.miny),"
+            " maxx = COALESCE(excluded.maxx, parcelas.maxx), maxy = COALESCE(excluded.maxy, parcelas.maxy),"
+            " ts = excluded.ts",
+            (smp, seccion, manzana, parcela, huella_de(atributos), _comprimir(atributos),
+             None if geometria is None else _comprimir(geometria), *bbox, time.time()),
+        )
+    _MEMORIA.borrar(smp)
+    global _existe
+    _existe = True
+
+
+def marcar_manzana(seccion: str, manzana: str, n_parcelas: int, huella: str) -> None:
+    conn = _conexion()
+    with conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO manzanas (seccion, manzana, n_parcelas, huella, ts) VALUES (?, ?, ?, ?, ?)",
+            (seccion, manzana, n_parcelas, huella, time.time()),
+        )
+
+
+def borrar(smps: list[str]) -> None:
+    """
+    Parcelas que ya no aparecen al recorrer su manzana (unificadas / subdivididas).
+    """
+    if not smps:
+        return
+    conn = _conexion()
+    with conn:
+        conn.executemany("DELETE FROM parcelas WHERE smp = ?", [(s,) for s in smps])
+    for s in smps:
+        _MEMORIA.borrar(s)
+
+
+def vencer(smps: list[str]) -> None:
+    """
+    Parcelas que no aparecieron en un recorrido incompleto de su manzana: no se borran
+    (pueden seguir existiendo) pero dejan de servirse hasta que una cosecha las renueve.
+    """
+    if not smps:
+        return
+    conn = _conexion()
+    with conn:
+        conn.executemany("UPDATE parcelas SET ts = 0 WHERE smp = ?", [(s,) for s in smps])
+    for s in smps:
+        _MEMORIA.borrar(s)
+
+
+# ====== LECTURA ======
+def manzana(seccion: str, manzana: str) -> dict | None:
+    row = _conexion().execute(
+        "SELECT n_parcelas, huella, ts FROM manzanas WHERE seccion = ? AND manzana = ?", (seccion, manzana)
+    ).fetchone()
+    return None if row is None else {"n_parcelas": row[0], "huella": row[1], "ts": row[2]}
+
+
+def manzana_cosechada(smp: str) -> bool:
+    """
+    La manzana del SMP tiene un recorrido completo registrado (marcar_manzana).
+    """
+    partes = (smp or "").split("-")
+    if len(partes) != 3 or not disponible():
+        return False
+    try:
+        return manzana(partes[0], partes[1]) is not None
+    except sqlite3.Error:
+        return False
+
+
+def manzanas_cosechadas() -> list[tuple[str, str]]:
+    if not disponible():
+        return []
+    return _conexion().execute("SELECT seccion, manzana FROM manzanas ORDER BY seccion, manzana").fetchall()
+
+
+def huellas_de_manzana(seccion: str, manzana: str) -> dict[str, tuple[str, bool]]:
+    """
+    smp -> (huella de atributos, tiene geometría) de lo ya cosechado en esa manzana.
+    """
+    rows = _conexion().execute(
+        "SELECT smp, huella, geometria IS NOT NULL FROM parcelas WHERE seccion = ? AND manzana = ?",
+        (seccion, manzana),
+    ).fetchall()
+    return {smp: (h, bool(g)) for smp, h, g in rows}
+
+
+def _registro(smp: str) -> dict | None:
+    reg = _MEMORIA.get(smp)
+    if reg is not None:
+        return reg
+    try:
+        row = _conexion().execute(
+            "SELECT atributos, geometria, ts FROM parcelas WHERE smp = ?", (smp,)
+        ).fetchone()
+    except sqlite3.Error:
+        return None
+    if row is None:
+        return None
+    reg = {"parcela": _descomprimir(row[0]), "geometria": _descomprimir(row[1]), "ts": row[2]}
+    _MEMORIA.set(smp, reg)
+    return reg
+
+
+def _vigente(smp: str) -> dict | None:
+    if not smp or not disponible():
+        return None
+    reg = _registro(smp)
+    if reg is None or time.time() - reg["ts"] > MAX_EDAD_S:
+        return None
+    return reg
+
+
+def parcela(smp: str) -> dict | None:
+    """
+    Atributos de la parcela (mismo payload que EPOK catastro/parcela) o None.
+    """
+    reg = _vigente(smp)
+    return None if reg is None else reg["parcela"]
+
+
+def geometria(smp: str) -> dict | None:
+    """
+    Geometría (SRID 97433, mismo payload que EPOK catastro/geometria) o None.
+    """
+    reg = _vigente(smp)
+    return None if reg is None else reg["geometria"]
+
+
+def iterar_geometrias(con_bbox: bool = True):
+    """
+    (smp, bbox, geometria) de todas las parcelas con geometría (para el índice espacial).
+    """
+    if not disponible():
+        return
+    cur = _conexion().execute(
+        "SELECT smp, minx, miny, maxx, maxy, geometria FROM parcelas"
+        " WHERE geometria IS NOT NULL" + (" AND minx IS NOT NULL" if con_bbox else "")
+    )
+    for smp, minx, miny, maxx, maxy, blob in cur:
+        yield smp, (minx, miny, maxx, maxy), _descomprimir(blob)
+
+
+def estadisticas() -> dict:
+    if not disponible():
+        return {"almacen": str(ALMACEN_PATH), "parcelas": 0, "manzanas": 0}
+    conn = _conexion()
+    parcelas, con_geom, ts_min = conn.execute(
+        "SELECT COUNT(*), COUNT(geometria), MIN(ts) FROM parcelas"
+    ).fetchone()
+    return {
+        "almacen": str(ALMACEN_PATH),
+        "parcelas": parcelas,
+        "con_geometria": con_geom,
+        "manzanas": conn.execute("SELECT COUNT(*) FROM manzanas").fetchone()[0],
+        "mas_vieja_s": round(time.time() - ts_min) if ts_min else None,
+    }
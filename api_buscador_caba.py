@@ -1,8 +1,30 @@
 import re
+import threading
+
 import requests
 
+import cache_local
+import http_client
+import indice_calles
+
 USIG_NORMALIZAR_URL = "https://servicios.usig.buenosaires.gob.ar/normalizar/"
 
+# Respuesta cruda de USIG por query canonizada (el filtrado/limit se aplica después)
+CACHE_AUTOCOMPLETE = cache_local.CacheTTL("usig_autocomplete", ttl_s=24 * 3600)
+# cantidad de opciones que devuelve USIG normalizar por default: una respuesta con
+# menos que esto está completa (no quedó nada afuera)
+USIG_MAX_OPCIONES = 10
+# largo mínimo de query (canonizada) para mandar a USIG / usar como prefijo
+MIN_CHARS = 3
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+# "corrientes y cal", "corrientes e ibera", "corrientes & callao": intersecciones
+_RE_CONECTOR = re.compile(r"\s(y|e)(\s|$)|&")
+
+# consultas: queries de >= MIN_CHARS; el resto dice de dónde salió cada una
+_stats = {"consultas": 0, "indice_calles": 0, "hit_exacto": 0, "hit_prefijo": 0, "usig": 0}
+_stats_lock = threading.Lock()
+
 
 def _solo_caba(item: dict) -> bool:
     return (item.get("cod_partido") or "").strip().lower() == "caba"
@@ -45,26 +67,136 @@ def _armar_label(item: dict) -> str:
     return nombre_calle or direccion
 
 
-def sugerir_calles_caba(query: str, limit: int = 10) -> dict:
+def _contar(clave: str, contar: bool) -> None:
+    # las consultas llegan desde los hilos de Flask: += sobre el dict no es atómico
+    if contar:
+        with _stats_lock:
+            _stats[clave] += 1
+
+
+# ====== CACHE POR PREFIJO ======
+def _cacheable(data) -> bool:
+    # USIG contesta algunos errores con 200 y {"errorMessage": ...}: eso no se guarda 24 h
+    return (isinstance(data, dict) and isinstance(data.get("direccionesNormalizadas"), list)
+            and "errorMessage" not in data and "error" not in data)
+
+
+def _tokens(s: str) -> list[str]:
+    return _RE_TOKEN.findall(cache_local.canonizar_direccion(s))
+
+
+def _coincide(item: dict, q_tokens: list[str]) -> bool:
+    """
+    Mismo criterio de match que USIG para calles: cada palabra de la query
+    es prefijo de alguna palabra del nombre.
+    """
+    nombre = _tokens(item.get("nombre_calle") or item.get("direccion") or "")
+    return all(any(t.startswith(q) for t in nombre) for q in q_tokens)
+
+
+def es_interseccion(query: str) -> bool:
+    """
+    'Corrientes y Cal' -> True: la contesta USIG (calle_y_calle), no el índice de calles.
+    """
+    return bool(_RE_CONECTOR.search(cache_local.canonizar_direccion(query)))
+
+
+def _solo_calles(items: list) -> bool:
+    return all((it.get("tipo") or "calle").strip().lower() == "calle" for it in items)
+
+
+def _desde_prefijo(key: str) -> dict | None:
+    """
+    Respuesta para `key` (sin altura) armada filtrando la respuesta cacheada de un
+    prefijo más corto, o None.
+    Sólo es correcto si la respuesta del prefijo estaba completa (menos de
+    USIG_MAX_OPCIONES) y era sólo de calles: el match de nombres es monótono (lo que
+    matchea "davil" matchea "davi"), así que todo lo que USIG devolvería para la
+    query larga ya está ahí. Una intersección ("corrientes y cal") no cumple eso
+    (USIG devuelve cruces, que no están en la respuesta de "corrientes"), y un
+    resultado vacío tampoco se arma: en los dos casos, None y se consulta USIG.
+    """
+    if _RE_CONECTOR.search(key):
+        return None
+    q_tokens = _RE_TOKEN.findall(key)
+    probados = set()
+    for i in range(len(key) - 1, MIN_CHARS - 1, -1):
+        prefijo = key[:i].rstrip(" ,")
+        if len(prefijo) < MIN_CHARS or prefijo in probados:
+            continue
+        probados.add(prefijo)
+        data = CACHE_AUTOCOMPLETE.get(prefijo, contar=False)
+        if not isinstance(data, dict):
+            continue
+        items = data.get("direccionesNormalizadas") or []
+        if len(items) >= USIG_MAX_OPCIONES or not _solo_calles(items):
+            # truncada (puede faltar algo que matchee la query larga) o con cruces /
+            # direcciones: un prefijo más corto no va a estar mejor
+            return None
+        filtrados = [it for it in items if _coincide(it, q_tokens)]
+        return {"direccionesNormalizadas": filtrados} if filtrados else None
+    return None
+
+
+def estadisticas() -> dict:
+    """
+    De dónde salió cada consulta del autocomplete y qué fracción no fue a USIG.
+    """
+    with _stats_lock:
+        out = dict(_stats)
+    out["sin_upstream_ratio"] = (
+        round(1 - out["usig"] / out["consultas"], 4) if out["consultas"] else None
+    )
+    return out
+
+
+def sugerir_calles_caba(query: str, limit: int = 10, contar: bool = True) -> dict:
     """
     Autocomplete de calles/direcciones (CABA) usando USIG normalizar.
     Acepta:
       - 'mitre' -> calles
       - 'davila 1130' -> direcciones con altura
       - 'davila 113' -> sugiere varias alturas cercanas (según lo que devuelva USIG)
+    Las queries sin altura se resuelven con el índice offline de calles (indice_calles)
+    cuando está disponible; USIG se consulta sólo si hay altura, si es una intersección
+    ('corrientes y cal', que el índice no sabe contestar) o si no hay índice.
+    Sin índice, una query que extiende otra ya cacheada con respuesta completa
+    ("davil" después de "davi") se contesta filtrando esa respuesta (_desde_prefijo).
+    contar=False: no suma a estadisticas() (precalentamiento, no son consultas de usuarios).
     Devuelve:
       {"query": "...", "sugerencias": [ {label, nombre_calle, cod_calle, altura, tipo}, ... ]}
     """
     q = (query or "").strip()
-    if len(q) < 3:
+    if len(q) < MIN_CHARS:
         return {"query": q, "sugerencias": []}
+    _contar("consultas", contar)
+    con_altura = bool(re.search(r"\d", q))
+
+    # Sin altura ni cruce: alcanza con el índice local de calles (no vamos a USIG)
+    if not con_altura and not es_interseccion(q):
+        indice = indice_calles.obtener_indice()
+        if indice is not None:
+            _contar("indice_calles", contar)
+            return {"query": q, "sugerencias": indice.buscar(q, limit=limit)}
 
     params = {"direccion": q}
+    key = cache_local.canonizar_direccion(q)
 
     try:
-        r = requests.get(USIG_NORMALIZAR_URL, params=params, timeout=15)
-        r.raise_for_status()
-        data = r.json()
+        data = CACHE_AUTOCOMPLETE.get(key)
+        if data is not None:
+            _contar("hit_exacto", contar)
+        elif not con_altura and (data := _desde_prefijo(key)) is not None:
+            # con altura no: "davila 11" -> "davila 113" cambia la altura, no filtra
+            _contar("hit_prefijo", contar)
+            CACHE_AUTOCOMPLETE.set(key, data)
+        else:
+            _contar("usig", contar)
+            r = http_client.get(USIG_NORMALIZAR_URL, params=params, servicio="usig_autocomplete")
+            r.raise_for_status()
+            data = r.json()
+            if _cacheable(data):
+                CACHE_AUTOCOMPLETE.set(key, data)
     except requests.exceptions.JSONDecodeError:
         return {"error": "La respuesta no es JSON válido", "query": q}
     except requests.exceptions.RequestException as e:
@@ -1,12 +1,14 @@
 import requests
 
+import http_client
+
 BASE_URL = "https://servicios.usig.buenosaires.gob.ar"
 
 
 def listar_partidos_amba() -> dict:
     url = f"{BASE_URL}/callejero-amba/partidos/"
     try:
-        r = requests.get(url, timeout=15)
+        r = http_client.get(url, servicio="usig_callejero")
         r.raise_for_status()
 
         # Esta API suele devolver texto (no JSON), lo dejamos estable
@@ -20,7 +22,7 @@ def obtener_callejero_partido(partido_id: str) -> dict:
     url = f"{BASE_URL}/callejero-amba/callejero/"
     params = {"partido": partido_id.strip()}
     try:
-        r = requests.get(url, params=params, timeout=20)
+        r = http_client.get(url, params=params, timeout=(3.05, 20), servicio="usig_callejero")
         r.raise_for_status()
 
         # Suele devolver texto/json según implementación; intentamos json y si no, texto
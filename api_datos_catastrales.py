@@ -1,9 +1,19 @@
 import json
 import re
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
 from pathlib import Path
+from typing import NamedTuple
 from urllib.parse import quote
 
-import requests
+import almacen_parcelas
+import cache_local
+import circuito
+import geometria
+import http_client
+import indice_alturas
+import indice_espacial
+import metricas
 
 # ====== CONFIG ======
 OUT_DIR = Path("salida_epok_test")
@@ -14,46 +24,89 @@ BASE_CATASTROINF = "https://epok.buenosaires.gob.ar/catastroinformal"
 BASE_USIG_NORM = "https://servicios.usig.buenosaires.gob.ar/normalizar/"
 SRID_GEOM = 97433  # metros
 
+# Resolver SMP en modo hedged: segundos de espera antes de lanzar la siguiente estrategia
+# (None = secuencial, 0 = todas en paralelo)
+HEDGE_DELAY_S = 1.5
+_RESOLVER_EXECUTOR = ThreadPoolExecutor(max_workers=12, thread_name_prefix="resolver_smp")
+
+# ruta 2 local (indice_espacial): radio de búsqueda de la parcela más cercana, en metros
+# (el punto de USIG suele caer en la vereda / calle, fuera del polígono)
+APROX_LOCAL_M = 25.0
+
+CACHE_NORMALIZAR = cache_local.CacheTTL("usig_normalizar", ttl_s=7 * 24 * 3600)
+
 # ====== HELPERS ======
 def dump(path: Path, obj):
     path.write_text(json.dumps(obj, ensure_ascii=False, indent=2), encoding="utf-8")
 
-def find_smp_anywhere(obj) -> str | None:
-    patterns = [
-    r"\b\d{2}-\d{3}-\d{3}\b",            # 01-001-010
-    r"\b\d{3}-\d{3}[A-Z]-\d{3}\b",       # 044-097A-029  ✅ (TU CASO)
-    r"\b\d{3}-\d{3}[A-Z]-\d{3}[A-Z]\b",  # 056-066A-014A
-    r"\b\d{2}-\d{3}[A-Z]-\d{3}[A-Z]\b",  # variantes raras
-    ]
-
-    def scan_string(s: str) -> str | None:
-        for p in patterns:
-            m = re.search(p, s)
-            if m:
-                return m.group(0)
-        return None
-
-    stack = [obj]
-    while stack:
-        cur = stack.pop()
-        if isinstance(cur, dict):
-            for v in cur.values():
-                if isinstance(v, str):
-                    got = scan_string(v)
-                    if got:
-                        return got
-                elif isinstance(v, (dict, list)):
-                    stack.append(v)
-        elif isinstance(cur, list):
-            for it in cur:
-                if isinstance(it, str):
-                    got = scan_string(it)
-                    if got:
-                        return got
-                elif isinstance(it, (dict, list)):
-                    stack.append(it)
+# ====== SMP ======
+# sección (2-3 dígitos) - manzana (3 dígitos [+ letra]) - parcela (3 dígitos [+ letra])
+#   01-001-010 | 044-097A-029 | 056-066A-014A | 044-098-001 | 015-040-013B
+# Las cuatro variantes sueltas de antes dejaban afuera combinaciones que EPOK sí
+# devuelve (sección de 3 dígitos con manzana sin letra, 044-098-001, es la más común).
+RE_SMP = re.compile(r"\b\d{2,3}-\d{3}[A-Z]?-\d{3}[A-Z]?\b")
+
+# claves que traen el SMP de la parcela misma (en orden de preferencia)
+_CLAVES_SMP = ("smp", "codigo")
+# claves que traen SMPs de OTRAS parcelas: nunca las usamos
+_CLAVES_VECINAS = {"smp_anterior", "smp_siguiente"}
+
+class SmpEncontrado(NamedTuple):
+    smp: str
+    origen: str      # ruta dentro del payload, ej "smp", "[0].smp", "parcela.seccion+manzana+parcela"
+    por_clave: bool  # False si salió del regex sobre un texto cualquiera
+
+def _smp_de_dict(d: dict) -> tuple[str, str] | None:
+    for k in _CLAVES_SMP:
+        v = d.get(k)
+        if isinstance(v, str) and RE_SMP.fullmatch(v.strip()):
+            return v.strip(), k
+    # EPOK también trae las partes por separado
+    partes = [d.get(k) for k in ("seccion", "manzana", "parcela")]
+    if all(isinstance(p, str) and p.strip() for p in partes):
+        smp = "-".join(p.strip() for p in partes)
+        if RE_SMP.fullmatch(smp):
+            return smp, "seccion+manzana+parcela"
     return None
 
+def extraer_smp(obj) -> SmpEncontrado | None:
+    """
+    Busca el SMP en una respuesta de EPOK en un solo recorrido (BFS, lo menos profundo primero):
+      1) claves conocidas (smp, codigo, seccion+manzana+parcela) -> gana la primera
+      2) si no hay, el primer texto que matchee RE_SMP (ignorando smp_anterior/smp_siguiente)
+    """
+    nivel = [(obj, "")]
+    por_texto: SmpEncontrado | None = None
+
+    while nivel:
+        siguiente = []
+        for cur, ruta in nivel:
+            if isinstance(cur, dict):
+                got = _smp_de_dict(cur)
+                if got:
+                    smp, clave = got
+                    return SmpEncontrado(smp, f"{ruta}.{clave}" if ruta else clave, True)
+                items = ((k, v, f"{ruta}.{k}" if ruta else str(k)) for k, v in cur.items() if k not in _CLAVES_VECINAS)
+            elif isinstance(cur, list):
+                items = ((i, v, f"{ruta}[{i}]") for i, v in enumerate(cur))
+            else:
+                continue
+
+            for _, v, sub in items:
+                if isinstance(v, (dict, list)):
+                    siguiente.append((v, sub))
+                elif por_texto is None and isinstance(v, str):
+                    m = RE_SMP.search(v)
+                    if m:
+                        por_texto = SmpEncontrado(m.group(0), f"texto:{sub}", False)
+        nivel = siguiente
+
+    return por_texto
+
+def find_smp_anywhere(obj) -> str | None:
+    got = extraer_smp(obj)
+    return got.smp if got else None
+
 def pick_caba_direction(norm_json: dict) -> dict | None:
     dns = norm_json.get("direccionesNormalizadas", [])
     if not isinstance(dns, list) or not dns:
@@ -95,39 +148,85 @@ def extract_lat_lng(d: dict) -> tuple[float | None, float | None]:
     return None, None
 
 # ====== API CALLS ======
-def usig_normalizar(address: str) -> dict:
+def _usig_normalizar_remoto(address: str) -> dict:
     url = f"{BASE_USIG_NORM}?direccion={quote(address)}&geocodificar=true&srid=4326"
-    r = requests.get(url, timeout=30)
+    r = http_client.get(url, servicio="usig_normalizar")
     r.raise_for_status()
     return r.json()
 
+def _normalizar_cacheable(data) -> bool:
+    # USIG contesta algunos errores con 200 y {"errorMessage": ...}: no se guardan 7 días
+    return isinstance(data, dict) and bool(data) and "error" not in data and "errorMessage" not in data
+
+def usig_normalizar(address: str) -> dict:
+    """
+    USIG normalizar (geocodificado, srid 4326) con cache por dirección canonizada.
+    """
+    key = cache_local.canonizar_direccion(address)
+    return CACHE_NORMALIZAR.obtener_o_calcular(
+        key, lambda: _usig_normalizar_remoto(address), cacheable=_normalizar_cacheable
+    )
+
+def _parcela_local_por_latlng(lat: float, lng: float, max_dist: float) -> dict | None:
+    """
+    Parcela que contiene el punto (o la más cercana a <= max_dist m) desde el
+    índice espacial + almacén local. None si no se puede contestar localmente.
+    La más cercana sin contener el punto sólo vale si su manzana está cosechada
+    completa: con el almacén a medio llenar, la parcela que de verdad está enfrente
+    puede no estar cargada y la "más cercana" sería la de al lado.
+    """
+    try:
+        res = indice_espacial.parcela_en_latlng(float(lat), float(lng), max_dist=max_dist)
+    except (TypeError, ValueError):
+        return None
+    if res is None:
+        return None
+    smp, distancia = res
+    if distancia > 0 and not almacen_parcelas.manzana_cosechada(smp):
+        return None
+    return almacen_parcelas.parcela(smp)
+
 def catastro_parcela_by_latlng(lat: float, lng: float) -> dict:
+    local = _parcela_local_por_latlng(lat, lng, max_dist=0.0)
+    if local is not None:
+        return local
     url = f"{BASE_CATASTRO}/parcela/"
     params = {"lat": lat, "lng": lng, "ib": "", "ft": ""}
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="epok_parcela_latlng")
     r.raise_for_status()
     return r.json()
 
 def catastroinformal_by_calle_puerta(calle: str, puerta: str) -> dict:
     url = f"{BASE_CATASTROINF}/direccioninformal/?calle={quote(calle)}&puerta={quote(puerta)}"
-    r = requests.get(url, timeout=30)
+    r = http_client.get(url, servicio="epok_catastroinformal")
     r.raise_for_status()
     return r.json()
 
-def catastro_parcela_by_smp(smp: str) -> dict:
+def catastro_parcela_by_smp_remoto(smp: str) -> dict:
     url = f"{BASE_CATASTRO}/parcela/"
     params = {"smp": smp, "ib": "", "ft": ""}
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="epok_parcela")
     r.raise_for_status()
     return r.json()
 
-def catastro_geometria_by_smp(smp: str) -> dict:
+def catastro_geometria_by_smp_remoto(smp: str) -> dict:
     url = f"{BASE_CATASTRO}/geometria/"
     params = {"smp": smp, "srid": SRID_GEOM}
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="epok_geometria")
     r.raise_for_status()
     return r.json()
 
+def catastro_parcela_by_smp(smp: str) -> dict:
+    """
+    Parcela por SMP: del almacén local (cosechar_parcelas.py) si está y no es vieja; si no, EPOK.
+    """
+    local = almacen_parcelas.parcela(smp)
+    return local if local is not None else catastro_parcela_by_smp_remoto(smp)
+
+def catastro_geometria_by_smp(smp: str) -> dict:
+    local = almacen_parcelas.geometria(smp)
+    return local if local is not None else catastro_geometria_by_smp_remoto(smp)
+
 # ====== GEOM (sin shapely) ======
 def polygon_area(coords):
     """
@@ -175,7 +274,166 @@ def geojson_area_m2(geojson: dict) -> float:
     raise ValueError(f"Geometría no soportada: {gt}")
 
 # ====== MAIN ======
-def resolve_smp_from_address(address: str) -> tuple[str | None, dict]:
+# payloads crudos que sólo sirven para debug (son lo más pesado de la respuesta)
+_CLAVES_DEBUG_CRUDO = (
+    "usig_normalizar",
+    "catastro_parcela_por_codcalle_altura",
+    "catastro_parcela_por_latlng_aprox",
+    "catastroinformal",
+)
+
+def _podar_debug(dbg: dict) -> None:
+    for k in _CLAVES_DEBUG_CRUDO:
+        dbg.pop(k, None)
+
+def _estrategias_smp(d: dict) -> list[tuple[str, object]]:
+    """
+    Estrategias para llegar al SMP desde la dirección USIG elegida, en orden de preferencia.
+    Cada una es (nombre, fn) donde fn() devuelve el payload crudo de EPOK.
+    El nombre es también la clave con la que el payload queda en el debug.
+    """
+    estrategias = []
+
+    # 1) MEJOR RUTA: Catastro por codigo_calle + altura
+    codigo_calle = d.get("cod_calle")
+    altura = d.get("altura")
+    if codigo_calle and altura:
+        estrategias.append((
+            "catastro_parcela_por_codcalle_altura",
+            lambda: catastro_parcela_by_codigo_calle_altura(int(codigo_calle), int(altura)),
+        ))
+
+    # 2) RUTA 2: Catastro por lat/lng con aprox
+    lat, lng = extract_lat_lng(d)
+    if lat is not None and lng is not None:
+        estrategias.append((
+            "catastro_parcela_por_latlng_aprox",
+            lambda: catastro_parcela_by_latlng_aprox(lat, lng),
+        ))
+
+    # 3) Fallback: catastroinformal (puede devolver {})
+    calle = d.get("nombre_calle") or d.get("calle")
+    puerta = d.get("altura") or d.get("puerta")
+    if calle and puerta:
+        estrategias.append((
+            "catastroinformal",
+            lambda: catastroinformal_by_calle_puerta(str(calle), str(puerta)),
+        ))
+
+    return estrategias
+
+def _correr_estrategia(nombre: str, fn) -> tuple[str | None, dict, dict]:
+    """
+    Ejecuta una estrategia y devuelve (smp, fragmento_debug, tiempo).
+    """
+    frag = {}
+    t0 = time.perf_counter()
+    smp = None
+    try:
+        payload = fn()
+        frag[nombre] = payload
+        got = extraer_smp(payload)
+        if got:
+            smp = got.smp
+            frag[f"{nombre}_smp_origen"] = got.origen
+        estado = "ok" if smp else "sin_smp"
+    except Exception as e:
+        frag[f"{nombre}_error"] = str(e)
+        estado = "error"
+    tiempo = {"ms": round((time.perf_counter() - t0) * 1000, 1), "estado": estado}
+    return smp, frag, tiempo
+
+def _deadline_vencido(dbg: dict) -> bool:
+    queda = circuito.restante()
+    if queda is not None and queda <= 0:
+        dbg["deadline_excedido"] = True
+        return True
+    return False
+
+def _resolver_secuencial(estrategias, dbg: dict) -> str | None:
+    for nombre, fn in estrategias:
+        if _deadline_vencido(dbg):
+            return None
+        smp, frag, tiempo = _correr_estrategia(nombre, fn)
+        dbg.update(frag)
+        dbg["estrategias_tiempos"][nombre] = tiempo
+        if smp:
+            dbg["estrategia_ganadora"] = nombre
+            return smp
+    return None
+
+def _resolver_en_carrera(estrategias, dbg: dict, hedge_delay: float) -> str | None:
+    """
+    Lanza la estrategia i+1 cuando pasaron `hedge_delay` segundos sin resultado
+    (o apenas falla una de las que están corriendo). Gana el primer SMP válido;
+    las que no arrancaron se cancelan y las que siguen corriendo se descartan.
+    hedge_delay=0 -> todas a la vez.
+    Con deadline de request (circuito.deadline) no se espera más allá de él.
+    """
+    pendientes: dict[Future, tuple[str, float]] = {}
+    siguiente = 0
+    ganador = None
+
+    def lanzar():
+        nonlocal siguiente
+        nombre, fn = estrategias[siguiente]
+        siguiente += 1
+        fut = metricas.submit(_RESOLVER_EXECUTOR, _correr_estrategia, nombre, fn)
+        pendientes[fut] = (nombre, time.perf_counter())
+
+    lanzar()
+    while hedge_delay == 0 and siguiente < len(estrategias):
+        lanzar()
+
+    while pendientes:
+        timeout = hedge_delay if siguiente < len(estrategias) else None
+        queda = circuito.restante()
+        if queda is not None:
+            timeout = max(0.0, queda if timeout is None else min(timeout, queda))
+        done, _ = wait(pendientes, timeout=timeout, return_when=FIRST_COMPLETED)
+
+        for fut in done:
+            nombre, _ = pendientes.pop(fut)
+            smp, frag, tiempo = fut.result()
+            dbg.update(frag)
+            dbg["estrategias_tiempos"][nombre] = tiempo
+            if smp and ganador is None:
+                ganador = smp
+                dbg["estrategia_ganadora"] = nombre
+
+        if ganador or _deadline_vencido(dbg):
+            break
+        if siguiente < len(estrategias):
+            lanzar()
+
+    # perdedoras: las cancelamos (si no arrancaron) y registramos cuánto llevaban
+    for fut, (nombre, t0) in pendientes.items():
+        fut.cancel()
+        dbg["estrategias_tiempos"][nombre] = {
+            "ms": round((time.perf_counter() - t0) * 1000, 1),
+            "estado": "cancelada",
+        }
+
+    return ganador
+
+def resolve_smp_from_address(address: str, hedge_delay: float | None = None,
+                             debug: bool = True, deadline_s: float | None = None) -> tuple[str | None, dict]:
+    """
+    Resuelve el SMP de una dirección.
+    hedge_delay=None -> estrategias en secuencia (cada una sólo si falla la anterior).
+    hedge_delay>=0  -> modo carrera/hedged (ver _resolver_en_carrera).
+    El debug registra "estrategia_ganadora" y "estrategias_tiempos".
+    debug=False -> el debug no guarda los payloads crudos (normalizar / EPOK),
+    sólo los datos chicos que usan los callers (dirección elegida, tiempos, errores).
+    deadline_s -> tope total (todas las llamadas upstream adentro lo respetan); si se
+    agota, devuelve None con "deadline_excedido" en el debug. Se suma al deadline
+    que ya tenga el request (nunca lo extiende).
+    """
+    with circuito.deadline(deadline_s):
+        return _resolve_smp_from_address(address, hedge_delay, debug)
+
+def _resolve_smp_from_address(address: str, hedge_delay: float | None,
+                              debug: bool) -> tuple[str | None, dict]:
     dbg = {"address": address}
 
     norm = usig_normalizar(address)
@@ -184,66 +442,65 @@ def resolve_smp_from_address(address: str) -> tuple[str | None, dict]:
     d = pick_caba_direction(norm)
     dbg["usig_direccion_elegida"] = d
     if not d:
+        if not debug:
+            _podar_debug(dbg)
         return None, dbg
 
     # Datos fuertes desde USIG
-    codigo_calle = d.get("cod_calle")
-    altura = d.get("altura")
-    dbg["usig_cod_calle_altura"] = {"cod_calle": codigo_calle, "altura": altura}
-
-    # 1) MEJOR RUTA: Catastro por codigo_calle + altura
-    if codigo_calle and altura:
-        try:
-            parc = catastro_parcela_by_codigo_calle_altura(int(codigo_calle), int(altura))
-            dbg["catastro_parcela_por_codcalle_altura"] = parc
-            smp = find_smp_anywhere(parc)
-            if smp:
-                return smp, dbg
-        except Exception as e:
-            dbg["catastro_parcela_por_codcalle_altura_error"] = str(e)
-
-    # 2) RUTA 2: Catastro por lat/lng con aprox
+    dbg["usig_cod_calle_altura"] = {"cod_calle": d.get("cod_calle"), "altura": d.get("altura")}
     lat, lng = extract_lat_lng(d)
     dbg["usig_latlng"] = {"lat": lat, "lng": lng}
+    dbg["usig_calle_puerta"] = {
+        "calle": d.get("nombre_calle") or d.get("calle"),
+        "puerta": d.get("altura") or d.get("puerta"),
+    }
 
-    if lat is not None and lng is not None:
-        try:
-            parc = catastro_parcela_by_latlng_aprox(lat, lng)
-            dbg["catastro_parcela_por_latlng_aprox"] = parc
-            smp = find_smp_anywhere(parc)
-            if smp:
-                return smp, dbg
-        except Exception as e:
-            dbg["catastro_parcela_por_latlng_aprox_error"] = str(e)
+    dbg["estrategia_ganadora"] = None
+    dbg["estrategias_tiempos"] = {}
 
-    # 3) Fallback: catastroinformal (puede devolver {})
-    calle = d.get("nombre_calle") or d.get("calle")
-    puerta = d.get("altura") or d.get("puerta")
-    dbg["usig_calle_puerta"] = {"calle": calle, "puerta": puerta}
-
-    if calle and puerta:
+    # 0) Índice aprendido por calle: si ya conocemos esa altura, no vamos a Catastro
+    codigo_calle, altura = d.get("cod_calle"), d.get("altura")
+    if codigo_calle and altura:
         try:
-            catinf = catastroinformal_by_calle_puerta(str(calle), str(puerta))
-            dbg["catastroinformal"] = catinf
-            smp = find_smp_anywhere(catinf)
-            if smp:
-                return smp, dbg
-        except Exception as e:
-            dbg["catastroinformal_error"] = str(e)
+            smp = indice_alturas.smp_para_altura(int(codigo_calle), int(altura))
+        except (TypeError, ValueError):
+            smp = None
+        if smp:
+            dbg["estrategia_ganadora"] = "indice_alturas"
+            if not debug:
+                _podar_debug(dbg)
+            return smp, dbg
+
+    estrategias = _estrategias_smp(d)
+    if hedge_delay is None or len(estrategias) < 2:
+        smp = _resolver_secuencial(estrategias, dbg)
+    else:
+        smp = _resolver_en_carrera(estrategias, dbg, hedge_delay)
+
+    # sólo la ruta cod_calle+altura es exacta para esa altura -> alimenta el índice
+    if smp and dbg["estrategia_ganadora"] == "catastro_parcela_por_codcalle_altura":
+        parc = dbg.get("catastro_parcela_por_codcalle_altura")
+        direccion = parc.get("direccion") if isinstance(parc, dict) else None
+        indice_alturas.registrar(int(codigo_calle), int(altura), smp, direccion)
 
-    return None, dbg
+    if not debug:
+        _podar_debug(dbg)
+    return smp, dbg
 
 def catastro_parcela_by_codigo_calle_altura(codigo_calle: int, altura: int) -> dict:
     url = f"{BASE_CATASTRO}/parcela/"
     params = {"codigo_calle": codigo_calle, "altura": altura, "ib": "", "ft": ""}
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="epok_parcela_codcalle")
     r.raise_for_status()
     return r.json()
 
 def catastro_parcela_by_latlng_aprox(lat: float, lng: float) -> dict:
+    local = _parcela_local_por_latlng(lat, lng, max_dist=APROX_LOCAL_M)
+    if local is not None:
+        return local
     url = f"{BASE_CATASTRO}/parcela/"
     params = {"lat": lat, "lng": lng, "aprox": "", "ib": "", "ft": ""}  # 👈 aprox
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="epok_parcela_latlng_aprox")
     r.raise_for_status()
     return r.json()
 
@@ -312,30 +569,13 @@ def polygon_centroid(ring):
 def geojson_centroid_xy(geojson: dict) -> tuple[float | None, float | None]:
     """
     Toma la geometría de catastro/geometria (GeoJSON en SRID 97433 en tu caso)
-    y retorna un centroide (x,y) aproximado del polígono exterior.
+    y retorna el centroide (x,y) ponderado por área de todas las partes,
+    descontando agujeros (ver geometria.py).
     """
-    t = geojson.get("type")
-    if t == "FeatureCollection":
-        geom = geojson["features"][0]["geometry"]
-    elif t == "Feature":
-        geom = geojson["geometry"]
-    else:
-        geom = geojson
-
-    gt = geom.get("type")
-    coords = geom.get("coordinates")
-
-    if gt == "Polygon":
-        outer_ring = coords[0]
-        return polygon_centroid(outer_ring)
-
-    if gt == "MultiPolygon":
-        # Tomamos el primer polígono como aproximación
-        outer_ring = coords[0][0]
-        return polygon_centroid(outer_ring)
-
-    return None, None
-
+    try:
+        return geometria.centroide(geojson)
+    except ValueError:
+        return None, None
 
 if __name__ == "__main__":
     test_by_address("Davila 1130, CABA")
\ No newline at end of file
@@ -2,7 +2,8 @@
 from __future__ import annotations
 
 from urllib.parse import quote
-import requests
+
+import http_client
 
 BASE_USIG_DATOS_UTILES = "https://datosabiertos-usig-apis.buenosaires.gob.ar/datos_utiles"
 BASE_USIG_GEOCODER_22 = "https://ws.usig.buenosaires.gob.ar/geocoder/2.2"
@@ -17,7 +18,7 @@ def usig_datos_utiles_por_xy(x: float, y: float) -> dict:
     distrito escolar, etc. a partir de un punto (x,y).
     """
     params = {"x": x, "y": y}
-    r = requests.get(BASE_USIG_DATOS_UTILES, params=params, timeout=30)
+    r = http_client.get(BASE_USIG_DATOS_UTILES, params=params, servicio="usig_datos_utiles")
     r.raise_for_status()
     return r.json()
 
@@ -26,7 +27,7 @@ def usig_datos_utiles_por_direccion(calle: str, altura: int) -> dict:
     Alternativa sin (x,y): datos útiles por calle/altura.
     """
     params = {"calle": calle, "altura": altura}
-    r = requests.get(BASE_USIG_DATOS_UTILES, params=params, timeout=30)
+    r = http_client.get(BASE_USIG_DATOS_UTILES, params=params, servicio="usig_datos_utiles")
     r.raise_for_status()
     return r.json()
 
@@ -38,6 +39,6 @@ def usig_geocoder_reverse(lat: float, lon: float) -> dict:
     # Lo dejamos como placeholder realista.
     url = f"{BASE_USIG_GEOCODER_22}/reversegeocoding/"
     params = {"lat": lat, "lon": lon}
-    r = requests.get(url, params=params, timeout=30)
+    r = http_client.get(url, params=params, servicio="usig_geocoder")
     r.raise_for_status()
     return r.json()
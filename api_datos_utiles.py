@@ -1,7 +1,109 @@
 import requests
 import json
 
-def consultar_datos_utiles(calle: str, altura: int) -> dict:
+import cache_local
+import http_client
+
+# Datos útiles (barrio, comuna, comisaría, área hospitalaria, distrito escolar...)
+# son los mismos para todas las parcelas de una manzana: se cachean por
+# sección-manzana del SMP. Los que dependen del frente (la cuadra y vereda sobre
+# la que está la dirección) van aparte, por calle / cuadra / paridad. Sin SMP, o si
+# falta alguna de las dos partes, por calle/altura y si no USIG.
+CACHE_MANZANA = cache_local.CacheTTL("datos_utiles_manzana", ttl_s=30 * 24 * 3600, max_items=50_000)
+CACHE_FRENTE = cache_local.CacheTTL("datos_utiles_frente", ttl_s=30 * 24 * 3600, max_items=50_000)
+CACHE_DIRECCION = cache_local.CacheTTL("datos_utiles_direccion", ttl_s=7 * 24 * 3600)
+
+# campos que dependen del frente, no de la manzana: una manzana tiene cuatro frentes
+# con CP / CPA propios, y la zonificación frentista de avenida no es la de la calle de atrás
+CAMPOS_POR_FRENTE = frozenset({"codigo_postal", "codigo_postal_argentino", "codigo_de_planeamiento_urbano"})
+
+
+def clave_manzana(smp: str) -> str | None:
+    """
+    '044-097A-029' -> '044-097A' (también acepta la manzana sola: '044-097A')
+    """
+    partes = (smp or "").strip().upper().split("-")
+    if len(partes) not in (2, 3) or not all(partes[:2]):
+        return None
+    return f"{partes[0]}-{partes[1]}"
+
+
+def clave_frente(calle: str, altura: int) -> str:
+    """
+    ('Dávila', 1130) -> 'davila|11|0': calle, cuadra y vereda (paridad).
+    """
+    altura = int(altura)
+    return f"{cache_local.canonizar_direccion(calle)}|{altura // 100}|{altura % 2}"
+
+
+def _cacheable(data) -> bool:
+    return isinstance(data, dict) and bool(data) and "error" not in data
+
+
+def datos_utiles_de_smp(smp: str) -> dict | None:
+    """
+    Datos útiles ya cacheados para la manzana del SMP (sin ir a la red), o None.
+    Sin los CAMPOS_POR_FRENTE: para una respuesta completa, datos_utiles_cacheados.
+    """
+    clave = clave_manzana(smp)
+    return None if clave is None else CACHE_MANZANA.get(clave)
+
+
+def datos_utiles_cacheados(calle: str, altura: int, smp: str | None = None) -> dict | None:
+    """
+    Respuesta completa sin ir a la red (manzana + frente, o la de calle/altura), o None.
+    """
+    if smp:
+        manzana = datos_utiles_de_smp(smp)
+        if manzana is not None:
+            frente = CACHE_FRENTE.get(clave_frente(calle, altura))
+            if frente is not None:
+                return {**manzana, **frente}
+    return CACHE_DIRECCION.get(f"{cache_local.canonizar_direccion(calle)}|{int(altura)}")
+
+
+def frente_cacheado(calle: str, altura: int) -> bool:
+    return CACHE_FRENTE.get(clave_frente(calle, altura), contar=False) is not None
+
+
+def guardar_respuesta(calle: str, altura: int, smp: str | None, data: dict) -> bool:
+    """
+    Una respuesta de USIG por calle/altura alimenta los tres caches (la manzana sólo con smp).
+    False si no era cacheable (error, vacía).
+    """
+    if not _cacheable(data):
+        return False
+    CACHE_DIRECCION.set(f"{cache_local.canonizar_direccion(calle)}|{int(altura)}", data)
+    CACHE_FRENTE.set(clave_frente(calle, altura), {k: v for k, v in data.items() if k in CAMPOS_POR_FRENTE})
+    if smp:
+        guardar_de_manzana(smp, data)
+    return True
+
+
+def guardar_de_manzana(smp: str, data: dict) -> None:
+    """
+    smp: el de cualquier parcela de la manzana, o la manzana sola ('044-097A').
+    """
+    clave = clave_manzana(smp)
+    if clave and _cacheable(data):
+        CACHE_MANZANA.set(clave, {k: v for k, v in data.items() if k not in CAMPOS_POR_FRENTE})
+
+
+def consultar_datos_utiles(calle: str, altura: int, smp: str | None = None) -> dict:
+    """
+    Primero los caches (manzana del smp + frente, o calle/altura) y recién ahí USIG;
+    la respuesta buena alimenta los tres.
+    """
+    data = datos_utiles_cacheados(calle, altura, smp)
+    if data is not None:
+        return data
+
+    data = _consultar_datos_utiles_remoto(calle, altura)
+    guardar_respuesta(calle, altura, smp, data)
+    return data
+
+
+def _consultar_datos_utiles_remoto(calle: str, altura: int) -> dict:
 
     url = "https://datosabiertos-usig-apis.buenosaires.gob.ar/datos_utiles"
 
@@ -15,7 +117,7 @@ def consultar_datos_utiles(calle: str, altura: int) -> dict:
     }
 
     try:
-        r = requests.get(url, params=params, headers=headers, timeout=15)
+        r = http_client.get(url, params=params, headers=headers, servicio="usig_datos_utiles")
 
         try:
             return r.json()
@@ -26,4 +128,4 @@ def consultar_datos_utiles(calle: str, altura: int) -> dict:
         return {
             "error": "Error de conexión con la API",
             "detalle": str(e)
-        }
\ No newline at end of file
+        }
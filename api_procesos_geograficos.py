@@ -1,6 +1,8 @@
 # api_procesos_geograficos.py
 from __future__ import annotations
-import requests
+
+import http_client
+import proyeccion_gkba
 
 BASE_CONVERTIR = "https://ws.usig.buenosaires.gob.ar/rest/convertir_coordenadas"
 
@@ -13,7 +15,7 @@ def convertir_coordenadas(x: float, y: float, output: str) -> dict:
     Devuelve dict con {"tipo_resultado": "...", "resultado": {"x": "...", "y": "..."}}
     """
     params = {"x": x, "y": y, "output": output}
-    r = requests.get(BASE_CONVERTIR, params=params, timeout=30)
+    r = http_client.get(BASE_CONVERTIR, params=params, servicio="usig_convertir_coordenadas")
     r.raise_for_status()
     data = r.json()
 
@@ -22,14 +24,37 @@ def convertir_coordenadas(x: float, y: float, output: str) -> dict:
 
     return data
 
-def gkba_a_lonlat(x: float, y: float) -> tuple[float, float]:
+def gkba_a_lonlat_remoto(x: float, y: float) -> tuple[float, float]:
     data = convertir_coordenadas(x, y, output="lonlat")
     rx = float(data["resultado"]["x"])  # lon
     ry = float(data["resultado"]["y"])  # lat
     return rx, ry
 
-def lonlat_a_gkba(lon: float, lat: float) -> tuple[float, float]:
+def lonlat_a_gkba_remoto(lon: float, lat: float) -> tuple[float, float]:
     data = convertir_coordenadas(lon, lat, output="gkba")
     rx = float(data["resultado"]["x"])
     ry = float(data["resultado"]["y"])
-    return rx, ry
\ No newline at end of file
+    return rx, ry
+
+# Conversión local (sin red). El servicio USIG queda sólo como verificación.
+def gkba_a_lonlat(x: float, y: float) -> tuple[float, float]:
+    return proyeccion_gkba.gkba_a_lonlat(float(x), float(y))
+
+def lonlat_a_gkba(lon: float, lat: float) -> tuple[float, float]:
+    return proyeccion_gkba.lonlat_a_gkba(float(lon), float(lat))
+
+gkba_a_lonlat_lote = proyeccion_gkba.gkba_a_lonlat_lote
+lonlat_a_gkba_lote = proyeccion_gkba.lonlat_a_gkba_lote
+
+def verificar_contra_usig(x: float, y: float) -> dict:
+    """
+    Compara la conversión local GKBA -> lon/lat contra convertir_coordenadas de USIG.
+    Devuelve ambos resultados y la diferencia en grados.
+    """
+    lon, lat = gkba_a_lonlat(x, y)
+    rlon, rlat = gkba_a_lonlat_remoto(x, y)
+    return {
+        "local": {"lon": lon, "lat": lat},
+        "usig": {"lon": rlon, "lat": rlat},
+        "diferencia": {"lon": abs(lon - rlon), "lat": abs(lat - rlat)},
+    }
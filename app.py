@@ -1,20 +1,34 @@
 # app.py
 from __future__ import annotations
 
-from flask import Flask, jsonify, request, send_from_directory
-import requests
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, TimeoutError as FutureTimeout, wait
 
+import requests
+from flask import Flask, Response, g, jsonify, request, send_from_directory, stream_with_context
+
+import archivo_upstream
+import cache_local
+import cache_parcelas
+import circuito
+import geometria
+import http_client
+import indice_alturas
+import indice_espacial
+import json_rapido
+import metricas
+import precalentar
 import api_datos_catastrales as adc
-from api_datos_utiles import consultar_datos_utiles
-
-# Módulo nuevo (Procesos Geográficos USIG)
-import api_procesos_geograficos as pg
+from api_datos_utiles import consultar_datos_utiles, datos_utiles_cacheados
 
 # ✅ Autocomplete calles CABA
 import api_buscador_caba as abc
 
 
 app = Flask(__name__)
+app.json = json_rapido.JSONProviderRapido(app)
 
 
 # =========================
@@ -22,6 +36,19 @@ app = Flask(__name__)
 # =========================
 EPOK_BASE = "https://epok.buenosaires.gob.ar/catastro"
 
+# Probing de alturas: cuántas consultas EPOK en vuelo por lote
+PROBE_CONCURRENCIA = 8
+# Alturas que Catastro ya contestó como "sin parcela": no se vuelven a probar por un rato
+ALTURAS_INVALIDAS_TTL_S = 6 * 3600
+
+_PROBE_EXECUTOR = ThreadPoolExecutor(max_workers=32, thread_name_prefix="probe_alturas")
+_alturas_invalidas: dict[tuple[int, int], float] = {}
+_alturas_invalidas_lock = threading.Lock()
+_EPOK_PARCELA_URLS = (f"{EPOK_BASE}/parcela", f"{EPOK_BASE}/parcela/")
+# variante de URL de /parcela que contestó la última vez (se prueba primero).
+# Se reasigna entera, nunca se modifica: la leen y escriben los hilos del probing.
+_epok_parcela_url_preferida = _EPOK_PARCELA_URLS[0]
+
 
 def _is_parcela_valida(obj: dict) -> bool:
     if not isinstance(obj, dict) or not obj:
@@ -30,12 +57,14 @@ def _is_parcela_valida(obj: dict) -> bool:
     return bool(obj.get("smp") or obj.get("codigo") or obj.get("direccion") or obj.get("manzana"))
 
 
-def _catastro_parcela_por_codcalle_altura(cod_calle: int, altura: int) -> dict:
+def _catastro_parcela_por_codcalle_altura(cod_calle: int, altura: int) -> dict | None:
     """
     Intenta obtener parcela de Catastro por cod_calle + altura.
     Primero intenta usando funciones del módulo adc si existieran,
-    y si no, cae a requests directo a EPOK.
+    y si no, cae a HTTP directo a EPOK (cliente compartido).
+    Devuelve None si ninguna variante pudo contestar (error de red / no-200).
     """
+    global _epok_parcela_url_preferida
     # 1) Si tu api_datos_catastrales.py ya tiene una función, úsala.
     for fname in ("catastro_parcela_by_codcalle_altura", "catastro_parcela_por_codcalle_altura"):
         fn = getattr(adc, fname, None)
@@ -48,17 +77,102 @@ def _catastro_parcela_por_codcalle_altura(cod_calle: int, altura: int) -> dict:
     # 2) Fallback HTTP directo (robusto a variantes de endpoint)
     params = {"cod_calle": int(cod_calle), "altura": int(altura)}
 
-    # Probamos 2 variantes comunes: /parcela y /parcela/
-    for url in (f"{EPOK_BASE}/parcela", f"{EPOK_BASE}/parcela/"):
+    # Probamos 2 variantes comunes: /parcela y /parcela/ (primero la que anduvo antes)
+    preferida = _epok_parcela_url_preferida
+    for url in (preferida, *(u for u in _EPOK_PARCELA_URLS if u != preferida)):
         try:
-            r = requests.get(url, params=params, timeout=10)
+            r = http_client.get(url, params=params, timeout=(3.05, 10), servicio="epok_parcela_codcalle")
             if r.status_code == 200:
                 data = r.json()
+                _epok_parcela_url_preferida = url
                 return data if isinstance(data, dict) else {}
         except Exception:
             continue
 
-    return {}
+    return None
+
+
+def _parcela_por_smp(smp: str) -> dict | None:
+    """
+    Parcela por SMP (almacén local o EPOK), o None si no hay una válida.
+    """
+    try:
+        parcela = adc.catastro_parcela_by_smp(smp)
+    except requests.exceptions.RequestException:
+        return None
+    return parcela if _is_parcela_valida(parcela) else None
+
+
+def _altura_invalida_conocida(cod_calle: int, altura: int) -> bool:
+    with _alturas_invalidas_lock:
+        ts = _alturas_invalidas.get((cod_calle, altura))
+        if ts is None:
+            return False
+        if time.monotonic() - ts > ALTURAS_INVALIDAS_TTL_S:
+            del _alturas_invalidas[(cod_calle, altura)]
+            return False
+        return True
+
+
+def _marcar_altura_invalida(cod_calle: int, altura: int) -> None:
+    with _alturas_invalidas_lock:
+        _alturas_invalidas[(cod_calle, altura)] = time.monotonic()
+
+
+def _alturas_radiales(altura: int, max_delta: int, paso: int) -> list[int]:
+    """
+    Orden radial: altura, -paso, +paso, -2*paso, +2*paso, ... (sólo alturas > 0).
+    Con paso=2 nos quedamos en la misma vereda (misma paridad).
+    """
+    out = [altura] if altura > 0 else []
+    for delta in range(paso, max_delta + 1, paso):
+        for alt in (altura - delta, altura + delta):
+            if alt > 0:
+                out.append(alt)
+    return out
+
+
+def _probar_alturas(cod_calle: int, nombre_calle: str, alturas: list[int],
+                    limit: int, concurrencia: int) -> list[dict]:
+    """
+    Motor de probing: consulta EPOK en lotes de `concurrencia` alturas (en orden radial)
+    y corta apenas junta `limit` parcelas. Saltea alturas inválidas ya conocidas.
+    """
+    encontrados: list[dict] = []
+    pendientes = [alt for alt in alturas if not _altura_invalida_conocida(cod_calle, alt)]
+
+    for i in range(0, len(pendientes), concurrencia):
+        lote = pendientes[i:i + concurrencia]
+        futuros = [
+            metricas.submit(_PROBE_EXECUTOR, _catastro_parcela_por_codcalle_altura, cod_calle, alt)
+            for alt in lote
+        ]
+        parcelas = (f.result() for f in futuros)
+
+        # respetamos el orden radial dentro del lote
+        for alt, parcela in zip(lote, parcelas):
+            if parcela is None:
+                continue  # error de red: no sabemos, no la marcamos
+            if not _is_parcela_valida(parcela):
+                _marcar_altura_invalida(cod_calle, alt)
+                continue
+
+            # armamos una sugerencia clara para UI
+            direccion = (parcela.get("direccion") or f"{nombre_calle} {alt}").strip()
+            smp = parcela.get("smp") or parcela.get("codigo") or None
+            encontrados.append(
+                {
+                    "altura": alt,
+                    "direccion": f"{direccion}, CABA",
+                    "smp": smp,
+                    "parcela": parcela,
+                }
+            )
+
+        if len(encontrados) >= limit:
+            return encontrados[:limit]
+
+    return encontrados
 
 
 def sugerir_alturas_validas_cercanas(
@@ -67,52 +181,316 @@ def sugerir_alturas_validas_cercanas(
     altura_ingresada: int,
     limit: int = 6,
     max_delta: int = 120,
+    concurrencia: int = PROBE_CONCURRENCIA,
+    misma_vereda: bool = True,
 ) -> list[dict]:
     """
     Busca alturas "válidas" cercanas probando hacia arriba/abajo
     hasta encontrar 'limit' parcelas reales en Catastro.
-    Estrategia MVP: probing radial (±1, ±2, ±3...) para evitar scans grandes.
+    Probing radial en lotes concurrentes; con misma_vereda=True sólo prueba alturas
+    de la misma paridad (misma vereda) y, si esa vereda no da nada, la de enfrente.
     """
     cod_calle = int(cod_calle)
     altura_ingresada = int(altura_ingresada)
 
-    encontrados: list[dict] = []
-    vistos = set()
-
-    # probamos primero la misma altura (por si justo)
-    for delta in range(0, max_delta + 1):
-        # orden: 0, -1, +1, -2, +2, ...
-        candidatos = []
-        if delta == 0:
-            candidatos = [altura_ingresada]
-        else:
-            candidatos = [altura_ingresada - delta, altura_ingresada + delta]
+    # 0) Si el índice aprendido ya conoce 'limit' alturas válidas cerca, no probamos alturas:
+    #    sólo se piden sus parcelas por SMP (almacén local primero), para devolver lo mismo
+    #    que el probing. Si alguna no se consigue, se prueba como siempre.
+    conocidas = indice_alturas.alturas_cercanas(
+        cod_calle, altura_ingresada, limit=limit, max_delta=max_delta, misma_vereda=misma_vereda
+    )
+    if len(conocidas) >= limit:
+        futuros = [metricas.submit(_PROBE_EXECUTOR, _parcela_por_smp, it["smp"]) for it in conocidas]
+        parcelas = [f.result() for f in futuros]
+        if all(p is not None for p in parcelas):
+            sugerencias = []
+            for it, parcela in zip(conocidas, parcelas):
+                direccion = (parcela.get("direccion") or it["direccion"] or f"{nombre_calle} {it['altura']}").strip()
+                sugerencias.append(
+                    {"altura": it["altura"], "direccion": f"{direccion}, CABA", "smp": it["smp"], "parcela": parcela}
+                )
+            return sugerencias
+
+    paso = 2 if misma_vereda else 1
+    alturas = _alturas_radiales(altura_ingresada, max_delta, paso)
+    encontrados = _probar_alturas(cod_calle, nombre_calle, alturas, limit, concurrencia)
+
+    if misma_vereda and not encontrados:
+        enfrente = _alturas_radiales(altura_ingresada + 1, max_delta, 2)
+        enfrente = sorted(enfrente, key=lambda alt: abs(alt - altura_ingresada))
+        encontrados = _probar_alturas(cod_calle, nombre_calle, enfrente, limit, concurrencia)
+
+    indice_alturas.registrar_varios(
+        cod_calle,
+        [
+            {"altura": it["altura"], "smp": it["smp"], "direccion": it["parcela"].get("direccion")}
+            for it in encontrados
+        ],
+    )
+    return encontrados
 
-        for alt in candidatos:
-            if alt <= 0:
-                continue
-            if alt in vistos:
-                continue
-            vistos.add(alt)
-
-            parcela = _catastro_parcela_por_codcalle_altura(cod_calle, alt)
-            if _is_parcela_valida(parcela):
-                # armamos una sugerencia clara para UI
-                direccion = (parcela.get("direccion") or f"{nombre_calle} {alt}").strip()
-                smp = parcela.get("smp") or parcela.get("codigo") or None
-                encontrados.append(
-                    {
-                        "altura": alt,
-                        "direccion": f"{direccion}, CABA",
-                        "smp": smp,
-                        "parcela": parcela,
-                    }
+
+# =========================
+# Helpers (pipeline por SMP)
+# =========================
+# Pool para el fan-out de /api/catastro (llamadas I/O a EPOK/USIG).
+_EXECUTOR = ThreadPoolExecutor(max_workers=16, thread_name_prefix="catastro")
+
+# /api/catastro/batch: direcciones en vuelo por request (default / máximo)
+BATCH_CONCURRENCIA = 8
+BATCH_CONCURRENCIA_MAX = 32
+BATCH_MAX_DIRECCIONES = 10_000
+# /api/parcelas/por_punto: máximo de puntos por request
+REVERSO_MAX_PUNTOS = 50_000
+
+# geometría "display": tolerancia Douglas–Peucker (m) y decimales (97433: 2 = cm)
+GEOM_DISPLAY_TOLERANCIA_M = 0.5
+GEOM_DISPLAY_DECIMALES = 2
+
+# fracción de requests que devuelven "debug" sin pedirlo (0 = sólo opt-in)
+DEBUG_MUESTREO = 0.0
+# tope total por dirección (resolver SMP + fan-out): ningún upstream lento lo estira
+REQUEST_DEADLINE_S = 12.0
+# pool propio: cada dirección a su vez usa _EXECUTOR para el fan-out
+_BATCH_EXECUTOR = ThreadPoolExecutor(max_workers=BATCH_CONCURRENCIA_MAX, thread_name_prefix="catastro_batch")
+
+
+def _geometria_y_centroides(smp: str, remoto: bool = False) -> dict:
+    """
+    Geometría por SMP y todo lo que depende de ella, encadenado en un solo hilo:
+    área m², centroide XY (SRID 97433) y centroide lon/lat (GKBA local).
+    Los errores no fatales vuelven en "errores" para sumarse al debug.
+    remoto=True -> directo a EPOK (sin almacén local).
+    """
+    if remoto:
+        geometria = adc.catastro_geometria_by_smp_remoto(smp)
+    else:
+        geometria = adc.catastro_geometria_by_smp(smp)
+    derivados, errores = cache_parcelas.derivados(geometria)
+    return {"geometria": geometria, **derivados, "errores": errores}
+
+
+def _opciones_geometria(payload: dict) -> dict | None:
+    """
+    Lee del body cómo devolver la geometría:
+      "geometria": "exacta" (default) | "display"
+      "tolerancia_m", "decimales", "codificacion": "geojson" | "delta"  (sólo display)
+    Devuelve None para la exacta.
+    """
+    if str(payload.get("geometria") or "exacta").strip().lower() != "display":
+        return None
+    try:
+        tolerancia = float(payload.get("tolerancia_m", GEOM_DISPLAY_TOLERANCIA_M))
+        decimales = int(payload.get("decimales", GEOM_DISPLAY_DECIMALES))
+    except (TypeError, ValueError):
+        tolerancia, decimales = GEOM_DISPLAY_TOLERANCIA_M, GEOM_DISPLAY_DECIMALES
+    codificacion = "delta" if str(payload.get("codificacion") or "").lower() == "delta" else "geojson"
+    return {
+        "tolerancia": max(0.0, tolerancia),
+        "decimales": max(0, min(decimales, 6)),
+        "codificacion": codificacion,
+    }
+
+
+def _pedir_debug(payload: dict) -> bool:
+    """
+    Debug opt-in: "debug": true en el body o ?debug=1; si no, muestreo DEBUG_MUESTREO.
+    """
+    pedido = payload.get("debug", request.args.get("debug"))
+    if pedido is not None:
+        return str(pedido).strip().lower() in ("1", "true", "si", "sí", "yes")
+    return DEBUG_MUESTREO > 0 and random.random() < DEBUG_MUESTREO
+
+
+def consultar_catastro(address: str, opciones_geometria: dict | None = None,
+                       debug: bool = False, refrescar: bool = False) -> tuple[dict, int]:
+    """
+    Pipeline completo de /api/catastro para una dirección.
+    opciones_geometria: ver _opciones_geometria (None = geometría exacta).
+    debug=False -> respuesta liviana, sin "debug" ni payloads crudos de USIG/EPOK.
+    refrescar=True -> parcela y geometría directo de EPOK, salteando cache_parcelas.
+    Todo corre bajo un deadline de REQUEST_DEADLINE_S (circuito.deadline).
+    Devuelve (respuesta, status_http).
+    """
+    with circuito.deadline(REQUEST_DEADLINE_S):
+        data, status = _consultar_catastro(address, opciones_geometria, debug, refrescar)
+    if not debug:
+        data.pop("debug", None)
+    return data, status
+
+
+def _consultar_catastro(address: str, opciones_geometria: dict | None, debug: bool,
+                        refrescar: bool = False) -> tuple[dict, int]:
+    dbg: dict = {"address": address}
+
+    try:
+        # 1) Resolver SMP (y traer debug con dirección elegida USIG)
+        smp, resolver_dbg = adc.resolve_smp_from_address(
+            address, hedge_delay=adc.HEDGE_DELAY_S, debug=debug
+        )
+        if isinstance(resolver_dbg, dict):
+            dbg.update(resolver_dbg)
+
+        # --- Si no hay SMP: ofrecer alturas válidas cercanas (MVP)
+        if not smp:
+            # Tomamos info USIG (si existe) para entender calle/cod_calle/altura
+            d = (dbg.get("usig_direccion_elegida") or {})
+            cod = (dbg.get("usig_cod_calle_altura") or {}).get("cod_calle") or d.get("cod_calle")
+            altura = (dbg.get("usig_cod_calle_altura") or {}).get("altura") or d.get("altura")
+            calle = d.get("nombre_calle") or d.get("calle") or (dbg.get("usig_calle_puerta") or {}).get("calle")
+
+            alternativas = []
+            try:
+                if cod and altura and calle:
+                    alternativas = sugerir_alturas_validas_cercanas(
+                        cod_calle=int(cod),
+                        nombre_calle=str(calle),
+                        altura_ingresada=int(altura),
+                        limit=6,
+                        max_delta=140,
+                    )
+            except Exception as e:
+                dbg["alturas_cercanas_error"] = str(e)
+
+            return (
+                {
+                    "ok": False,
+                    "error": "No se encontró parcela para esa altura (dirección sin SMP).",
+                    "alternativas_altura": alternativas,  # ✅ lo usa el front para sugerir
+                    "debug": dbg,
+                },
+                404,
+            )
+
+        # 2) Fan-out por SMP: parcela, geometría (+ área/centroides) y datos útiles
+        #    en paralelo. La conversión a lon/lat arranca apenas llega la geometría.
+        #    Parcela + geometría + derivados salen de cache_parcelas si están
+        #    (aunque estén vencidas: se refrescan en background).
+        d = (dbg.get("usig_direccion_elegida") or {})
+        calle = d.get("nombre_calle") or d.get("calle")
+        altura = d.get("altura") or d.get("puerta")
+
+        cacheada = None if refrescar else cache_parcelas.leer(smp)
+        fut_parcela = fut_geo = None
+        if cacheada is not None:
+            dbg["parcela_origen"] = "cache_vencida" if cacheada["vencida"] else "cache"
+            dbg["parcela_cache_edad_s"] = cacheada["edad_s"]
+        else:
+            fn_parcela = adc.catastro_parcela_by_smp_remoto if refrescar else adc.catastro_parcela_by_smp
+            fut_parcela = metricas.submit(_EXECUTOR, fn_parcela, smp)
+            fut_geo = metricas.submit(_EXECUTOR, _geometria_y_centroides, smp, refrescar)
+        fut_datos_utiles = None
+        datos_utiles = None
+        try:
+            # la manzana del SMP y el frente ya tienen datos útiles cacheados: ni pool ni red
+            if calle and altura:
+                datos_utiles = datos_utiles_cacheados(str(calle), int(altura), smp)
+            if datos_utiles is not None:
+                dbg["datos_utiles_origen"] = "cache"
+            elif calle and altura and not circuito.disponible("usig_datos_utiles"):
+                # opcional: con el servicio caído no lo esperamos
+                dbg["datos_utiles_omitido"] = "circuito_abierto"
+            elif calle and altura:
+                fut_datos_utiles = metricas.submit(
+                    _EXECUTOR, consultar_datos_utiles, str(calle), int(altura), smp
                 )
+        except Exception as e:
+            dbg["datos_utiles_error"] = str(e)
 
-                if len(encontrados) >= limit:
-                    return encontrados
+        if cacheada is not None:
+            geo = cacheada
+        else:
+            geo = fut_geo.result()
+            dbg.update(geo["errores"])
 
-    return encontrados
+        # 6) Datos Útiles (por manzana o calle/altura): sólo lo que quede del deadline
+        if fut_datos_utiles is not None:
+            queda = circuito.restante()
+            try:
+                datos_utiles = fut_datos_utiles.result(timeout=None if queda is None else max(0.0, queda))
+            except FutureTimeout:
+                dbg["datos_utiles_omitido"] = "deadline"
+            except Exception as e:
+                dbg["datos_utiles_error"] = str(e)
+
+        if cacheada is not None:
+            parcela = cacheada["parcela"]
+        else:
+            parcela = fut_parcela.result()
+            if not geo["errores"]:
+                derivados = {k: geo[k] for k in ("area_m2", "centroide_xy", "centroide_lonlat")}
+                cache_parcelas.guardar(smp, parcela, geo["geometria"], derivados)
+
+        # 7) Geometría de salida: exacta o "display" (el área ya salió de la exacta)
+        geometria_salida = geo["geometria"]
+        if opciones_geometria is not None:
+            try:
+                geometria_salida = geometria.para_display(geo["geometria"], **opciones_geometria)
+            except Exception as e:
+                dbg["geometria_display_error"] = str(e)
+
+        return (
+            {
+                "ok": True,
+                "input": address,
+                "smp": smp,
+                "parcela": parcela,
+                "geometria": geometria_salida,
+                "area_m2": geo["area_m2"],
+                "centroide_xy": geo["centroide_xy"],
+                "centroide_lonlat": geo["centroide_lonlat"],
+                "datos_utiles": datos_utiles,
+                "debug": dbg,
+            },
+            200,
+        )
+
+    except circuito.CircuitoAbierto as e:
+        # upstream obligatorio caído: mejor un 503 rápido que colgar el worker
+        return {"ok": False, "error": str(e), "debug": dbg}, 503
+    except requests.exceptions.Timeout as e:
+        # incluye circuito.DeadlineExcedido
+        return {"ok": False, "error": str(e), "debug": dbg}, 504
+    except Exception as e:
+        return {"ok": False, "error": str(e), "debug": dbg}, 500
+
+
+def _linea_ndjson(obj: dict) -> str:
+    return json_rapido.dumps(obj) + "\n"
+
+
+def _stream_batch(grupos: list[tuple[str, list[int]]], invalidas: list[int], concurrencia: int,
+                  opciones_geometria: dict | None = None, debug: bool = False):
+    """
+    Generador NDJSON: ventana deslizante de `concurrencia` direcciones en vuelo,
+    cada resultado se emite apenas termina (sin esperar al resto).
+    """
+    for i in invalidas:
+        yield _linea_ndjson({"indices": [i], "direccion": None, "status": 400,
+                             "ok": False, "error": "Dirección vacía o inválida"})
+
+    pendientes: dict = {}
+    siguiente = 0
+    try:
+        while siguiente < len(grupos) or pendientes:
+            while siguiente < len(grupos) and len(pendientes) < concurrencia:
+                direccion, indices = grupos[siguiente]
+                siguiente += 1
+                fut = metricas.submit(_BATCH_EXECUTOR, consultar_catastro, direccion, opciones_geometria, debug)
+                pendientes[fut] = (direccion, indices)
+
+            done, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+            for fut in done:
+                direccion, indices = pendientes.pop(fut)
+                try:
+                    data, status = fut.result()
+                except Exception as e:
+                    data, status = {"ok": False, "error": str(e)}, 500
+                yield _linea_ndjson({"indices": indices, "direccion": direccion, "status": status, **data})
+    finally:
+        # si el cliente corta la conexión, no seguimos consultando
+        for fut in pendientes:
+            fut.cancel()
 
 
 # =========================
@@ -135,6 +513,77 @@ def health():
     return jsonify({"ok": True})
 
 
+@app.before_request
+def _iniciar_metricas():
+    g.t0_request = time.perf_counter()
+    metricas.iniciar_request()
+
+
+@app.after_request
+def _cerrar_metricas(response):
+    t0 = getattr(g, "t0_request", None)
+    if t0 is None:
+        return response
+    endpoint = request.url_rule.rule if request.url_rule else "sin_ruta"
+    if response.is_streamed:
+        # el body (NDJSON de /api/catastro/batch) se genera después de este hook:
+        # un Server-Timing acá saldría vacío o parcial, así que no va; la latencia
+        # se registra recién cuando se terminó de mandar
+        status = response.status_code
+        response.call_on_close(lambda: metricas.registrar_http(endpoint, time.perf_counter() - t0, status))
+        return response
+    total = time.perf_counter() - t0
+    response.headers["Server-Timing"] = metricas.server_timing(total)
+    metricas.registrar_http(endpoint, total, response.status_code)
+    return response
+
+
+@app.get("/metrics")
+def metrics():
+    """
+    Métricas en formato Prometheus: latencia/errores por upstream y por endpoint,
+    y hit rate de los caches, y estado de los circuit breakers.
+    """
+    return Response(metricas.prometheus() + circuito.prometheus(), mimetype="text/plain; version=0.0.4")
+
+
+@app.get("/circuitos")
+def circuitos():
+    """
+    Estado del circuit breaker de cada upstream (cerrado / abierto / semiabierto).
+    """
+    return jsonify(circuito.estadisticas())
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Hits/misses por cache (memoria / disco), origen de las consultas del autocomplete
+    y frescas / vencidas / refrescos de cache_parcelas.
+    """
+    return jsonify({
+        **cache_local.estadisticas(),
+        "autocomplete": abc.estadisticas(),
+        "parcelas_swr": cache_parcelas.estadisticas(),
+    })
+
+
+@app.get("/precalentar/estado")
+def precalentar_estado():
+    """
+    Progreso de la última pasada de precalentamiento y cobertura de las claves calientes.
+    """
+    return jsonify(precalentar.estado())
+
+
+@app.get("/archivo/stats")
+def archivo_stats():
+    """
+    Modo del archivo de tráfico upstream (grabar / respaldo / reproducir) y su tamaño.
+    """
+    return jsonify(archivo_upstream.estadisticas())
+
+
 @app.get("/autocomplete/calles")
 def autocomplete_calles():
     """
@@ -157,6 +606,10 @@ def api_catastro():
     """
     Body JSON esperado:
       { "direccion": "Davila 1130, CABA" }
+    Opcional (geometría liviana para mostrar, ver _opciones_geometria):
+      { ..., "geometria": "display", "tolerancia_m": 0.5, "decimales": 2, "codificacion": "delta" }
+    Debug (payloads crudos USIG/EPOK) sólo si se pide: { ..., "debug": true } o ?debug=1
+    Parcela/geometría salen de cache_parcelas; { ..., "refrescar": true } las pide de nuevo a EPOK.
 
     ✅ MVP extra:
       - si la dirección está bien normalizada pero NO existe parcela (sin SMP),
@@ -168,101 +621,85 @@ def api_catastro():
     if not address:
         return jsonify({"ok": False, "error": "Falta 'direccion'"}), 400
 
-    dbg: dict = {"address": address}
-
-    try:
-        # 1) Resolver SMP (y traer debug con dirección elegida USIG)
-        smp, resolver_dbg = adc.resolve_smp_from_address(address)
-        if isinstance(resolver_dbg, dict):
-            dbg.update(resolver_dbg)
-
-        # --- Si no hay SMP: ofrecer alturas válidas cercanas (MVP)
-        if not smp:
-            # Tomamos info USIG (si existe) para entender calle/cod_calle/altura
-            d = (dbg.get("usig_direccion_elegida") or {})
-            cod = (dbg.get("usig_cod_calle_altura") or {}).get("cod_calle") or d.get("cod_calle")
-            altura = (dbg.get("usig_cod_calle_altura") or {}).get("altura") or d.get("altura")
-            calle = d.get("nombre_calle") or d.get("calle") or (dbg.get("usig_calle_puerta") or {}).get("calle")
+    refrescar = str(payload.get("refrescar", "")).strip().lower() in ("1", "true", "si", "sí", "yes")
+    data, status = consultar_catastro(address, _opciones_geometria(payload), _pedir_debug(payload), refrescar)
+    return jsonify(data), status
 
-            alternativas = []
-            try:
-                if cod and altura and calle:
-                    alternativas = sugerir_alturas_validas_cercanas(
-                        cod_calle=int(cod),
-                        nombre_calle=str(calle),
-                        altura_ingresada=int(altura),
-                        limit=6,
-                        max_delta=140,
-                    )
-            except Exception as e:
-                dbg["alturas_cercanas_error"] = str(e)
 
-            return jsonify(
-                {
-                    "ok": False,
-                    "error": "No se encontró parcela para esa altura (dirección sin SMP).",
-                    "alternativas_altura": alternativas,  # ✅ lo usa el front para sugerir
-                    "debug": dbg,
-                }
-            ), 404
+@app.post("/api/catastro/batch")
+def api_catastro_batch():
+    """
+    Body JSON esperado:
+      { "direcciones": ["Davila 1130, CABA", "Mitre 100", ...], "concurrencia": 8 }
+    (acepta las mismas opciones de geometría que /api/catastro)
 
-        # 2) Traer parcela + geometría por SMP (Catastro)
-        parcela = adc.catastro_parcela_by_smp(smp)
-        geometria = adc.catastro_geometria_by_smp(smp)
+    Responde NDJSON (una línea por dirección distinta, a medida que van saliendo):
+      {"indices": [0, 3], "direccion": "...", "status": 200, "ok": true, "smp": ..., ...}
+    Las direcciones repetidas (misma forma canonizada) se consultan una sola vez
+    y su línea lleva todos los índices de entrada.
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    direcciones = payload.get("direcciones") or payload.get("addresses") or []
+    if not isinstance(direcciones, list) or not direcciones:
+        return jsonify({"ok": False, "error": "Falta 'direcciones' (lista)"}), 400
+    if len(direcciones) > BATCH_MAX_DIRECCIONES:
+        return jsonify({"ok": False, "error": f"Máximo {BATCH_MAX_DIRECCIONES} direcciones por batch"}), 413
 
-        # 3) Área m²
-        try:
-            area_m2 = adc.geojson_area_m2(geometria)
-        except Exception as e:
-            area_m2 = 0
-            dbg["area_error"] = str(e)
+    try:
+        concurrencia = int(payload.get("concurrencia") or BATCH_CONCURRENCIA)
+    except (TypeError, ValueError):
+        concurrencia = BATCH_CONCURRENCIA
+    concurrencia = max(1, min(concurrencia, BATCH_CONCURRENCIA_MAX))
+
+    # dedupe: clave canonizada -> (dirección original, índices)
+    grupos: dict[str, tuple[str, list[int]]] = {}
+    invalidas: list[int] = []
+    for i, d in enumerate(direcciones):
+        d = d.strip() if isinstance(d, str) else ""
+        if not d:
+            invalidas.append(i)
+            continue
+        grupos.setdefault(cache_local.canonizar_direccion(d), (d, []))[1].append(i)
 
-        # 4) Centroide XY (SRID interno 97433)
-        cx = cy = None
-        try:
-            cx, cy = adc.geojson_centroid_xy(geometria)
-        except Exception as e:
-            dbg["centroide_xy_error"] = str(e)
+    opciones = _opciones_geometria(payload)
+    debug = _pedir_debug(payload)
+    return Response(
+        stream_with_context(_stream_batch(list(grupos.values()), invalidas, concurrencia, opciones, debug)),
+        mimetype="application/x-ndjson",
+    )
 
-        centroide_xy = {"x": cx, "y": cy} if (cx is not None and cy is not None) else None
 
-        # 5) Centroide lon/lat (WGS84) usando Procesos Geográficos (USIG)
-        centroide_lonlat = None
-        try:
-            if cx is not None and cy is not None:
-                lon, lat = pg.gkba_a_lonlat(float(cx), float(cy))
-                centroide_lonlat = {"lon": lon, "lat": lat}
-        except Exception as e:
-            dbg["procesos_geograficos_error"] = str(e)
+@app.post("/api/parcelas/por_punto")
+def api_parcelas_por_punto():
+    """
+    Lookup inverso en lote, local (índice espacial sobre el almacén de parcelas):
+      { "puntos": [{"lat": -34.63, "lng": -58.44}, ...], "max_dist_m": 0 }
+    max_dist_m=0 (default): sólo la parcela que contiene el punto;
+    >0: la más cercana dentro de ese radio.
+    Responde {"ok": true, "resultados": [{"smp", "distancia_m"} | null, ...]} en el mismo orden.
+    503 si el índice todavía no está armado (no hay almacén o se está construyendo).
+    """
+    payload = request.get_json(force=True, silent=True) or {}
+    puntos = payload.get("puntos") or []
+    if not isinstance(puntos, list) or not puntos:
+        return jsonify({"ok": False, "error": "Falta 'puntos' (lista de {lat, lng})"}), 400
+    if len(puntos) > REVERSO_MAX_PUNTOS:
+        return jsonify({"ok": False, "error": f"Máximo {REVERSO_MAX_PUNTOS} puntos por request"}), 413
+    try:
+        coords = [(float(p["lat"]), float(p["lng"])) for p in puntos]
+        max_dist = float(payload.get("max_dist_m") or 0.0)
+    except (KeyError, TypeError, ValueError):
+        return jsonify({"ok": False, "error": "Cada punto necesita 'lat' y 'lng' numéricos"}), 400
 
-        # 6) Datos Útiles (por calle/altura)
-        datos_utiles = None
-        try:
-            d = (dbg.get("usig_direccion_elegida") or {})
-            calle = d.get("nombre_calle") or d.get("calle")
-            altura = d.get("altura") or d.get("puerta")
-            if calle and altura:
-                datos_utiles = consultar_datos_utiles(str(calle), int(altura))
-        except Exception as e:
-            dbg["datos_utiles_error"] = str(e)
+    indice = indice_espacial.obtener_indice()
+    if indice is None:
+        return jsonify({"ok": False, "error": "Índice espacial no disponible todavía"}), 503
+    return jsonify({"ok": True, "resultados": indice.lote_latlng(coords, max_dist=max(0.0, max_dist))})
 
-        return jsonify(
-            {
-                "ok": True,
-                "input": address,
-                "smp": smp,
-                "parcela": parcela,
-                "geometria": geometria,
-                "area_m2": area_m2,
-                "centroide_xy": centroide_xy,
-                "centroide_lonlat": centroide_lonlat,
-                "datos_utiles": datos_utiles,
-                "debug": dbg,
-            }
-        )
 
-    except Exception as e:
-        return jsonify({"ok": False, "error": str(e), "debug": dbg}), 500
+# precalentamiento de caches en background (ver precalentar.py)
+if precalentar.HABILITADO:
+    precalentar.iniciar()
 
 
 if __name__ == "__main__":
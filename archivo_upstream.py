@@ -0,0 +1,372 @@
+# archivo_upstream.py
+"""
+Archivo de tráfico upstream (USIG / EPOK): grabar y reproducir.
+
+Modos (UPSTREAM_MODO o configurar()):
+  off         comportamiento normal
+  grabar      cada request/respuesta que pasa por http_client queda en el archivo
+  respaldo    como grabar, y si el upstream falla (red / 5xx) se contesta desde el archivo
+  reproducir  no sale nada a la red: todo se contesta desde el archivo
+              (lo que no esté grabado falla como un error de conexión)
+
+El archivo es un SQLite (UPSTREAM_ARCHIVO, default cache/upstream_archivo.sqlite3):
+  respuestas: la última respuesta por request (clave = host+path+query ordenada),
+              cuerpo comprimido con zlib
+  llamadas:   log liviano de cada llamada (ts, servicio, clave, ms, status), para
+              encontrar las lentas y reconstruir el mix de tráfico; se poda a los
+              últimos RETENCION_DIAS (UPSTREAM_RETENCION_DIAS) al arrancar el escritor
+              y después cada PODA_CADA_S
+
+La escritura va por una cola a un hilo propio: grabar no suma latencia al request.
+
+  python archivo_upstream.py stats
+  python archivo_upstream.py lentas --n 20
+  python archivo_upstream.py podar --retencion-dias 7
+  python archivo_upstream.py direcciones > direcciones.csv   # input para geocodificar_csv / benchmark
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import os
+import queue
+import sqlite3
+import sys
+import threading
+import time
+import zlib
+from pathlib import Path
+from urllib.parse import parse_qsl, urlencode, urlsplit
+
+import requests
+from requests.structures import CaseInsensitiveDict
+
+ARCHIVO_PATH = Path(os.environ.get("UPSTREAM_ARCHIVO") or Path("cache") / "upstream_archivo.sqlite3")
+MODOS = ("off", "grabar", "respaldo", "reproducir")
+# respuestas esperando ser escritas; si se llena, se descartan (y se cuentan)
+COLA_MAX = 10_000
+LOTE_ESCRITURA = 200
+RETENCION_DIAS = float(os.environ.get("UPSTREAM_RETENCION_DIAS") or 30)
+PODA_CADA_S = 3600
+
+_modo = (os.environ.get("UPSTREAM_MODO") or "off").strip().lower()
+# reproducir también la latencia grabada (para reproducir requests lentas)
+_latencia_grabada = (os.environ.get("UPSTREAM_LATENCIA_GRABADA") or "").strip() in ("1", "true", "si")
+
+_cola: queue.Queue = queue.Queue(maxsize=COLA_MAX)
+_escritor: threading.Thread | None = None
+_escritor_lock = threading.Lock()
+_local = threading.local()
+
+_stats = {"grabadas": 0, "descartadas": 0, "reproducidas": 0, "faltantes": 0, "respaldos": 0, "podadas": 0}
+_stats_lock = threading.Lock()
+
+
+class SinRespuestaGrabada(requests.exceptions.ConnectionError):
+    """
+    Modo reproducir: la request no está en el archivo.
+    """
+
+
+def _contar(clave_stat: str, n: int = 1) -> None:
+    with _stats_lock:
+        _stats[clave_stat] += n
+
+
+# ====== CONFIG ======
+def configurar(modo: str, path: Path | str | None = None, latencia_grabada: bool | None = None) -> None:
+    global _modo, ARCHIVO_PATH, _latencia_grabada
+    modo = (modo or "off").strip().lower()
+    if modo not in MODOS:
+        raise ValueError(f"Modo inválido: {modo} (opciones: {', '.join(MODOS)})")
+    _modo = modo
+    if path is not None:
+        ARCHIVO_PATH = Path(path)
+    if latencia_grabada is not None:
+        _latencia_grabada = latencia_grabada
+
+
+def modo() -> str:
+    return _modo
+
+
+def graba() -> bool:
+    return _modo in ("grabar", "respaldo")
+
+
+# ====== SQLITE ======
+def _conexion() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(ARCHIVO_PATH)
+    if conn is None:
+        ARCHIVO_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(ARCHIVO_PATH), timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS respuestas ("
+            " clave TEXT PRIMARY KEY, servicio TEXT, status INTEGER NOT NULL,"
+            " content_type TEXT, cuerpo BLOB NOT NULL, ms REAL, ts REAL NOT NULL)"
+        )
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS llamadas ("
+            " id INTEGER PRIMARY KEY, ts REAL NOT NULL, servicio TEXT, clave TEXT NOT NULL,"
+            " ms REAL, status INTEGER)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS llamadas_ms ON llamadas (ms)")
+        conn.execute("CREATE INDEX IF NOT EXISTS llamadas_servicio_ts ON llamadas (servicio, ts)")
+        conns[ARCHIVO_PATH] = conn
+    return conn
+
+
+def clave(url: str, params: dict | None = None) -> str:
+    """
+    host + path + query ordenada (params incluidos), sin esquema:
+    la misma request da la misma clave venga como venga armada.
+    """
+    partes = urlsplit(url)
+    query = parse_qsl(partes.query, keep_blank_values=True)
+    query += [(str(k), "" if v is None else str(v)) for k, v in (params or {}).items()]
+    q = urlencode(sorted(query))
+    return f"{(partes.hostname or '').lower()}{partes.path}" + (f"?{q}" if q else "")
+
+
+# ====== GRABAR ======
+def grabar(url: str, params: dict | None, servicio: str, r: requests.Response, segundos: float) -> None:
+    """
+    Encola la respuesta para escribirla en el archivo (no bloquea).
+    """
+    item = (
+        clave(url, params), servicio, r.status_code, r.headers.get("Content-Type"),
+        r.content, round(segundos * 1000, 1), time.time(),
+    )
+    try:
+        _cola.put_nowait(item)
+    except queue.Full:
+        _contar("descartadas")
+        return
+    _asegurar_escritor()
+
+
+def _asegurar_escritor() -> None:
+    global _escritor
+    if _escritor is not None and _escritor.is_alive():
+        return
+    with _escritor_lock:
+        if _escritor is None or not _escritor.is_alive():
+            _escritor = threading.Thread(target=_escribir_para_siempre, daemon=True, name="archivo_upstream")
+            _escritor.start()
+
+
+def _escribir_lote(lote: list[tuple]) -> None:
+    conn = _conexion()
+    with conn:
+        # un 5xx nunca pisa una respuesta buena ya grabada (es la que sirve de respaldo)
+        for reemplazar in (True, False):
+            filas = [
+                (k, s, st, ct, zlib.compress(cuerpo), ms, ts)
+                for k, s, st, ct, cuerpo, ms, ts in lote if (st < 500) == reemplazar
+            ]
+            if filas:
+                conn.executemany(
+                    f"INSERT OR {'REPLACE' if reemplazar else 'IGNORE'} INTO respuestas"
+                    " (clave, servicio, status, content_type, cuerpo, ms, ts) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    filas,
+                )
+        conn.executemany(
+            "INSERT INTO llamadas (ts, servicio, clave, ms, status) VALUES (?, ?, ?, ?, ?)",
+            [(ts, s, k, ms, st) for k, s, st, ct, cuerpo, ms, ts in lote],
+        )
+    _contar("grabadas", len(lote))
+
+
+def podar(retencion_dias: float = RETENCION_DIAS) -> int:
+    """
+    Borra del log de llamadas lo más viejo que retencion_dias (las respuestas grabadas quedan).
+    """
+    conn = _conexion()
+    with conn:
+        n = conn.execute("DELETE FROM llamadas WHERE ts < ?", (time.time() - retencion_dias * 86400,)).rowcount
+    _contar("podadas", n)
+    return n
+
+
+def _podar_si_toca(ultima: float) -> float:
+    if time.monotonic() - ultima < PODA_CADA_S:
+        return ultima
+    try:
+        podar()
+    except sqlite3.Error:
+        pass
+    return time.monotonic()
+
+
+def _escribir_para_siempre() -> None:
+    ultima_poda = float("-inf")
+    while True:
+        ultima_poda = _podar_si_toca(ultima_poda)
+        lote = [_cola.get()]
+        while len(lote) < LOTE_ESCRITURA:
+            try:
+                lote.append(_cola.get_nowait())
+            except queue.Empty:
+                break
+        try:
+            _escribir_lote(lote)
+        except sqlite3.Error:
+            _contar("descartadas", len(lote))
+        finally:
+            for _ in lote:
+                _cola.task_done()
+
+
+def vaciar_cola() -> None:
+    """
+    Espera a que todo lo encolado esté escrito (tests / fin de un script).
+    """
+    if _escritor is not None:
+        _cola.join()
+
+
+# ====== REPRODUCIR ======
+def buscar(url: str, params: dict | None = None) -> requests.Response | None:
+    """
+    Respuesta grabada para esa request (como requests.Response), o None.
+    """
+    k = clave(url, params)
+    try:
+        row = _conexion().execute(
+            "SELECT status, content_type, cuerpo, ms FROM respuestas WHERE clave = ?", (k,)
+        ).fetchone()
+    except sqlite3.Error:
+        row = None
+    if row is None:
+        return None
+
+    status, content_type, cuerpo, ms = row
+    if _latencia_grabada and ms:
+        time.sleep(ms / 1000.0)
+
+    r = requests.Response()
+    r.status_code = status
+    r._content = zlib.decompress(cuerpo)
+    r.headers = CaseInsensitiveDict({"Content-Type": content_type or "application/json", "X-Archivo-Upstream": "1"})
+    r.url = url
+    r.reason = "OK" if status < 400 else "Archivo"
+    r.encoding = "utf-8"
+    return r
+
+
+def reproducir(url: str, params: dict | None = None) -> requests.Response:
+    r = buscar(url, params)
+    if r is None:
+        _contar("faltantes")
+        raise SinRespuestaGrabada(f"Sin respuesta grabada para {clave(url, params)}")
+    _contar("reproducidas")
+    return r
+
+
+def respaldo(url: str, params: dict | None = None) -> requests.Response | None:
+    """
+    Respuesta grabada utilizable cuando el upstream falla (sólo las 2xx).
+    """
+    r = buscar(url, params)
+    if r is None or r.status_code >= 300:
+        return None
+    _contar("respaldos")
+    return r
+
+
+# ====== CONSULTAS ======
+def estadisticas() -> dict:
+    with _stats_lock:
+        stats = dict(_stats)
+    out = {"modo": _modo, "archivo": str(ARCHIVO_PATH), "cola": _cola.qsize(), **stats}
+    if ARCHIVO_PATH.exists():
+        conn = _conexion()
+        out["respuestas"] = conn.execute("SELECT COUNT(*) FROM respuestas").fetchone()[0]
+        out["llamadas"] = conn.execute("SELECT COUNT(*) FROM llamadas").fetchone()[0]
+        out["bytes_cuerpos"] = conn.execute("SELECT COALESCE(SUM(LENGTH(cuerpo)), 0) FROM respuestas").fetchone()[0]
+    return out
+
+
+def lentas(n: int = 20, servicio: str | None = None) -> list[dict]:
+    sql = "SELECT ts, servicio, clave, ms, status FROM llamadas"
+    args: tuple = ()
+    if servicio:
+        sql += " WHERE servicio = ?"
+        args = (servicio,)
+    sql += " ORDER BY ms DESC LIMIT ?"
+    rows = _conexion().execute(sql, args + (n,)).fetchall()
+    return [dict(zip(("ts", "servicio", "clave", "ms", "status"), row)) for row in rows]
+
+
+def direcciones_grabadas() -> list[str]:
+    """
+    Direcciones consultadas a USIG normalizar, en el orden en que llegaron
+    (con repeticiones: es el mix de tráfico real).
+    """
+    out = []
+    for (k,) in _conexion().execute(
+        "SELECT clave FROM llamadas WHERE servicio = 'usig_normalizar' ORDER BY id"
+    ):
+        _, _, query = k.partition("?")
+        direccion = dict(parse_qsl(query, keep_blank_values=True)).get("direccion")
+        if direccion:
+            out.append(direccion)
+    return out
+
+
+def frecuentes(servicio: str, parametro: str, desde_ts: float | None = None,
+               n: int = 500) -> list[tuple[str, int]]:
+    """
+    [(valor, veces), ...] del parámetro `parametro` en las llamadas a `servicio`
+    desde desde_ts, de la más pedida a la menos (para precalentar caches).
+    """
+    if not ARCHIVO_PATH.exists():
+        return []
+    sql = "SELECT clave, COUNT(*) FROM llamadas WHERE servicio = ?"
+    args: tuple = (servicio,)
+    if desde_ts is not None:
+        sql += " AND ts >= ?"
+        args += (desde_ts,)
+    cuentas: dict[str, int] = {}
+    for k, veces in _conexion().execute(sql + " GROUP BY clave", args):
+        _, _, query = k.partition("?")
+        valor = dict(parse_qsl(query, keep_blank_values=True)).get(parametro)
+        if valor:
+            cuentas[valor] = cuentas.get(valor, 0) + veces
+    return sorted(cuentas.items(), key=lambda kv: -kv[1])[:n]
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Consultas sobre el archivo de tráfico upstream.")
+    p.add_argument("comando", choices=("stats", "lentas", "direcciones", "podar"))
+    p.add_argument("--archivo", type=Path, default=None)
+    p.add_argument("--n", type=int, default=20)
+    p.add_argument("--servicio", default=None)
+    p.add_argument("--retencion-dias", type=float, default=RETENCION_DIAS)
+    args = p.parse_args(argv)
+
+    if args.archivo is not None:
+        configurar(_modo, args.archivo)
+
+    if args.comando == "stats":
+        for k, v in estadisticas().items():
+            print(f"{k}: {v}")
+    elif args.comando == "podar":
+        print(f"podadas: {podar(args.retencion_dias)}")
+    elif args.comando == "lentas":
+        for it in lentas(args.n, args.servicio):
+            print(f"{it['ms']:>9.1f} ms  {it['status']}  {it['servicio']:<28} {it['clave']}")
+    else:
+        w = csv.writer(sys.stdout)
+        w.writerow(["direccion"])
+        for d in direcciones_grabadas():
+            w.writerow([d])
+
+
+if __name__ == "__main__":
+    main()
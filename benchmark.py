@@ -0,0 +1,255 @@
+# benchmark.py
+"""
+Benchmark offline de la app contra el stub de USIG / EPOK (stub_upstream.py).
+
+  python benchmark.py                                   # todos los escenarios, 1..32 clientes
+  python benchmark.py --escenario catastro --concurrencias 1,4,16 --requests 400
+  python benchmark.py --latencia-ms 120 --tasa-error 0.02 --json resultados.json
+  python benchmark.py --app-url http://127.0.0.1:8000   # app ya levantada con UPSTREAM_STUB_URL
+
+Por defecto levanta stub y app en este mismo proceso (werkzeug threaded, puertos libres)
+y corre cada escenario con concurrencia creciente. Por nivel informa throughput,
+p50/p95/p99 de latencia y (con el stub en proceso) las llamadas que recibió el stub y
+cuántas fueron 503 inyectados. La app en proceso corre sin reintentos upstream
+(--reintentos-upstream), así --tasa-error se ve en los errores y no queda tapado.
+Los caches (cache/) van a un directorio temporal, así cada corrida arranca en frío;
+las direcciones se generan únicas salvo --repetidas.
+
+Escenarios:
+  catastro      POST /api/catastro con direcciones que tienen parcela
+  alturas       POST /api/catastro con alturas sin parcela (camino de alturas cercanas)
+  autocomplete  GET /autocomplete/calles (mitad prefijos de calle, mitad calle + altura)
+"""
+from __future__ import annotations
+
+import argparse
+import itertools
+import json
+import math
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+import requests
+
+import stub_upstream
+
+ESCENARIOS = ("catastro", "alturas", "autocomplete")
+CONCURRENCIAS = (1, 2, 4, 8, 16, 32)
+
+_contador = itertools.count(1)
+
+
+# ====== GENERADORES DE REQUESTS ======
+def _calle_nueva(repetidas: float) -> str:
+    # calle "nueva" = cod_calle nuevo en el stub = nada cacheado en la app
+    if repetidas > 0 and random.random() < repetidas:
+        return stub_upstream.CALLES_BASE[0]
+    return "BENCH " + _letras(next(_contador))
+
+
+def _letras(n: int) -> str:
+    # 1 -> A, 27 -> AA: nombres sin dígitos, así la altura es el único número
+    out = ""
+    while n > 0:
+        n, r = divmod(n - 1, 26)
+        out = chr(ord("A") + r) + out
+    return out
+
+
+def _altura_con_parcela() -> int:
+    return random.randrange(1, 40) * 100 + random.randrange(0, stub_upstream.ALTURA_HUECO_DESDE)
+
+
+def _altura_sin_parcela() -> int:
+    return random.randrange(1, 40) * 100 + random.randrange(stub_upstream.ALTURA_HUECO_DESDE + 2, 100)
+
+
+def _req_catastro(repetidas: float) -> tuple[str, str, dict]:
+    return "POST", "/api/catastro", {"json": {"direccion": f"{_calle_nueva(repetidas)} {_altura_con_parcela()}, CABA"}}
+
+
+def _req_alturas(repetidas: float) -> tuple[str, str, dict]:
+    return "POST", "/api/catastro", {"json": {"direccion": f"{_calle_nueva(repetidas)} {_altura_sin_parcela()}, CABA"}}
+
+
+def _req_autocomplete(repetidas: float) -> tuple[str, str, dict]:
+    if random.random() < 0.5:
+        calle = random.choice(stub_upstream.CALLES_BASE)
+        q = calle[:random.randint(3, max(3, len(calle)))]
+    else:
+        q = f"{_calle_nueva(repetidas)} {_altura_con_parcela()}"
+    return "GET", "/autocomplete/calles", {"params": {"q": q, "limit": 10}}
+
+
+_GENERADORES = {"catastro": _req_catastro, "alturas": _req_alturas, "autocomplete": _req_autocomplete}
+# status esperado por escenario (el de alturas contesta 404 con alternativas)
+_STATUS_OK = {"catastro": {200}, "alturas": {404}, "autocomplete": {200}}
+
+
+# ====== MEDICIÓN ======
+def percentil(valores: list[float], p: float) -> float | None:
+    """
+    Percentil por rango más cercano (valores ya ordenados).
+    """
+    if not valores:
+        return None
+    k = max(0, min(len(valores) - 1, math.ceil(p / 100 * len(valores)) - 1))
+    return valores[k]
+
+
+_local = threading.local()
+
+
+def _session() -> requests.Session:
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = _local.session = requests.Session()
+    return s
+
+
+def _una_request(app_url: str, metodo: str, path: str, kwargs: dict) -> tuple[float, int | None]:
+    t0 = time.perf_counter()
+    try:
+        r = _session().request(metodo, app_url + path, timeout=120, **kwargs)
+        status = r.status_code
+    except requests.exceptions.RequestException:
+        status = None
+    return time.perf_counter() - t0, status
+
+
+def _totales_stub(stub) -> tuple[int, int]:
+    c = stub.contadores().values()
+    return sum(x["llamadas"] for x in c), sum(x["errores_inyectados"] for x in c)
+
+
+def correr_nivel(app_url: str, escenario: str, concurrencia: int, n: int, repetidas: float,
+                 stub=None) -> dict:
+    """
+    stub: el stub_upstream.StubServer en proceso (si no, no hay conteo upstream).
+    """
+    gen = _GENERADORES[escenario]
+    reqs = [gen(repetidas) for _ in range(n)]
+    antes = _totales_stub(stub) if stub is not None else None
+    t0 = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrencia, thread_name_prefix="bench") as pool:
+        resultados = list(pool.map(lambda r: _una_request(app_url, *r), reqs))
+    total = time.perf_counter() - t0
+
+    lat_ms = sorted(seg * 1000 for seg, _ in resultados)
+    errores = sum(1 for _, st in resultados if st not in _STATUS_OK[escenario])
+    upstream = {}
+    if antes is not None:
+        llamadas, inyectados = _totales_stub(stub)
+        upstream = {"upstream_llamadas": llamadas - antes[0], "upstream_503": inyectados - antes[1]}
+    return {
+        "escenario": escenario,
+        "concurrencia": concurrencia,
+        "requests": n,
+        "errores": errores,
+        "segundos": round(total, 3),
+        "rps": round(n / total, 1) if total > 0 else None,
+        "p50_ms": round(percentil(lat_ms, 50), 1),
+        "p95_ms": round(percentil(lat_ms, 95), 1),
+        "p99_ms": round(percentil(lat_ms, 99), 1),
+        "max_ms": round(lat_ms[-1], 1),
+        **upstream,
+    }
+
+
+def _imprimir(fila: dict) -> None:
+    print(
+        f"{fila['escenario']:<13} c={fila['concurrencia']:<3} n={fila['requests']:<5} "
+        f"err={fila['errores']:<4} {fila['rps']:>8} req/s  "
+        f"p50={fila['p50_ms']:>8} ms  p95={fila['p95_ms']:>8} ms  p99={fila['p99_ms']:>8} ms"
+        + (f"  upstream={fila['upstream_llamadas']} (503: {fila['upstream_503']})" if "upstream_llamadas" in fila else ""),
+        flush=True,
+    )
+
+
+# ====== APP EN PROCESO ======
+def _levantar_app(stub_url: str, reintentos_upstream: int = 0) -> str:
+    """
+    Importa la app ya apuntada al stub y la sirve con werkzeug (threaded) en un puerto libre.
+    """
+    os.environ["UPSTREAM_STUB_URL"] = stub_url
+    from werkzeug.serving import WSGIRequestHandler, make_server
+
+    import http_client
+    import indice_calles
+    from app import app
+
+    http_client.usar_stub(stub_url)
+    for host in list(http_client.HOST_CONFIG):
+        http_client.configurar_host(host, retries=reintentos_upstream)
+    # el autocomplete de calles sin altura usa el índice offline: lo dejamos armado
+    indice_calles.construir()
+
+    class _SinLog(WSGIRequestHandler):
+        def log_request(self, *args, **kwargs):
+            pass
+
+    srv = make_server("127.0.0.1", 0, app, threaded=True, request_handler=_SinLog)
+    threading.Thread(target=srv.serve_forever, daemon=True, name="bench_app").start()
+    return f"http://127.0.0.1:{srv.server_port}"
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Benchmark offline de /api/catastro y /autocomplete/calles.")
+    p.add_argument("--escenario", action="append", choices=ESCENARIOS,
+                   help="escenario a correr (repetible; default: todos)")
+    p.add_argument("--concurrencias", default=",".join(map(str, CONCURRENCIAS)),
+                   help="niveles de concurrencia separados por coma")
+    p.add_argument("--requests", type=int, default=200, help="requests por nivel")
+    p.add_argument("--calentamiento", type=int, default=10, help="requests descartadas antes de cada escenario")
+    p.add_argument("--repetidas", type=float, default=0.0,
+                   help="fracción de requests sobre una calle ya vista (ejercita los caches)")
+    p.add_argument("--app-url", help="medir una app ya levantada (con UPSTREAM_STUB_URL apuntando al stub)")
+    p.add_argument("--stub-url", help="usar un stub ya levantado en vez de uno en proceso")
+    p.add_argument("--json", type=Path, help="guardar los resultados en este archivo")
+    p.add_argument("--seed", type=int, default=1)
+    p.add_argument("--reintentos-upstream", type=int, default=0,
+                   help="reintentos de http_client hacia el stub (sólo app en proceso; default 0)")
+    stub_upstream.agregar_args(p)
+    args = p.parse_args(argv)
+
+    random.seed(args.seed)
+    escenarios = args.escenario or list(ESCENARIOS)
+    concurrencias = [int(c) for c in args.concurrencias.split(",") if c.strip()]
+
+    stub_url = args.stub_url
+    stub = None
+    if stub_url is None:
+        stub, stub_url = stub_upstream.iniciar_en_hilo(stub_upstream.config_desde_args(args))
+
+    app_url = args.app_url
+    if app_url is None:
+        salida_json = args.json.resolve() if args.json else None
+        # caches en un directorio temporal: cada corrida arranca en frío
+        os.chdir(tempfile.mkdtemp(prefix="bench_catastro_"))
+        app_url = _levantar_app(stub_url, args.reintentos_upstream)
+        args.json = salida_json
+
+    print(f"app: {app_url}  stub: {stub_url}  latencia={args.latencia_ms}ms "
+          f"jitter={args.jitter} error={args.tasa_error}", file=sys.stderr)
+
+    filas = []
+    for escenario in escenarios:
+        if args.calentamiento:
+            correr_nivel(app_url, escenario, 1, args.calentamiento, args.repetidas)
+        for c in concurrencias:
+            fila = correr_nivel(app_url, escenario, c, args.requests, args.repetidas, stub)
+            _imprimir(fila)
+            filas.append(fila)
+
+    if args.json:
+        args.json.write_text(json.dumps(filas, indent=2), encoding="utf-8")
+
+
+if __name__ == "__main__":
+    main()
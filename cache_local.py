@@ -0,0 +1,218 @@
+# cache_local.py
+"""
+Cache en dos niveles para respuestas de upstream (USIG / EPOK):
+
+  1) LRU en memoria del proceso, con TTL.
+  2) SQLite en disco (sobrevive reinicios y se comparte entre workers).
+
+Cada cache tiene un nombre (namespace dentro de la misma base) y lleva
+contadores de hits/misses que se pueden consultar con estadisticas().
+"""
+from __future__ import annotations
+
+import json
+import re
+import sqlite3
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from pathlib import Path
+
+DB_PATH = Path("cache") / "cache_local.sqlite3"
+
+_FALTA = object()
+_caches: dict[str, "CacheTTL"] = {}
+_local = threading.local()
+
+
+# ====== CLAVES ======
+_RE_SUFIJO_CABA = re.compile(
+    r"[\s,]*\b(caba|c\.a\.b\.a\.?|capital federal|ciudad autonoma de buenos aires)\s*$"
+)
+_RE_ESPACIOS = re.compile(r"\s+")
+
+
+def sin_acentos(s: str) -> str:
+    return "".join(c for c in unicodedata.normalize("NFKD", s) if not unicodedata.combining(c))
+
+
+def canonizar_direccion(s: str) -> str:
+    """
+    'Dávila  1130, CABA' -> 'davila 1130'
+    (minúsculas, sin acentos, espacios colapsados, sin ', CABA' final).
+    """
+    s = sin_acentos(s or "").lower()
+    s = _RE_ESPACIOS.sub(" ", s).strip()
+    s = _RE_SUFIJO_CABA.sub("", s)
+    return s.strip(" ,")
+
+
+# ====== SQLITE ======
+def _conexion(db_path: Path) -> sqlite3.Connection:
+    """
+    Una conexión por hilo y por archivo (sqlite3 no comparte conexiones entre hilos).
+    """
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(db_path)
+    if conn is None:
+        db_path.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(db_path), timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS cache ("
+            " ns TEXT NOT NULL, k TEXT NOT NULL, v TEXT NOT NULL, ts REAL NOT NULL,"
+            " PRIMARY KEY (ns, k))"
+        )
+        conns[db_path] = conn
+    return conn
+
+
+class CacheTTL:
+    """
+    get(key) -> valor o None; set(key, valor).
+    Los valores tienen que ser serializables a JSON.
+    """
+
+    def __init__(self, nombre: str, ttl_s: float, max_items: int = 10_000,
+                 persistente: bool = True, db_path: Path | None = None):
+        self.nombre = nombre
+        self.ttl_s = ttl_s
+        self.max_items = max_items
+        self.persistente = persistente
+        self.db_path = Path(db_path or DB_PATH)
+        self._mem: OrderedDict[str, tuple[float, object]] = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits_memoria = 0
+        self.hits_disco = 0
+        self.misses = 0
+        self.errores_disco = 0
+        _caches[nombre] = self
+
+    def _contar(self, contador: str) -> None:
+        # los contadores se tocan desde todos los hilos de los pools: += no es atómico
+        with self._lock:
+            setattr(self, contador, getattr(self, contador) + 1)
+
+    # --- memoria ---
+    def _mem_get(self, key: str, ahora: float):
+        with self._lock:
+            item = self._mem.get(key)
+            if item is None:
+                return _FALTA
+            ts, valor = item
+            if ahora - ts > self.ttl_s:
+                del self._mem[key]
+                return _FALTA
+            self._mem.move_to_end(key)
+            return valor
+
+    def _mem_set(self, key: str, valor, ts: float) -> None:
+        with self._lock:
+            self._mem[key] = (ts, valor)
+            self._mem.move_to_end(key)
+            while len(self._mem) > self.max_items:
+                self._mem.popitem(last=False)
+
+    # --- disco ---
+    def _disco_get(self, key: str, ahora: float):
+        try:
+            row = _conexion(self.db_path).execute(
+                "SELECT v, ts FROM cache WHERE ns = ? AND k = ?", (self.nombre, key)
+            ).fetchone()
+        except sqlite3.Error:
+            self._contar("errores_disco")
+            return _FALTA, None
+        if row is None or ahora - row[1] > self.ttl_s:
+            return _FALTA, None
+        return json.loads(row[0]), row[1]
+
+    def _disco_set(self, key: str, valor, ts: float) -> None:
+        try:
+            conn = _conexion(self.db_path)
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache (ns, k, v, ts) VALUES (?, ?, ?, ?)",
+                    (self.nombre, key, json.dumps(valor, ensure_ascii=False), ts),
+                )
+        except sqlite3.Error:
+            self._contar("errores_disco")
+
+    # --- API ---
+    def get(self, key: str, default=None, contar: bool = True):
+        """
+        contar=False: lookup exploratorio (ej. buscar prefijos), no suma a hits/misses.
+        """
+        ahora = time.time()
+        valor = self._mem_get(key, ahora)
+        if valor is not _FALTA:
+            if contar:
+                self._contar("hits_memoria")
+            return valor
+        if self.persistente:
+            valor, ts = self._disco_get(key, ahora)
+            if valor is not _FALTA:
+                if contar:
+                    self._contar("hits_disco")
+                self._mem_set(key, valor, ts)
+                return valor
+        if contar:
+            self._contar("misses")
+        return default
+
+    def set(self, key: str, valor) -> None:
+        ts = time.time()
+        self._mem_set(key, valor, ts)
+        if self.persistente:
+            self._disco_set(key, valor, ts)
+
+    def obtener_o_calcular(self, key: str, fn, cacheable=None):
+        """
+        Devuelve el valor cacheado o llama fn(), lo guarda y lo devuelve.
+        Si fn() lanza excepción no se cachea nada; con cacheable(valor) -> False
+        (ej. un payload de error del upstream) se devuelve sin guardarlo.
+        """
+        valor = self.get(key, _FALTA)
+        if valor is _FALTA:
+            valor = fn()
+            if cacheable is None or cacheable(valor):
+                self.set(key, valor)
+        return valor
+
+    def borrar(self, key: str) -> None:
+        with self._lock:
+            self._mem.pop(key, None)
+        if self.persistente:
+            try:
+                conn = _conexion(self.db_path)
+                with conn:
+                    conn.execute("DELETE FROM cache WHERE ns = ? AND k = ?", (self.nombre, key))
+            except sqlite3.Error:
+                self._contar("errores_disco")
+
+    def limpiar_memoria(self) -> None:
+        with self._lock:
+            self._mem.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            hits_memoria, hits_disco, misses = self.hits_memoria, self.hits_disco, self.misses
+            errores_disco, items = self.errores_disco, len(self._mem)
+        hits = hits_memoria + hits_disco
+        total = hits + misses
+        return {
+            "hits_memoria": hits_memoria,
+            "hits_disco": hits_disco,
+            "misses": misses,
+            "hit_rate": round(hits / total, 4) if total else None,
+            "items_memoria": items,
+            "errores_disco": errores_disco,
+            "ttl_s": self.ttl_s,
+        }
+
+
+def estadisticas() -> dict:
+    return {nombre: c.stats() for nombre, c in _caches.items()}
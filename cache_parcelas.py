@@ -0,0 +1,170 @@
+# cache_parcelas.py
+"""
+Cache por SMP de todo lo que /api/catastro arma a partir del SMP:
+atributos de la parcela, geometría exacta, área m² y centroides (XY y lon/lat).
+
+Stale-while-revalidate:
+  - entrada con menos de FRESCO_S: se sirve tal cual
+  - más vieja (hasta VENCIDA_MAX_S): se sirve igual, al instante, y se encola
+    un refresco en background contra EPOK (uno por SMP a la vez)
+  - más vieja que eso, o refrescar=True: el caller la vuelve a armar
+
+Va sobre cache_local.CacheTTL (memoria + SQLite), así sobrevive a reinicios.
+  CACHE_PARCELAS_FRESCO_S=86400 python app.py
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import api_datos_catastrales as adc
+import api_procesos_geograficos as pg
+import cache_local
+
+FRESCO_S = float(os.environ.get("CACHE_PARCELAS_FRESCO_S") or 7 * 24 * 3600)
+VENCIDA_MAX_S = 90 * 24 * 3600
+
+CACHE = cache_local.CacheTTL("parcelas_smp", ttl_s=VENCIDA_MAX_S, max_items=20_000)
+
+# refrescos en background: sin el contexto del request (ni su deadline ni su Server-Timing)
+_REFRESCO_EXECUTOR = ThreadPoolExecutor(max_workers=4, thread_name_prefix="refresco_parcelas")
+_en_refresco: set[str] = set()
+_lock = threading.Lock()
+
+_stats = {"frescas": 0, "vencidas": 0, "faltantes": 0, "refrescos": 0, "refrescos_error": 0}
+_stats_lock = threading.Lock()
+
+
+def _contar(clave: str) -> None:
+    # hilos de los requests y del refresco en background: += no es atómico
+    with _stats_lock:
+        _stats[clave] += 1
+
+
+# ====== DERIVADOS ======
+def derivados(geometria: dict) -> tuple[dict, dict]:
+    """
+    Área m², centroide XY (SRID 97433) y centroide lon/lat (GKBA local) de la geometría.
+    Devuelve (derivados, errores): los errores no fatales son para el debug.
+    """
+    errores: dict = {}
+
+    try:
+        area_m2 = adc.geojson_area_m2(geometria)
+    except Exception as e:
+        area_m2 = 0
+        errores["area_error"] = str(e)
+
+    cx = cy = None
+    try:
+        cx, cy = adc.geojson_centroid_xy(geometria)
+    except Exception as e:
+        errores["centroide_xy_error"] = str(e)
+
+    centroide_xy = {"x": cx, "y": cy} if (cx is not None and cy is not None) else None
+
+    centroide_lonlat = None
+    try:
+        if cx is not None and cy is not None:
+            lon, lat = pg.gkba_a_lonlat(float(cx), float(cy))
+            centroide_lonlat = {"lon": lon, "lat": lat}
+    except Exception as e:
+        errores["procesos_geograficos_error"] = str(e)
+
+    return {"area_m2": area_m2, "centroide_xy": centroide_xy, "centroide_lonlat": centroide_lonlat}, errores
+
+
+# ====== LECTURA / ESCRITURA ======
+def _completa(parcela, geometria) -> bool:
+    return (isinstance(parcela, dict) and bool(parcela)
+            and isinstance(geometria, dict) and bool(geometria.get("features") or geometria.get("coordinates")))
+
+
+def guardar(smp: str, parcela: dict, geometria: dict, derivados_: dict) -> bool:
+    """
+    Guarda la entrada si está completa (parcela + geometría con algo). True si se guardó.
+    """
+    if not _completa(parcela, geometria):
+        return False
+    CACHE.set(smp, {"parcela": parcela, "geometria": geometria, **derivados_, "ts": time.time()})
+    return True
+
+
+def leer(smp: str) -> dict | None:
+    """
+    Entrada cacheada (fresca o vencida) o None. Si está vencida, encola el
+    refresco y la devuelve igual. La entrada trae "edad_s" y "vencida".
+    """
+    entrada = CACHE.get(smp)
+    if entrada is None:
+        _contar("faltantes")
+        return None
+    edad = time.time() - entrada["ts"]
+    vencida = edad > FRESCO_S
+    _contar("vencidas" if vencida else "frescas")
+    if vencida:
+        refrescar_en_background(smp)
+    return {**entrada, "edad_s": round(edad, 1), "vencida": vencida}
+
+
+# ====== REFRESCO ======
+def refrescar(smp: str, remoto: bool = True) -> dict | None:
+    """
+    Revalida contra EPOK (sin almacén ni cache) y guarda. Devuelve la entrada nueva,
+    o None si EPOK no contestó algo completo (la vieja queda).
+    remoto=False -> primero el almacén local (para cargar, no para revalidar).
+    """
+    if remoto:
+        parcela = adc.catastro_parcela_by_smp_remoto(smp)
+        geometria = adc.catastro_geometria_by_smp_remoto(smp)
+    else:
+        parcela = adc.catastro_parcela_by_smp(smp)
+        geometria = adc.catastro_geometria_by_smp(smp)
+    der, errores = derivados(geometria)
+    if errores or not guardar(smp, parcela, geometria, der):
+        return None
+    return CACHE.get(smp, contar=False)
+
+
+def fresca(smp: str) -> bool:
+    """
+    Sin efectos (no cuenta hits ni encola refrescos): ¿hay una entrada fresca?
+    """
+    entrada = CACHE.get(smp, contar=False)
+    return entrada is not None and time.time() - entrada["ts"] <= FRESCO_S
+
+
+def _refrescar_y_soltar(smp: str) -> None:
+    try:
+        ok = refrescar(smp) is not None
+    except Exception:
+        ok = False
+    finally:
+        with _lock:
+            _en_refresco.discard(smp)
+    _contar("refrescos" if ok else "refrescos_error")
+
+
+def refrescar_en_background(smp: str) -> bool:
+    """
+    Encola el refresco si no hay uno en curso para ese SMP. True si lo encoló.
+    """
+    with _lock:
+        if smp in _en_refresco:
+            return False
+        _en_refresco.add(smp)
+    _REFRESCO_EXECUTOR.submit(_refrescar_y_soltar, smp)
+    return True
+
+
+def estadisticas() -> dict:
+    """
+    Hits por frescura y refrescos (los hits memoria / disco están en cache_local, "parcelas_smp").
+    """
+    with _stats_lock:
+        stats = dict(_stats)
+    with _lock:
+        en_refresco = len(_en_refresco)
+    return {**stats, "en_refresco": en_refresco, "fresco_s": FRESCO_S}
@@ -0,0 +1,255 @@
+# circuito.py
+"""
+Protección contra upstreams degradados (USIG / EPOK), por servicio
+(la misma etiqueta que usa http_client para las métricas):
+
+  - Circuit breaker: después de UMBRAL_FALLAS llamadas malas seguidas (error de red,
+    5xx o más lentas que LENTA_S) el circuito se abre y las llamadas fallan al
+    instante durante ABIERTO_S (que se duplica en cada reapertura, hasta ABIERTO_MAX_S).
+    Después pasa a semiabierto: deja pasar una llamada de prueba; si sale bien se
+    cierra, si no se vuelve a abrir.
+  - Timeout adaptativo: el timeout de lectura sale del p99 de las últimas llamadas
+    buenas (x FACTOR_TIMEOUT), acotado entre TIMEOUT_MIN_S y el configurado para el host.
+  - Deadline por request: deadline(segundos) fija en un contextvar el instante
+    límite; http_client no espera más que lo que queda (y falla sin salir a la red
+    si ya no queda nada). metricas.submit propaga el contexto a los pools.
+"""
+from __future__ import annotations
+
+import contextvars
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+
+import requests
+
+UMBRAL_FALLAS = 5
+LENTA_S = 8.0
+ABIERTO_S = 15.0
+ABIERTO_MAX_S = 300.0
+
+# timeout adaptativo
+VENTANA_LATENCIAS = 200
+MIN_MUESTRAS = 20
+FACTOR_TIMEOUT = 3.0
+TIMEOUT_MIN_S = 2.0
+RECALCULO_P99 = 20
+
+CERRADO, ABIERTO, SEMIABIERTO = "cerrado", "abierto", "semiabierto"
+
+_deadline: contextvars.ContextVar[float | None] = contextvars.ContextVar("deadline_request", default=None)
+
+
+class CircuitoAbierto(requests.exceptions.ConnectionError):
+    """
+    El servicio está marcado como caído: no se intentó la llamada.
+    """
+
+
+class DeadlineExcedido(requests.exceptions.Timeout):
+    """
+    No queda tiempo del deadline del request para esta llamada.
+    """
+
+
+class _Circuito:
+    def __init__(self, servicio: str):
+        self.servicio = servicio
+        self.estado = CERRADO
+        self.fallas_seguidas = 0
+        self.aperturas = 0
+        self.abierto_hasta = 0.0
+        self.prueba_en_curso = False
+        self.latencias: deque[float] = deque(maxlen=VENTANA_LATENCIAS)
+        self.rechazadas = 0
+        self._lock = threading.Lock()
+        self._p99: float | None = None
+        self._nuevas = 0
+
+    # --- permiso ---
+    def permitir(self) -> bool:
+        with self._lock:
+            if self.estado == CERRADO:
+                return True
+            ahora = time.monotonic()
+            if self.estado == ABIERTO and ahora >= self.abierto_hasta:
+                self.estado = SEMIABIERTO
+                self.prueba_en_curso = False
+            if self.estado == SEMIABIERTO and not self.prueba_en_curso:
+                self.prueba_en_curso = True
+                return True
+            self.rechazadas += 1
+            return False
+
+    def disponible(self) -> bool:
+        """
+        Sin efectos: ¿una llamada ahora tendría chance de pasar?
+        """
+        with self._lock:
+            if self.estado == CERRADO:
+                return True
+            if self.estado == ABIERTO:
+                return time.monotonic() >= self.abierto_hasta
+            return not self.prueba_en_curso
+
+    # --- resultado ---
+    def registrar(self, segundos: float, ok: bool) -> None:
+        mala = not ok or segundos > LENTA_S
+        with self._lock:
+            if ok:
+                self.latencias.append(segundos)
+                self._nuevas += 1
+            if not mala:
+                self.fallas_seguidas = 0
+                if self.estado != CERRADO:
+                    self.estado = CERRADO
+                    self.aperturas = 0
+                self.prueba_en_curso = False
+                return
+
+            self.fallas_seguidas += 1
+            if self.estado == SEMIABIERTO or self.fallas_seguidas >= UMBRAL_FALLAS:
+                self.aperturas += 1
+                espera = min(ABIERTO_MAX_S, ABIERTO_S * 2 ** (self.aperturas - 1))
+                self.estado = ABIERTO
+                self.abierto_hasta = time.monotonic() + espera
+                self.prueba_en_curso = False
+
+    def descartar(self) -> None:
+        # la llamada no dice nada del upstream: sólo libera la prueba del semiabierto
+        with self._lock:
+            self.prueba_en_curso = False
+
+    # --- timeout ---
+    def p99(self) -> float | None:
+        with self._lock:
+            n = len(self.latencias)
+            if n < MIN_MUESTRAS:
+                return None
+            # se recalcula cada RECALCULO_P99 llamadas buenas, no en cada llamada
+            if self._p99 is None or self._nuevas >= RECALCULO_P99:
+                orden = sorted(self.latencias)
+                self._p99 = orden[min(n - 1, int(n * 0.99))]
+                self._nuevas = 0
+            return self._p99
+
+    def stats(self) -> dict:
+        with self._lock:
+            restante = max(0.0, self.abierto_hasta - time.monotonic()) if self.estado == ABIERTO else 0.0
+            return {
+                "estado": self.estado,
+                "fallas_seguidas": self.fallas_seguidas,
+                "aperturas": self.aperturas,
+                "reabre_en_s": round(restante, 1),
+                "rechazadas": self.rechazadas,
+                "muestras": len(self.latencias),
+            }
+
+
+_circuitos: dict[str, _Circuito] = {}
+_lock = threading.Lock()
+
+
+def _circuito(servicio: str) -> _Circuito:
+    c = _circuitos.get(servicio)
+    if c is None:
+        with _lock:
+            c = _circuitos.setdefault(servicio, _Circuito(servicio))
+    return c
+
+
+# ====== API PARA http_client ======
+def antes_de_llamar(servicio: str) -> None:
+    """
+    Lanza CircuitoAbierto / DeadlineExcedido si no tiene sentido salir a la red.
+    """
+    queda = restante()
+    if queda is not None and queda <= 0:
+        raise DeadlineExcedido(f"Deadline del request excedido antes de llamar a {servicio}")
+    if not _circuito(servicio).permitir():
+        raise CircuitoAbierto(f"Circuito abierto para {servicio}")
+
+
+def registrar(servicio: str, segundos: float, ok: bool) -> None:
+    _circuito(servicio).registrar(segundos, ok)
+
+
+def descartar(servicio: str) -> None:
+    """
+    Para llamadas que cortó el deadline del request (no el upstream): no cuentan
+    como falla ni como latencia, pero liberan la llamada de prueba si era una.
+    """
+    _circuito(servicio).descartar()
+
+
+def timeout_para(servicio: str, configurado: float | tuple) -> float | tuple:
+    """
+    (connect, read): read = p99 observado x FACTOR_TIMEOUT, entre TIMEOUT_MIN_S y el configurado;
+    ambos acotados por lo que quede del deadline del request.
+    """
+    connect, read = configurado if isinstance(configurado, tuple) else (configurado, configurado)
+    p99 = _circuito(servicio).p99()
+    if p99 is not None:
+        read = min(read, max(TIMEOUT_MIN_S, p99 * FACTOR_TIMEOUT))
+    queda = restante()
+    if queda is not None:
+        connect, read = min(connect, queda), min(read, queda)
+    return (max(0.001, connect), max(0.001, read))
+
+
+# ====== SALUD ======
+def disponible(servicio: str) -> bool:
+    """
+    Para pasos opcionales (datos útiles, verificaciones): False si el circuito
+    está abierto, así se saltean sin esperar.
+    """
+    c = _circuitos.get(servicio)
+    return True if c is None else c.disponible()
+
+
+def estadisticas() -> dict:
+    return {s: c.stats() for s, c in sorted(_circuitos.items())}
+
+
+def prometheus() -> str:
+    lineas = [
+        "# HELP upstream_circuito_abierto 1 si el circuito del servicio está abierto (0.5 = semiabierto).",
+        "# TYPE upstream_circuito_abierto gauge",
+    ]
+    valor = {CERRADO: 0, SEMIABIERTO: 0.5, ABIERTO: 1}
+    for s, st in estadisticas().items():
+        lineas.append(f'upstream_circuito_abierto{{servicio="{s}"}} {valor[st["estado"]]}')
+    lineas += ["# HELP upstream_circuito_rechazadas_total Llamadas cortadas por circuito abierto.",
+               "# TYPE upstream_circuito_rechazadas_total counter"]
+    for s, st in estadisticas().items():
+        lineas.append(f'upstream_circuito_rechazadas_total{{servicio="{s}"}} {st["rechazadas"]}')
+    return "\n".join(lineas) + "\n"
+
+
+# ====== DEADLINE ======
+@contextmanager
+def deadline(segundos: float | None):
+    """
+    with circuito.deadline(10): ...  -> todas las llamadas upstream hechas adentro
+    (también desde pools vía metricas.submit) terminan antes de 10 s.
+    Un deadline anidado nunca extiende al de afuera. None = sin cambios.
+    """
+    if segundos is None:
+        yield
+        return
+    limite = time.monotonic() + segundos
+    actual = _deadline.get()
+    token = _deadline.set(limite if actual is None else min(actual, limite))
+    try:
+        yield
+    finally:
+        _deadline.reset(token)
+
+
+def restante() -> float | None:
+    """
+    Segundos que quedan del deadline del request (None = sin deadline).
+    """
+    limite = _deadline.get()
+    return None if limite is None else limite - time.monotonic()
@@ -0,0 +1,372 @@
+# cosechar_parcelas.py
+"""
+Cosecha de parcelas de Catastro (EPOK) al almacén local (almacen_parcelas).
+
+  python cosechar_parcelas.py --secciones 44 --manzanas 1-200 --workers 4 --rps 5
+  python cosechar_parcelas.py --manzana 044-097A --manzana 044-098 --forzar
+  python cosechar_parcelas.py --secciones 1-80 --manzanas 1-250 --refrescar-dias 30
+  python cosechar_parcelas.py --datos-utiles            # sólo precarga, todas las manzanas cosechadas
+
+- Recorre cada manzana desde la parcela 001 siguiendo smp_siguiente
+  (y si falta, probando la parcela que sigue, hasta --max-huecos vacías seguidas).
+- Concurrencia acotada entre manzanas (--workers) y tope global de requests
+  por segundo a EPOK (--rps).
+- Refresco incremental: las manzanas cosechadas hace menos de --refrescar-dias
+  no se tocan; en las demás se vuelven a pedir los atributos y la geometría
+  sólo de las parcelas cuyos atributos cambiaron (o que no tenían geometría).
+  Las parcelas que ya no aparecen en la manzana se borran sólo si el recorrido
+  terminó bien (la cadena smp_siguiente se cerró, sin errores); si se cortó antes
+  (errores, --max-huecos, MAX_PARCELAS_MANZANA) quedan en el almacén como vencidas
+  y la manzana no se marca como cosechada (se reintenta en la próxima corrida).
+- --datos-utiles: precarga los caches de datos útiles (api_datos_utiles) de cada
+  manzana: una consulta a USIG por frente (calle / cuadra / vereda de las direcciones
+  de sus parcelas), que llena la manzana y el frente. Si ninguna parcela tiene
+  dirección, una sola consulta en el centroide de una de ellas (sólo la manzana).
+"""
+from __future__ import annotations
+
+import argparse
+import re
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import requests
+
+import almacen_parcelas
+import api_datos_catastrales as adc
+import api_datos_utiles
+from api_datos_usig import usig_datos_utiles_por_direccion, usig_datos_utiles_por_xy
+
+RPS_DEFAULT = 5.0
+MAX_HUECOS = 3
+MAX_PARCELAS_MANZANA = 500
+REFRESCAR_DIAS = 30
+
+_RE_PARCELA = re.compile(r"^(\d+)([A-Z]?)$")
+_RE_DIRECCION = re.compile(r"^(.*\D)\s+(\d+)\s*$")
+
+
+# ====== RATE LIMIT ======
+class LimitadorTasa:
+    """
+    Token bucket compartido entre hilos: como mucho `rps` requests por segundo
+    (con ráfagas de hasta `rafaga`).
+    """
+
+    def __init__(self, rps: float, rafaga: int = 1):
+        self.intervalo = 1.0 / rps if rps > 0 else 0.0
+        self.rafaga = max(1, rafaga)
+        self._tokens = float(self.rafaga)
+        self._ultimo = time.monotonic()
+        self._lock = threading.Lock()
+
+    def esperar(self) -> None:
+        if self.intervalo <= 0:
+            return
+        while True:
+            with self._lock:
+                ahora = time.monotonic()
+                self._tokens = min(self.rafaga, self._tokens + (ahora - self._ultimo) / self.intervalo)
+                self._ultimo = ahora
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                falta = (1 - self._tokens) * self.intervalo
+            time.sleep(falta)
+
+
+# ====== RECORRIDO ======
+def _smp_siguiente_numerico(smp: str) -> str | None:
+    seccion, manzana, parcela = smp.split("-")
+    m = _RE_PARCELA.match(parcela)
+    if not m:
+        return None
+    return f"{seccion}-{manzana}-{int(m.group(1)) + 1:03d}"
+
+
+def _misma_manzana(smp: str, otro) -> bool:
+    return isinstance(otro, str) and otro.rsplit("-", 1)[0] == smp.rsplit("-", 1)[0]
+
+
+def recorrer_manzana(seccion: str, manzana: str, limitador: LimitadorTasa,
+                     max_huecos: int = MAX_HUECOS) -> tuple[list[tuple[str, dict]], bool]:
+    """
+    ([(smp, atributos EPOK), ...] de la manzana en el orden de la cadena smp_siguiente, completa).
+    completa=True sólo si la cadena terminó (la última parcela no tiene smp_siguiente en
+    la manzana) sin errores de EPOK en el camino, o si la manzana está vacía; un corte
+    por huecos a mitad de cadena o por MAX_PARCELAS_MANZANA no es un recorrido completo.
+    Los errores de red / HTTP de una parcela se cuentan como hueco y el recorrido sigue.
+    """
+    encontradas: list[tuple[str, dict]] = []
+    vistos: set[str] = set()
+    smp = f"{seccion}-{manzana}-001"
+    huecos = 0
+    errores = 0
+    fin_de_cadena = False
+
+    while smp and smp not in vistos and len(encontradas) < MAX_PARCELAS_MANZANA:
+        vistos.add(smp)
+        limitador.esperar()
+        try:
+            payload = adc.catastro_parcela_by_smp_remoto(smp)
+        except requests.exceptions.RequestException:
+            payload = None
+            errores += 1
+        got = adc.extraer_smp(payload) if payload else None
+
+        if got and got.smp == smp:
+            huecos = 0
+            encontradas.append((smp, payload))
+            siguiente = payload.get("smp_siguiente") if isinstance(payload, dict) else None
+            fin_de_cadena = not _misma_manzana(smp, siguiente)
+            if not fin_de_cadena:
+                smp = siguiente
+                continue
+            if siguiente:
+                break  # la cadena ya salió de la manzana: era la última
+        else:
+            huecos += 1
+            if huecos > max_huecos:
+                break
+        smp = _smp_siguiente_numerico(smp)
+
+    completa = (not errores and len(encontradas) < MAX_PARCELAS_MANZANA
+                and (fin_de_cadena or not encontradas))
+    return encontradas, completa
+
+
+def cosechar_manzana(seccion: str, manzana: str, limitador: LimitadorTasa,
+                     refrescar_despues_s: float = REFRESCAR_DIAS * 86400, forzar: bool = False,
+                     max_huecos: int = MAX_HUECOS) -> dict:
+    """
+    Cosecha (o refresca) una manzana. Devuelve {"estado", "parcelas", "geometrias", "borradas", "vencidas"};
+    estado: "fresca" (no se tocó) | "vacia" | "nueva" | "cambiada" | "sin_cambios"
+    | "incompleta" (el recorrido se cortó: nada se borra y la manzana no se marca).
+    """
+    meta = almacen_parcelas.manzana(seccion, manzana)
+    if meta and not forzar and time.time() - meta["ts"] < refrescar_despues_s:
+        return {"estado": "fresca", "parcelas": meta["n_parcelas"], "geometrias": 0, "borradas": 0,
+                "vencidas": 0}
+
+    parcelas, completa = recorrer_manzana(seccion, manzana, limitador, max_huecos)
+    previas = almacen_parcelas.huellas_de_manzana(seccion, manzana)
+    # una manzana que tenía parcelas y ahora "no tiene ninguna" es más probable que sea EPOK fallando
+    completa = completa and bool(parcelas or not previas)
+
+    geometrias = 0
+    huellas = []
+    for smp, atributos in parcelas:
+        huella = almacen_parcelas.huella_de(atributos)
+        huellas.append((smp, huella))
+        if previas.get(smp) == (huella, True):
+            # sin cambios: sólo renovamos el ts (la geometría queda)
+            almacen_parcelas.guardar(smp, atributos)
+            continue
+        limitador.esperar()
+        almacen_parcelas.guardar(smp, atributos, adc.catastro_geometria_by_smp_remoto(smp))
+        geometrias += 1
+
+    actuales = {smp for smp, _ in parcelas}
+    faltantes = [smp for smp in previas if smp not in actuales]
+    if not completa:
+        # pueden estar en la parte de la manzana que no se llegó a recorrer
+        almacen_parcelas.vencer(faltantes)
+        return {"estado": "incompleta", "parcelas": len(parcelas), "geometrias": geometrias, "borradas": 0,
+                "vencidas": len(faltantes)}
+    almacen_parcelas.borrar(faltantes)
+
+    huella_manzana = almacen_parcelas.huella_de(huellas)
+    almacen_parcelas.marcar_manzana(seccion, manzana, len(parcelas), huella_manzana)
+
+    if not parcelas:
+        estado = "vacia"
+    elif meta is None:
+        estado = "nueva"
+    elif meta["huella"] != huella_manzana:
+        estado = "cambiada"
+    else:
+        estado = "sin_cambios"
+    return {"estado": estado, "parcelas": len(parcelas), "geometrias": geometrias, "borradas": len(faltantes),
+            "vencidas": 0}
+
+
+# ====== DATOS ÚTILES POR MANZANA ======
+def _centroide_de_manzana(seccion: str, manzana: str) -> tuple[float, float] | None:
+    """
+    Centroide (97433) de la primera parcela de la manzana que tenga geometría.
+    """
+    for smp in sorted(almacen_parcelas.huellas_de_manzana(seccion, manzana)):
+        geo = almacen_parcelas.geometria(smp)
+        if geo is None:
+            continue
+        cx, cy = adc.geojson_centroid_xy(geo)
+        if cx is not None and cy is not None:
+            return cx, cy
+    return None
+
+
+def _frentes_de_manzana(seccion: str, manzana: str) -> dict[str, tuple[str, int]]:
+    """
+    clave_frente -> (calle, altura) de una dirección de ese frente, según las
+    direcciones de las parcelas del almacén ("DAVILA 1130").
+    """
+    frentes: dict[str, tuple[str, int]] = {}
+    for smp in sorted(almacen_parcelas.huellas_de_manzana(seccion, manzana)):
+        m = _RE_DIRECCION.match(str((almacen_parcelas.parcela(smp) or {}).get("direccion") or ""))
+        if m:
+            calle, altura = m.group(1).strip(), int(m.group(2))
+            frentes.setdefault(api_datos_utiles.clave_frente(calle, altura), (calle, altura))
+    return frentes
+
+
+def precargar_datos_utiles_manzana(seccion: str, manzana: str, limitador: LimitadorTasa,
+                                   forzar: bool = False) -> str:
+    """
+    estado: "en_cache" | "sin_geometria" | "cargada" | "error"
+    Sin forzar sólo se consultan los frentes que no están en cache.
+    """
+    clave = f"{seccion}-{manzana}"
+    manzana_en_cache = not forzar and api_datos_utiles.datos_utiles_de_smp(clave) is not None
+    frentes = [(c, a) for c, a in _frentes_de_manzana(seccion, manzana).values()
+               if forzar or not api_datos_utiles.frente_cacheado(c, a)]
+    if frentes:
+        for calle, altura in frentes:
+            limitador.esperar()
+            data = usig_datos_utiles_por_direccion(calle, altura)
+            if not api_datos_utiles.guardar_respuesta(calle, altura, clave, data):
+                return "error"
+        return "cargada"
+    if manzana_en_cache:
+        return "en_cache"
+
+    xy = _centroide_de_manzana(seccion, manzana)
+    if xy is None:
+        return "sin_geometria"
+    limitador.esperar()
+    data = usig_datos_utiles_por_xy(*xy)
+    if not isinstance(data, dict) or not data or "error" in data:
+        return "error"
+    api_datos_utiles.guardar_de_manzana(clave, data)
+    return "cargada"
+
+
+def precargar_datos_utiles(manzanas: list[tuple[str, str]], workers: int = 4, rps: float = RPS_DEFAULT,
+                           forzar: bool = False) -> dict[str, int]:
+    limitador = LimitadorTasa(rps, rafaga=max(1, workers))
+    estados: dict[str, int] = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="datos_utiles") as pool:
+        futuros = {pool.submit(precargar_datos_utiles_manzana, s, m, limitador, forzar): (s, m)
+                   for s, m in manzanas}
+        for fut in as_completed(futuros):
+            try:
+                estado = fut.result()
+            except Exception as e:
+                s, m = futuros[fut]
+                print(f"{s}-{m}: datos útiles: error {e}", file=sys.stderr)
+                estado = "error"
+            estados[estado] = estados.get(estado, 0) + 1
+    print(f"DATOS ÚTILES {estados}", file=sys.stderr)
+    return estados
+
+
+# ====== MAIN ======
+def _rango(spec: str) -> list[int]:
+    """
+    "1-5,44,60-62" -> [1, 2, 3, 4, 5, 44, 60, 61, 62]
+    """
+    out = []
+    for parte in spec.split(","):
+        parte = parte.strip()
+        if not parte:
+            continue
+        desde, _, hasta = parte.partition("-")
+        out.extend(range(int(desde), int(hasta or desde) + 1))
+    return out
+
+
+def manzanas_a_cosechar(secciones: str | None, manzanas: str | None, explicitas: list[str] | None,
+                        digitos_seccion: int = 3) -> list[tuple[str, str]]:
+    out = []
+    if secciones and manzanas:
+        for s in _rango(secciones):
+            for m in _rango(manzanas):
+                out.append((f"{s:0{digitos_seccion}d}", f"{m:03d}"))
+    for spec in explicitas or []:
+        seccion, _, manzana = spec.strip().upper().partition("-")
+        if seccion and manzana:
+            out.append((seccion, manzana))
+    # dedupe conservando el orden
+    vistos = set()
+    return [x for x in out if not (x in vistos or vistos.add(x))]
+
+
+def cosechar(manzanas: list[tuple[str, str]], workers: int = 4, rps: float = RPS_DEFAULT,
+             refrescar_dias: float = REFRESCAR_DIAS, forzar: bool = False,
+             max_huecos: int = MAX_HUECOS, reporte_cada_s: float = 10.0) -> dict:
+    limitador = LimitadorTasa(rps, rafaga=max(1, workers))
+    totales = {"manzanas": 0, "parcelas": 0, "geometrias": 0, "borradas": 0, "vencidas": 0, "errores": 0}
+    estados: dict[str, int] = {}
+    t0 = ultimo_reporte = time.monotonic()
+
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="cosecha") as pool:
+        futuros = {
+            pool.submit(cosechar_manzana, s, m, limitador, refrescar_dias * 86400, forzar, max_huecos): (s, m)
+            for s, m in manzanas
+        }
+        for fut in as_completed(futuros):
+            s, m = futuros[fut]
+            totales["manzanas"] += 1
+            try:
+                res = fut.result()
+            except Exception as e:
+                totales["errores"] += 1
+                print(f"{s}-{m}: error {e}", file=sys.stderr)
+                continue
+            estados[res["estado"]] = estados.get(res["estado"], 0) + 1
+            for k in ("parcelas", "geometrias", "borradas", "vencidas"):
+                totales[k] += res[k]
+
+            if time.monotonic() - ultimo_reporte >= reporte_cada_s:
+                ultimo_reporte = time.monotonic()
+                print(f"{totales['manzanas']}/{len(manzanas)} manzanas | {totales['parcelas']} parcelas | "
+                      f"{totales['geometrias']} geometrías | {estados}", file=sys.stderr)
+
+    totales["estados"] = estados
+    totales["segundos"] = round(time.monotonic() - t0, 1)
+    print(f"FIN {totales}", file=sys.stderr)
+    return totales
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Cosecha parcelas de Catastro (EPOK) al almacén local.")
+    p.add_argument("--secciones", help='rango de secciones, ej. "1-5,44"')
+    p.add_argument("--manzanas", help='rango de manzanas por sección, ej. "1-200"')
+    p.add_argument("--manzana", action="append", metavar="SECCION-MANZANA",
+                   help="manzana puntual (acepta letra, ej. 044-097A); repetible")
+    p.add_argument("--digitos-seccion", type=int, default=3)
+    p.add_argument("--workers", type=int, default=4, help="manzanas en paralelo")
+    p.add_argument("--rps", type=float, default=RPS_DEFAULT, help="tope de requests por segundo a EPOK")
+    p.add_argument("--refrescar-dias", type=float, default=REFRESCAR_DIAS,
+                   help="no volver a cosechar manzanas más nuevas que esto")
+    p.add_argument("--forzar", action="store_true", help="recosechar aunque estén frescas")
+    p.add_argument("--max-huecos", type=int, default=MAX_HUECOS,
+                   help="parcelas vacías seguidas antes de dar la manzana por terminada")
+    p.add_argument("--datos-utiles", action="store_true",
+                   help="precargar datos útiles por manzana (sin manzanas: todas las del almacén)")
+    args = p.parse_args(argv)
+
+    manzanas = manzanas_a_cosechar(args.secciones, args.manzanas, args.manzana, args.digitos_seccion)
+    if not manzanas and not args.datos_utiles:
+        raise SystemExit("Nada para cosechar: pasá --secciones y --manzanas, o --manzana")
+    if manzanas:
+        cosechar(manzanas, workers=args.workers, rps=args.rps, refrescar_dias=args.refrescar_dias,
+                 forzar=args.forzar, max_huecos=args.max_huecos)
+    if args.datos_utiles:
+        precargar_datos_utiles(manzanas or almacen_parcelas.manzanas_cosechadas(), workers=args.workers,
+                               rps=args.rps, forzar=args.forzar)
+
+
+if __name__ == "__main__":
+    main()
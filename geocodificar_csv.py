@@ -0,0 +1,250 @@
+# geocodificar_csv.py
+"""
+Geocodificación masiva: corre resolver_paquete_catastro sobre un CSV de direcciones.
+
+  python geocodificar_csv.py entrada.csv salida.jsonl --columna direccion --workers 8
+  python geocodificar_csv.py entrada.csv salida.csv
+
+- Lee el CSV en streaming y procesa con un pool de workers (ventana acotada).
+- Escribe cada resultado apenas está (CSV o JSONL según la extensión de salida).
+- Guarda un checkpoint (<salida>.checkpoint.json); si el proceso muere,
+  volver a correr el mismo comando retoma donde quedó. Al retomar también se
+  miran las filas que ya están en la salida (las escritas después del último
+  checkpoint no se repiten) y se descarta una última línea a medio escribir.
+- Informa throughput y ETA por stderr.
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from pathlib import Path
+
+import api_datos_catastrales as adc
+
+CAMPOS_CSV = ["fila", "direccion", "ok", "smp", "area_m2", "seccion", "manzana", "parcela", "error"]
+
+
+# ====== CHECKPOINT ======
+class Checkpoint:
+    """
+    Todas las filas < marca ya están escritas; `hechas` son las filas >= marca
+    terminadas fuera de orden (el pool no completa en orden).
+    """
+
+    def __init__(self, path: Path):
+        self.path = path
+        self.marca = 0
+        self.hechas: set[int] = set()
+        if path.exists():
+            data = json.loads(path.read_text(encoding="utf-8"))
+            self.marca = int(data.get("marca", 0))
+            self.hechas = set(data.get("hechas", []))
+
+    def ya_hecha(self, fila: int) -> bool:
+        return fila < self.marca or fila in self.hechas
+
+    def marcar(self, fila: int) -> None:
+        self.hechas.add(fila)
+        while self.marca in self.hechas:
+            self.hechas.remove(self.marca)
+            self.marca += 1
+
+    def guardar(self) -> None:
+        tmp = self.path.with_suffix(".tmp")
+        tmp.write_text(json.dumps({"marca": self.marca, "hechas": sorted(self.hechas)}), encoding="utf-8")
+        os.replace(tmp, self.path)
+
+    @property
+    def total_hechas(self) -> int:
+        return self.marca + len(self.hechas)
+
+
+# ====== SALIDA ======
+def _descartar_linea_incompleta(path: Path) -> None:
+    """
+    Si el proceso murió a mitad de un write, la última línea quedó cortada: se trunca.
+    """
+    with path.open("rb+") as f:
+        f.seek(0, os.SEEK_END)
+        tam = f.tell()
+        if tam == 0:
+            return
+        f.seek(max(0, tam - 65536))
+        cola = f.read()
+        if cola.endswith(b"\n"):
+            return
+        corte = cola.rfind(b"\n")
+        f.truncate(tam - len(cola) + corte + 1 if corte >= 0 else 0)
+
+
+def filas_escritas(path: Path) -> set[int]:
+    """
+    Números de fila que ya están en la salida (columna / clave "fila").
+    """
+    if not path.exists():
+        return set()
+    _descartar_linea_incompleta(path)
+    out: set[int] = set()
+    with path.open(encoding="utf-8", newline="") as f:
+        if path.suffix.lower() == ".csv":
+            filas = (row.get("fila") for row in csv.DictReader(f))
+        else:
+            filas = (json.loads(linea).get("fila") for linea in f if linea.strip())
+        for fila in filas:
+            try:
+                out.add(int(fila))
+            except (TypeError, ValueError):
+                continue
+    return out
+
+
+def _fila_csv(fila: int, direccion: str, res: dict) -> dict:
+    parcela = res.get("parcela") if isinstance(res.get("parcela"), dict) else {}
+    return {
+        "fila": fila,
+        "direccion": direccion,
+        "ok": res.get("ok"),
+        "smp": res.get("smp"),
+        "area_m2": res.get("area_m2"),
+        "seccion": parcela.get("seccion"),
+        "manzana": parcela.get("manzana"),
+        "parcela": parcela.get("parcela"),
+        "error": res.get("error"),
+    }
+
+
+class Salida:
+    def __init__(self, path: Path, con_debug: bool):
+        self.path = path
+        self.con_debug = con_debug
+        self.es_csv = path.suffix.lower() == ".csv"
+        nuevo = not path.exists() or path.stat().st_size == 0
+        self.f = path.open("a", encoding="utf-8", newline="")
+        if self.es_csv:
+            self.writer = csv.DictWriter(self.f, fieldnames=CAMPOS_CSV)
+            if nuevo:
+                self.writer.writeheader()
+
+    def escribir(self, fila: int, direccion: str, res: dict) -> None:
+        if self.es_csv:
+            self.writer.writerow(_fila_csv(fila, direccion, res))
+        else:
+            if not self.con_debug:
+                res = {k: v for k, v in res.items() if k != "debug"}
+            self.f.write(json.dumps({"fila": fila, "direccion": direccion, **res}, ensure_ascii=False) + "\n")
+        self.f.flush()
+
+    def cerrar(self) -> None:
+        self.f.close()
+
+
+# ====== MAIN ======
+def _resolver(direccion: str) -> dict:
+    try:
+        return adc.resolver_paquete_catastro(direccion)
+    except Exception as e:
+        return {"ok": False, "error": str(e)}
+
+
+def _contar_filas(path: Path) -> int:
+    with path.open(encoding="utf-8", newline="") as f:
+        return max(0, sum(1 for _ in csv.reader(f)) - 1)
+
+
+def _fmt_segundos(s: float) -> str:
+    s = int(s)
+    return f"{s // 3600:02d}:{s % 3600 // 60:02d}:{s % 60:02d}"
+
+
+def geocodificar_csv(entrada: Path, salida: Path, columna: str = "direccion", workers: int = 8,
+                     con_debug: bool = False, reporte_cada_s: float = 10.0) -> dict:
+    ckpt = Checkpoint(salida.with_name(salida.name + ".checkpoint.json"))
+    # la salida se escribe antes que el checkpoint: lo que esté en ella cuenta como hecho
+    for fila in filas_escritas(salida):
+        if not ckpt.ya_hecha(fila):
+            ckpt.marcar(fila)
+    total = _contar_filas(entrada)
+    ya = ckpt.total_hechas
+    if ya:
+        print(f"Retomando: {ya}/{total} filas ya procesadas", file=sys.stderr)
+
+    out = Salida(salida, con_debug)
+    procesadas = 0
+    t0 = ultimo_reporte = time.monotonic()
+
+    def reportar(final: bool = False):
+        dt = time.monotonic() - t0
+        ritmo = procesadas / dt if dt > 0 else 0.0
+        hechas = ckpt.total_hechas
+        eta = (total - hechas) / ritmo if ritmo > 0 else 0
+        print(
+            f"{'FIN ' if final else ''}{hechas}/{total} filas | {ritmo:.1f} filas/s | ETA {_fmt_segundos(eta)}",
+            file=sys.stderr,
+        )
+
+    try:
+        with entrada.open(encoding="utf-8", newline="") as f, \
+                ThreadPoolExecutor(max_workers=workers, thread_name_prefix="geocodificar") as pool:
+            reader = csv.DictReader(f)
+            if columna not in (reader.fieldnames or []):
+                raise SystemExit(f"La columna '{columna}' no está en {entrada} (hay: {reader.fieldnames})")
+
+            pendientes: dict = {}
+            filas = enumerate(reader)
+            agotado = False
+            while not agotado or pendientes:
+                # ventana acotada: nunca más de 2*workers filas en memoria
+                while not agotado and len(pendientes) < workers * 2:
+                    try:
+                        fila, row = next(filas)
+                    except StopIteration:
+                        agotado = True
+                        break
+                    if ckpt.ya_hecha(fila):
+                        continue
+                    direccion = (row.get(columna) or "").strip()
+                    pendientes[pool.submit(_resolver, direccion)] = (fila, direccion)
+
+                if not pendientes:
+                    continue
+                done, _ = wait(pendientes, return_when=FIRST_COMPLETED)
+                for fut in done:
+                    fila, direccion = pendientes.pop(fut)
+                    out.escribir(fila, direccion, fut.result())
+                    ckpt.marcar(fila)
+                    ckpt.guardar()
+                    procesadas += 1
+
+                if time.monotonic() - ultimo_reporte >= reporte_cada_s:
+                    ultimo_reporte = time.monotonic()
+                    reportar()
+    finally:
+        out.cerrar()
+
+    reportar(final=True)
+    return {"total": total, "procesadas": procesadas, "segundos": round(time.monotonic() - t0, 1)}
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Geocodifica un CSV de direcciones con Catastro (EPOK/USIG).")
+    p.add_argument("entrada", type=Path, help="CSV de entrada")
+    p.add_argument("salida", type=Path, help="salida .csv o .jsonl")
+    p.add_argument("--columna", default="direccion", help="columna con la dirección (default: direccion)")
+    p.add_argument("--workers", type=int, default=8)
+    p.add_argument("--con-debug", action="store_true", help="incluir el debug del resolver (sólo JSONL)")
+    p.add_argument("--reporte-cada", type=float, default=10.0, help="segundos entre reportes de progreso")
+    args = p.parse_args(argv)
+
+    geocodificar_csv(
+        args.entrada, args.salida, columna=args.columna, workers=args.workers,
+        con_debug=args.con_debug, reporte_cada_s=args.reporte_cada,
+    )
+
+
+if __name__ == "__main__":
+    main()
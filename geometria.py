@@ -0,0 +1,305 @@
+# geometria.py
+"""
+Métricas de geometrías GeoJSON planas (SRID 97433, metros) sin shapely:
+área, centroide ponderado por área, perímetro y bounding box, para
+Polygon / MultiPolygon con agujeros.
+
+Con NumPy instalado los lotes se calculan vectorizados (todos los anillos
+de todas las geometrías en un solo array); si no, cae a Python puro.
+"""
+from __future__ import annotations
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+
+def _geometria(geojson: dict) -> dict:
+    t = geojson.get("type")
+    if t == "FeatureCollection":
+        return geojson["features"][0]["geometry"]
+    if t == "Feature":
+        return geojson["geometry"]
+    return geojson
+
+
+def _anillos(geojson: dict) -> list[tuple[list, int]]:
+    """
+    Lista de (anillo, rol): rol = +1 exterior, -1 agujero.
+    """
+    geom = _geometria(geojson)
+    gt = geom.get("type")
+    coords = geom.get("coordinates") or []
+
+    if gt == "Polygon":
+        poligonos = [coords]
+    elif gt == "MultiPolygon":
+        poligonos = coords
+    else:
+        raise ValueError(f"Geometría no soportada: {gt}")
+
+    out = []
+    for poly in poligonos:
+        for i, ring in enumerate(poly):
+            if len(ring) < 3:
+                continue
+            ring = [(float(p[0]), float(p[1])) for p in ring]
+            if ring[0] != ring[-1]:
+                ring.append(ring[0])
+            out.append((ring, 1 if i == 0 else -1))
+    return out
+
+
+# ====== SUMAS POR ANILLO ======
+# Para cada anillo: (2*A con signo, 6*A*cx, 6*A*cy, perímetro, minx, miny, maxx, maxy, rx, ry)
+# Las sumas se hacen relativas al primer vértice (rx, ry): con coordenadas GKBA ~1e5
+# el producto cruzado en absoluto pierde precisión.
+
+def _sumas_anillo_py(ring: list) -> tuple:
+    rx, ry = ring[0]
+    ring = [(x - rx, y - ry) for x, y in ring]
+    a2 = cx6 = cy6 = perim = 0.0
+    for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+        cross = x0 * y1 - x1 * y0
+        a2 += cross
+        cx6 += (x0 + x1) * cross
+        cy6 += (y0 + y1) * cross
+        perim += ((x1 - x0) ** 2 + (y1 - y0) ** 2) ** 0.5
+    xs = [p[0] for p in ring]
+    ys = [p[1] for p in ring]
+    return a2, cx6, cy6, perim, min(xs) + rx, min(ys) + ry, max(xs) + rx, max(ys) + ry, rx, ry
+
+
+def _sumas_anillos_np(anillos: list[list]) -> list[tuple]:
+    """
+    Todos los anillos concatenados: un solo pasaje vectorizado y reduceat por anillo.
+    """
+    pts = [np.asarray(r, dtype=float) for r in anillos]
+    refs = np.array([p[0] for p in pts])
+    largos = [len(p) - 1 for p in pts]
+    ref_seg = np.repeat(refs, largos, axis=0)
+    a = np.concatenate([p[:-1] for p in pts]) - ref_seg
+    b = np.concatenate([p[1:] for p in pts]) - ref_seg
+    inicios = np.cumsum([0] + largos[:-1])
+
+    ax, ay, bx, by = a[:, 0], a[:, 1], b[:, 0], b[:, 1]
+    cross = ax * by - bx * ay
+    a2 = np.add.reduceat(cross, inicios)
+    cx6 = np.add.reduceat((ax + bx) * cross, inicios)
+    cy6 = np.add.reduceat((ay + by) * cross, inicios)
+    perim = np.add.reduceat(np.hypot(bx - ax, by - ay), inicios)
+    rx, ry = refs[:, 0], refs[:, 1]
+    minx = np.minimum.reduceat(ax, inicios) + rx
+    miny = np.minimum.reduceat(ay, inicios) + ry
+    maxx = np.maximum.reduceat(ax, inicios) + rx
+    maxy = np.maximum.reduceat(ay, inicios) + ry
+    return list(zip(a2.tolist(), cx6.tolist(), cy6.tolist(), perim.tolist(),
+                    minx.tolist(), miny.tolist(), maxx.tolist(), maxy.tolist(),
+                    rx.tolist(), ry.tolist()))
+
+
+def _combinar(sumas: list[tuple], roles: list[int]) -> dict:
+    area = mx = my = perim = 0.0
+    bbox = None
+    for (a2, cx6, cy6, p, x0, y0, x1, y1, rx, ry), rol in zip(sumas, roles):
+        signo = 1.0 if a2 >= 0 else -1.0
+        # exteriores suman, agujeros restan (sin importar la orientación del anillo);
+        # momento = A * (centroide local + referencia)
+        area += rol * abs(a2) / 2.0
+        mx += rol * signo * (cx6 / 6.0 + a2 / 2.0 * rx)
+        my += rol * signo * (cy6 / 6.0 + a2 / 2.0 * ry)
+        perim += p
+        if rol > 0:
+            bbox = [x0, y0, x1, y1] if bbox is None else [
+                min(bbox[0], x0), min(bbox[1], y0), max(bbox[2], x1), max(bbox[3], y1)
+            ]
+
+    area = max(0.0, area)
+    centroide = (mx / area, my / area) if area > 0 else (None, None)
+    return {"area": area, "centroide": centroide, "perimetro": perim, "bbox": bbox}
+
+
+# ====== API ======
+def metricas_lote(geojsons: list[dict]) -> list[dict]:
+    """
+    Métricas para muchas geometrías en una sola llamada.
+    Cada resultado: {"area", "centroide": (x, y), "perimetro", "bbox": [minx, miny, maxx, maxy]}
+    (perímetro = exteriores + agujeros). Geometrías inválidas -> {"error": "..."}.
+    """
+    por_geom: list[list[tuple[list, int]] | str] = []
+    for g in geojsons:
+        try:
+            por_geom.append(_anillos(g))
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError) as e:
+            por_geom.append(str(e) or type(e).__name__)
+
+    anillos = [ring for g in por_geom if not isinstance(g, str) for ring, _ in g]
+    if np is not None and anillos:
+        sumas = _sumas_anillos_np(anillos)
+    else:
+        sumas = [_sumas_anillo_py(r) for r in anillos]
+
+    out = []
+    i = 0
+    for g in por_geom:
+        if isinstance(g, str):
+            out.append({"error": g})
+            continue
+        n = len(g)
+        out.append(_combinar(sumas[i:i + n], [rol for _, rol in g]))
+        i += n
+    return out
+
+
+def metricas(geojson: dict) -> dict:
+    res = metricas_lote([geojson])[0]
+    if "error" in res:
+        raise ValueError(res["error"])
+    return res
+
+
+def area(geojson: dict) -> float:
+    return metricas(geojson)["area"]
+
+
+def centroide(geojson: dict) -> tuple[float | None, float | None]:
+    """
+    Centroide ponderado por área de todas las partes (descontando agujeros).
+    """
+    return metricas(geojson)["centroide"]
+
+
+# ====== SALIDA "DISPLAY" ======
+def _mapear_anillos(geojson: dict, fn) -> dict:
+    """
+    Copia del GeoJSON con fn(anillo) aplicada a cada anillo de cada Polygon/MultiPolygon
+    (respeta Feature / FeatureCollection; el resto de las propiedades se copia tal cual).
+    """
+    t = geojson.get("type")
+    if t == "FeatureCollection":
+        return {**geojson, "features": [_mapear_anillos(f, fn) for f in geojson.get("features") or []]}
+    if t == "Feature":
+        geom = geojson.get("geometry")
+        return {**geojson, "geometry": _mapear_anillos(geom, fn) if geom else geom}
+    if t == "Polygon":
+        return {**geojson, "coordinates": [fn(r) for r in geojson.get("coordinates") or []]}
+    if t == "MultiPolygon":
+        return {**geojson, "coordinates": [[fn(r) for r in poly] for poly in geojson.get("coordinates") or []]}
+    return geojson
+
+
+def _douglas_peucker(puntos: list, tol: float) -> list:
+    """
+    Douglas–Peucker iterativo sobre una polilínea abierta.
+    """
+    n = len(puntos)
+    if n < 3:
+        return list(puntos)
+    conservar = [False] * n
+    conservar[0] = conservar[-1] = True
+    tol2 = tol * tol
+    pila = [(0, n - 1)]
+    while pila:
+        i, j = pila.pop()
+        (x0, y0), (x1, y1) = puntos[i], puntos[j]
+        dx, dy = x1 - x0, y1 - y0
+        largo2 = dx * dx + dy * dy
+        dmax, kmax = -1.0, -1
+        for k in range(i + 1, j):
+            px, py = puntos[k]
+            if largo2 == 0:
+                d2 = (px - x0) ** 2 + (py - y0) ** 2
+            else:
+                cruz = dx * (py - y0) - dy * (px - x0)
+                d2 = cruz * cruz / largo2
+            if d2 > dmax:
+                dmax, kmax = d2, k
+        if kmax >= 0 and dmax > tol2:
+            conservar[kmax] = True
+            pila.append((i, kmax))
+            pila.append((kmax, j))
+    return [p for p, c in zip(puntos, conservar) if c]
+
+
+def simplificar_anillo(ring: list, tolerancia: float) -> list:
+    """
+    Simplifica un anillo cerrado. Lo parte en dos mitades (el primer vértice y el
+    más lejano a él) para que DP no colapse el anillo; si igual queda con menos
+    de 4 puntos, devuelve el original.
+    """
+    if tolerancia <= 0 or len(ring) < 5:
+        return ring
+    pts = [(float(p[0]), float(p[1])) for p in ring]
+    if pts[0] != pts[-1]:
+        pts.append(pts[0])
+    x0, y0 = pts[0]
+    lejos = max(range(len(pts) - 1), key=lambda k: (pts[k][0] - x0) ** 2 + (pts[k][1] - y0) ** 2)
+    if lejos == 0:
+        return ring
+    mitad1 = _douglas_peucker(pts[:lejos + 1], tolerancia)
+    mitad2 = _douglas_peucker(pts[lejos:], tolerancia)
+    out = mitad1[:-1] + mitad2
+    if len(out) < 4:
+        return ring
+    return [list(p) for p in out]
+
+
+def simplificar(geojson: dict, tolerancia: float) -> dict:
+    """
+    Douglas–Peucker con `tolerancia` en unidades de la geometría (metros en 97433).
+    """
+    return _mapear_anillos(geojson, lambda r: simplificar_anillo(r, tolerancia))
+
+
+def cuantizar(geojson: dict, decimales: int) -> dict:
+    """
+    Redondea coordenadas (en 97433, decimales=2 -> centímetros).
+    """
+    return _mapear_anillos(geojson, lambda r: [[round(p[0], decimales), round(p[1], decimales)] for p in r])
+
+
+def codificar_delta(geojson: dict, decimales: int) -> dict:
+    """
+    Codificación compacta estilo TopoJSON: coordenadas enteras (escala 10**decimales),
+    el primer punto de cada anillo relativo a "origen" y el resto como deltas
+    respecto del anterior. Cada anillo queda como lista plana [dx0, dy0, dx1, dy1, ...].
+    "origen" es la esquina mínima de todos los anillos de todas las features, y está
+    en las mismas unidades enteras que los deltas.
+    Decodificar: x = (origen_x + cumsum(dx)) / escala (ídem y), anillo por anillo.
+    """
+    escala = 10 ** decimales
+    xs: list[int] = []
+    ys: list[int] = []
+
+    def juntar(ring):
+        xs.extend(round(p[0] * escala) for p in ring)
+        ys.extend(round(p[1] * escala) for p in ring)
+        return ring
+
+    _mapear_anillos(geojson, juntar)
+    ox, oy = (min(xs), min(ys)) if xs else (0, 0)
+
+    def delta(ring):
+        out = []
+        px, py = ox, oy
+        for p in ring:
+            x, y = round(p[0] * escala), round(p[1] * escala)
+            out += [x - px, y - py]
+            px, py = x, y
+        return out
+
+    geom = _mapear_anillos(geojson, delta)
+    return {"codificacion": "delta", "escala": escala, "origen": [ox, oy], "geometria": geom}
+
+
+def para_display(geojson: dict, tolerancia: float = 0.5, decimales: int = 2,
+                 codificacion: str = "geojson") -> dict:
+    """
+    Geometría liviana para mostrar: simplificada + cuantizada, y opcionalmente
+    codificada en deltas enteros ("delta"). El área se calcula siempre sobre la exacta.
+    """
+    geom = simplificar(geojson, tolerancia)
+    if codificacion == "delta":
+        return codificar_delta(geom, decimales)
+    return cuantizar(geom, decimales)
@@ -0,0 +1,317 @@
+# http_client.py
+"""
+Cliente HTTP compartido para todos los módulos api_*.
+
+En vez de un requests.get "pelado" por llamada (handshake TCP+TLS cada vez),
+mantenemos una requests.Session por host con pool keep-alive, reintentos con
+backoff y timeouts propios de cada upstream (EPOK / USIG), más un circuit
+breaker y timeout adaptativo por servicio (circuito.py).
+Llamadas idénticas concurrentes (misma URL + params) comparten una sola
+request en vuelo (single-flight).
+"""
+from __future__ import annotations
+
+import os
+import threading
+import time
+from urllib.parse import urlsplit
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+import archivo_upstream
+import circuito
+import metricas
+
+# ====== CONFIG ======
+# timeout: (connect, read) en segundos
+DEFAULT_HOST_CONFIG = {
+    "pool_connections": 4,
+    "pool_maxsize": 16,
+    "retries": 2,
+    "backoff_factor": 0.3,
+    "status_forcelist": (502, 503, 504),
+    "timeout": (3.05, 30),
+}
+
+HOST_CONFIG: dict[str, dict] = {
+    "epok.buenosaires.gob.ar": {"pool_maxsize": 32, "timeout": (3.05, 30)},
+    "servicios.usig.buenosaires.gob.ar": {"pool_maxsize": 32, "timeout": (3.05, 15)},
+    "datosabiertos-usig-apis.buenosaires.gob.ar": {"timeout": (3.05, 15)},
+    "ws.usig.buenosaires.gob.ar": {"timeout": (3.05, 30)},
+}
+
+# Todo el tráfico upstream redirigido a un stub local (benchmarks / pruebas offline):
+#   UPSTREAM_STUB_URL=http://127.0.0.1:8765
+#   https://epok.buenosaires.gob.ar/catastro/parcela/?smp=...
+#     -> http://127.0.0.1:8765/epok.buenosaires.gob.ar/catastro/parcela/?smp=...
+# Ver stub_upstream.py.
+STUB_URL: str | None = os.environ.get("UPSTREAM_STUB_URL") or None
+
+_sessions: dict[str, requests.Session] = {}
+_lock = threading.Lock()
+
+# single-flight: clave de la request -> llamada en vuelo
+_en_vuelo: dict[tuple, "_Vuelo"] = {}
+_en_vuelo_lock = threading.Lock()
+
+
+def _host(url: str) -> str:
+    return (urlsplit(url).hostname or "").lower()
+
+
+def host_config(host: str) -> dict:
+    cfg = dict(DEFAULT_HOST_CONFIG)
+    cfg.update(HOST_CONFIG.get(host, {}))
+    return cfg
+
+
+def configurar_host(host: str, **opciones) -> None:
+    """
+    Ajusta pool/reintentos/timeout de un host.
+    Ej: configurar_host("epok.buenosaires.gob.ar", pool_maxsize=64, retries=0)
+    La sesión existente se descarta para que tome la nueva config.
+    """
+    host = host.lower()
+    with _lock:
+        HOST_CONFIG.setdefault(host, {}).update(opciones)
+        s = _sessions.pop(host, None)
+    if s is not None:
+        s.close()
+
+
+def usar_stub(base_url: str | None) -> None:
+    """
+    Redirige (o con None, deja de redirigir) todas las llamadas al stub en base_url.
+    """
+    global STUB_URL
+    STUB_URL = base_url.rstrip("/") if base_url else None
+    cerrar()
+
+
+def _url_destino(url: str) -> str:
+    if not STUB_URL:
+        return url
+    partes = urlsplit(url)
+    destino = f"{STUB_URL}/{partes.hostname}{partes.path}"
+    return f"{destino}?{partes.query}" if partes.query else destino
+
+
+def _nueva_session(host: str) -> requests.Session:
+    cfg = host_config(host)
+    # sin reintentos en urllib3: los hace _con_reintentos, que sabe del deadline del request
+    # (urllib3 le da a cada reintento el timeout entero, más backoff y Retry-After)
+    retry = Retry(total=0, read=False, respect_retry_after_header=False, raise_on_status=False)
+    adapter = HTTPAdapter(
+        pool_connections=cfg["pool_connections"],
+        pool_maxsize=cfg["pool_maxsize"],
+        max_retries=retry,
+    )
+    s = requests.Session()
+    s.mount("https://", adapter)
+    s.mount("http://", adapter)
+    return s
+
+
+def session_para(url: str) -> requests.Session:
+    host = _host(url)
+    s = _sessions.get(host)
+    if s is None:
+        with _lock:
+            s = _sessions.get(host)
+            if s is None:
+                s = _nueva_session(host)
+                _sessions[host] = s
+    return s
+
+
+class _Vuelo:
+    def __init__(self):
+        self.listo = threading.Event()
+        self.respuesta: requests.Response | None = None
+        self.error: BaseException | None = None
+
+
+def _clave_vuelo(url: str, params: dict | None, headers: dict | None) -> tuple:
+    return (
+        url,
+        tuple(sorted((str(k), str(v)) for k, v in (params or {}).items())),
+        tuple(sorted((str(k).lower(), str(v)) for k, v in (headers or {}).items())),
+    )
+
+
+def _desde_respaldo(modo: str, url: str, params: dict | None) -> requests.Response | None:
+    return archivo_upstream.respaldo(url, params) if modo == "respaldo" else None
+
+
+def get(url: str, params: dict | None = None, headers: dict | None = None,
+        timeout: float | tuple | None = None, servicio: str | None = None) -> requests.Response:
+    """
+    GET usando la sesión (pool keep-alive) del host.
+    Si ya hay en vuelo una llamada idéntica (misma URL, params y headers), no sale
+    otra: se espera esa y se devuelve su misma respuesta (o su misma excepción).
+    La respuesta es compartida: los callers la leen (r.json(), r.content), no la modifican.
+    Si no se pasa timeout, usa el configurado para el host; en los dos casos
+    circuito.timeout_para lo achica según la latencia observada y el deadline del request.
+    `servicio` es la etiqueta para métricas / Server-Timing / circuit breaker (default: el host).
+    Según archivo_upstream.modo() la respuesta se graba, o sale del archivo
+    (reproducir siempre; respaldo sólo si el upstream falla o su circuito está abierto).
+    Lanza las mismas excepciones que requests.get (circuito.CircuitoAbierto es un
+    ConnectionError y circuito.DeadlineExcedido un Timeout).
+    """
+    clave = _clave_vuelo(url, params, headers)
+    with _en_vuelo_lock:
+        vuelo = _en_vuelo.get(clave)
+        lider = vuelo is None
+        if lider:
+            vuelo = _en_vuelo[clave] = _Vuelo()
+
+    if not lider:
+        _esperar_vuelo(vuelo, servicio or _host(url))
+        if isinstance(vuelo.error, circuito.DeadlineExcedido):
+            # se le acabó el tiempo al request del líder, no necesariamente al nuestro
+            return get(url, params, headers, timeout, servicio)
+        if vuelo.error is not None:
+            raise vuelo.error
+        return vuelo.respuesta
+
+    try:
+        vuelo.respuesta = _get_upstream(url, params, headers, timeout, servicio)
+        return vuelo.respuesta
+    except BaseException as e:
+        vuelo.error = e
+        raise
+    finally:
+        with _en_vuelo_lock:
+            _en_vuelo.pop(clave, None)
+        vuelo.listo.set()
+
+
+def _esperar_vuelo(vuelo: _Vuelo, servicio: str) -> None:
+    t0 = time.perf_counter()
+    queda = circuito.restante()
+    if not vuelo.listo.wait(None if queda is None else max(0.0, queda)):
+        raise circuito.DeadlineExcedido(f"Deadline del request excedido esperando a {servicio}")
+    metricas.registrar_coalescida(servicio, time.perf_counter() - t0)
+
+
+def _get_upstream(url: str, params: dict | None, headers: dict | None,
+                  timeout: float | tuple | None, servicio: str | None) -> requests.Response:
+    host = _host(url)
+    servicio = servicio or host
+    if timeout is None:
+        timeout = host_config(host)["timeout"]
+    modo = archivo_upstream.modo()
+
+    t0 = time.perf_counter()
+    resultado = "error"
+    try:
+        if modo == "reproducir":
+            r = archivo_upstream.reproducir(url, params)
+            resultado = "archivo"
+            return r
+
+        try:
+            circuito.antes_de_llamar(servicio)
+        except (circuito.CircuitoAbierto, circuito.DeadlineExcedido) as e:
+            r = _desde_respaldo(modo, url, params)
+            if r is None:
+                resultado = "circuito_abierto" if isinstance(e, circuito.CircuitoAbierto) else "deadline"
+                raise
+            resultado = "archivo"
+            return r
+
+        sano = False
+        muestra = True
+        try:
+            r = _con_reintentos(url, params, headers, timeout, servicio)
+            sano = r.status_code < 500
+        except requests.exceptions.RequestException as e:
+            # cortada por el deadline del request (timeout_para achica el timeout a lo que
+            # queda): eso no dice que el upstream esté mal, no abre su circuito
+            muestra = not isinstance(e, circuito.DeadlineExcedido)
+            r = _desde_respaldo(modo, url, params)
+            if r is None:
+                if isinstance(e, circuito.DeadlineExcedido):
+                    resultado = "deadline"
+                    raise
+                queda = circuito.restante()
+                if queda is not None and queda <= 0:
+                    resultado = "deadline"
+                    raise circuito.DeadlineExcedido(f"Deadline del request excedido esperando a {servicio}") from e
+                raise
+            resultado = "archivo"
+            return r
+        finally:
+            if muestra:
+                circuito.registrar(servicio, time.perf_counter() - t0, sano)
+            else:
+                circuito.descartar(servicio)
+
+        resultado = "ok" if r.status_code < 400 else f"http_{r.status_code}"
+        if archivo_upstream.graba():
+            if r.status_code >= 500 and modo == "respaldo":
+                guardada = archivo_upstream.respaldo(url, params)
+                if guardada is not None:
+                    resultado = "archivo"
+                    return guardada
+            archivo_upstream.grabar(url, params, servicio, r, time.perf_counter() - t0)
+        return r
+    finally:
+        metricas.registrar_upstream(servicio, time.perf_counter() - t0, resultado)
+
+
+def _espera_reintento(backoff_factor: float, intento: int) -> float:
+    # mismo backoff que urllib3: el primer reintento sale enseguida, después 2x, 4x...
+    return 0.0 if intento <= 1 else backoff_factor * 2 ** (intento - 1)
+
+
+def _con_reintentos(url: str, params: dict | None, headers: dict | None,
+                    timeout: float | tuple, servicio: str) -> requests.Response:
+    """
+    GET con los reintentos del host (errores de red / status_forcelist, con backoff).
+    Antes de cada intento se mira lo que queda del deadline del request: si no alcanza
+    para el backoff no se reintenta, y cada intento recibe sólo el tiempo que queda.
+    Devuelve la última respuesta (aunque sea un 5xx) o lanza el último error
+    (circuito.DeadlineExcedido si lo que se venció fue el deadline).
+    """
+    cfg = host_config(_host(url))
+    session = session_para(url)
+    destino = _url_destino(url)
+    ultimo: requests.Response | requests.exceptions.RequestException | None = None
+    for intento in range(cfg["retries"] + 1):
+        if intento:
+            espera = _espera_reintento(cfg["backoff_factor"], intento)
+            queda = circuito.restante()
+            if queda is not None and queda <= espera:
+                if isinstance(ultimo, requests.exceptions.RequestException):
+                    raise circuito.DeadlineExcedido(
+                        f"Deadline del request excedido reintentando {servicio}") from ultimo
+                break
+            if espera:
+                time.sleep(espera)
+        try:
+            ultimo = session.get(destino, params=params, headers=headers,
+                                 timeout=circuito.timeout_para(servicio, timeout))
+        except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+            queda = circuito.restante()
+            if isinstance(e, requests.exceptions.Timeout) and queda is not None and queda <= 0:
+                # el timeout era lo que quedaba del deadline: se venció el request, no el upstream
+                raise circuito.DeadlineExcedido(
+                    f"Deadline del request excedido esperando a {servicio}") from e
+            ultimo = e
+            continue
+        if ultimo.status_code not in cfg["status_forcelist"]:
+            return ultimo
+    if isinstance(ultimo, requests.exceptions.RequestException):
+        raise ultimo
+    return ultimo
+
+
+def cerrar() -> None:
+    with _lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for s in sessions:
+        s.close()
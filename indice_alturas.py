@@ -0,0 +1,184 @@
+# indice_alturas.py
+"""
+Índice aprendido por calle: (cod_calle, altura) -> SMP.
+
+Cada lookup resuelto nos dice que tal altura de tal calle cae en tal parcela.
+Lo guardamos por cod_calle como puntos ordenados por altura; dos puntos
+consecutivos con el mismo SMP definen un intervalo [desde, hasta] que
+resuelve cualquier altura del medio sin ir a Catastro.
+
+Persistencia: SQLite (cache/indice_alturas.sqlite3), una fila por altura.
+Registrar una altura escribe sólo esa fila (upsert), así el índice no se
+reescribe entero en cada request y varios workers escriben sin pisarse.
+El índice en memoria se carga de ahí al primer uso.
+"""
+from __future__ import annotations
+
+import sqlite3
+import threading
+from bisect import bisect_left, insort
+from pathlib import Path
+
+INDICE_PATH = Path("cache") / "indice_alturas.sqlite3"
+
+# cod_calle -> lista ordenada de [altura, smp, direccion]
+_indice: dict[int, list[list]] = {}
+_cargado = False
+_lock = threading.RLock()
+_local = threading.local()
+
+
+# ====== SQLITE ======
+def _conexion() -> sqlite3.Connection:
+    conns = getattr(_local, "conns", None)
+    if conns is None:
+        conns = _local.conns = {}
+    conn = conns.get(INDICE_PATH)
+    if conn is None:
+        INDICE_PATH.parent.mkdir(parents=True, exist_ok=True)
+        conn = sqlite3.connect(str(INDICE_PATH), timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS alturas ("
+            " cod_calle INTEGER NOT NULL, altura INTEGER NOT NULL, smp TEXT NOT NULL, direccion TEXT,"
+            " PRIMARY KEY (cod_calle, altura))"
+        )
+        conns[INDICE_PATH] = conn
+    return conn
+
+
+def _cargar() -> None:
+    global _cargado
+    if _cargado:
+        return
+    with _lock:
+        if _cargado:
+            return
+        try:
+            for cod, altura, smp, direccion in _conexion().execute(
+                "SELECT cod_calle, altura, smp, direccion FROM alturas ORDER BY cod_calle, altura"
+            ):
+                _indice.setdefault(cod, []).append([altura, smp, direccion])
+        except sqlite3.Error:
+            # sin disco: el índice queda sólo en memoria
+            _indice.clear()
+        _cargado = True
+
+
+def _guardar(filas: list[tuple]) -> None:
+    if not filas:
+        return
+    try:
+        conn = _conexion()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO alturas (cod_calle, altura, smp, direccion) VALUES (?, ?, ?, ?)", filas
+            )
+    except sqlite3.Error:
+        pass
+
+
+# ====== ESCRITURA ======
+def _registrar(cod_calle: int, altura: int, smp: str, direccion: str | None) -> bool:
+    """
+    Actualiza el índice en memoria. True si cambió algo (hay que persistir).
+    """
+    with _lock:
+        puntos = _indice.setdefault(cod_calle, [])
+        alturas = [p[0] for p in puntos]
+        i = bisect_left(alturas, altura)
+        if i < len(puntos) and puntos[i][0] == altura:
+            if puntos[i][1] == smp and puntos[i][2] == direccion:
+                return False
+            puntos[i] = [altura, smp, direccion]
+        else:
+            insort(puntos, [altura, smp, direccion], key=lambda p: p[0])
+    return True
+
+
+def registrar(cod_calle: int, altura: int, smp: str, direccion: str | None = None) -> None:
+    """
+    Registra que (cod_calle, altura) cae en la parcela `smp`.
+    """
+    if not smp:
+        return
+    _cargar()
+    cod_calle, altura = int(cod_calle), int(altura)
+    if _registrar(cod_calle, altura, smp, direccion):
+        _guardar([(cod_calle, altura, smp, direccion)])
+
+
+def registrar_varios(cod_calle: int, items: list[dict]) -> None:
+    """
+    items: [{"altura": ..., "smp": ..., "direccion": ...}, ...]
+    (el formato de sugerir_alturas_validas_cercanas). Una sola escritura.
+    """
+    _cargar()
+    cod_calle = int(cod_calle)
+    filas = []
+    for it in items:
+        if it.get("altura") and it.get("smp"):
+            fila = (cod_calle, int(it["altura"]), it["smp"], it.get("direccion"))
+            if _registrar(*fila):
+                filas.append(fila)
+    _guardar(filas)
+
+
+# ====== LECTURA ======
+def smp_para_altura(cod_calle: int, altura: int) -> str | None:
+    """
+    SMP de una altura si es conocida, o si cae entre dos alturas conocidas
+    consecutivas que tienen el mismo SMP (mismo frente de parcela).
+    """
+    _cargar()
+    cod_calle, altura = int(cod_calle), int(altura)
+    with _lock:
+        # sólo puntos de la misma vereda (misma paridad)
+        puntos = [p for p in (_indice.get(cod_calle) or []) if p[0] % 2 == altura % 2]
+    if not puntos:
+        return None
+    alturas = [p[0] for p in puntos]
+    i = bisect_left(alturas, altura)
+    if i < len(puntos) and puntos[i][0] == altura:
+        return puntos[i][1]
+    if 0 < i < len(puntos) and puntos[i - 1][1] == puntos[i][1]:
+        return puntos[i][1]
+    return None
+
+
+def alturas_cercanas(cod_calle: int, altura: int, limit: int = 6, max_delta: int = 120,
+                     misma_vereda: bool = True) -> list[dict]:
+    """
+    Alturas válidas conocidas más cercanas a `altura` (orden por distancia).
+    Devuelve [{"altura", "smp", "direccion"}, ...].
+    """
+    _cargar()
+    cod_calle, altura = int(cod_calle), int(altura)
+    with _lock:
+        puntos = list(_indice.get(cod_calle) or [])
+    candidatos = [
+        p for p in puntos
+        if abs(p[0] - altura) <= max_delta and (not misma_vereda or p[0] % 2 == altura % 2)
+    ]
+    candidatos.sort(key=lambda p: (abs(p[0] - altura), p[0] > altura))
+    return [{"altura": p[0], "smp": p[1], "direccion": p[2]} for p in candidatos[:limit]]
+
+
+def intervalos(cod_calle: int) -> list[dict]:
+    """
+    Rangos de alturas conocidas por SMP (por vereda), para inspección/debug.
+    """
+    _cargar()
+    with _lock:
+        puntos = list(_indice.get(int(cod_calle)) or [])
+    out: list[dict] = []
+    for paridad in (0, 1):
+        actual = None
+        for alt, smp, direccion in (p for p in puntos if p[0] % 2 == paridad):
+            if actual and actual["smp"] == smp:
+                actual["hasta"] = alt
+            else:
+                actual = {"desde": alt, "hasta": alt, "smp": smp, "direccion": direccion}
+                out.append(actual)
+    return sorted(out, key=lambda r: r["desde"])
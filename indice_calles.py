@@ -0,0 +1,172 @@
+# indice_calles.py
+"""
+Índice offline de nombres de calles de CABA para el autocomplete.
+
+Se arma una vez desde el callejero (api_callejero_amba.obtener_callejero_partido),
+se guarda en disco y queda en memoria como un array ordenado de tokens
+(búsqueda por prefijo con bisect, sin acentos ni mayúsculas).
+"""
+from __future__ import annotations
+
+import json
+import os
+import re
+import threading
+import time
+from bisect import bisect_left
+from pathlib import Path
+
+from api_callejero_amba import obtener_callejero_partido
+from cache_local import sin_acentos
+
+CALLEJERO_PATH = Path("cache") / "callejero_caba.json"
+PARTIDO_CABA = "caba"
+# si la descarga del callejero falla, no reintentar antes de esto
+REINTENTO_S = 600
+
+_RE_TOKEN = re.compile(r"[a-z0-9]+")
+
+_lock = threading.Lock()
+_construyendo = False
+_ultimo_intento = -REINTENTO_S
+
+
+def _tokens(s: str) -> list[str]:
+    return _RE_TOKEN.findall(sin_acentos(s).lower())
+
+
+class IndiceCalles:
+    def __init__(self, calles: list[tuple[int | str | None, str]]):
+        # calles: [(cod_calle, nombre), ...]
+        self.calles = calles
+        self.nombres_norm = [" ".join(_tokens(nombre)) for _, nombre in calles]
+        self.tokens_por_calle = [set(n.split()) for n in self.nombres_norm]
+        # array ordenado (token, id_calle) para búsqueda por prefijo
+        self.tokens = sorted(
+            (tok, i) for i, toks in enumerate(self.tokens_por_calle) for tok in toks
+        )
+        self._solo_tokens = [t for t, _ in self.tokens]
+
+    def _ids_con_prefijo(self, prefijo: str) -> set[int]:
+        i = bisect_left(self._solo_tokens, prefijo)
+        ids = set()
+        while i < len(self.tokens) and self._solo_tokens[i].startswith(prefijo):
+            ids.add(self.tokens[i][1])
+            i += 1
+        return ids
+
+    def buscar(self, query: str, limit: int = 10) -> list[dict]:
+        """
+        Cada palabra de la query tiene que ser prefijo de alguna palabra del nombre.
+        Primero los nombres que empiezan con la query, después el resto (alfabético).
+        """
+        q_tokens = _tokens(query)
+        if not q_tokens:
+            return []
+
+        # arrancamos por el token más largo (el más selectivo)
+        q_tokens.sort(key=len, reverse=True)
+        ids = self._ids_con_prefijo(q_tokens[0])
+        for tok in q_tokens[1:]:
+            ids = {i for i in ids if any(t.startswith(tok) for t in self.tokens_por_calle[i])}
+
+        q_norm = " ".join(_tokens(query))
+        orden = sorted(ids, key=lambda i: (not self.nombres_norm[i].startswith(q_norm), self.nombres_norm[i]))
+
+        out = []
+        for i in orden[:limit]:
+            cod, nombre = self.calles[i]
+            out.append({
+                "label": nombre,
+                "nombre_calle": nombre,
+                "cod_calle": cod,
+                "altura": None,
+                "tipo": "calle",
+            })
+        return out
+
+    def __len__(self) -> int:
+        return len(self.calles)
+
+
+_indice: IndiceCalles | None = None
+
+
+def _parsear_callejero(data) -> list[tuple[int | str | None, str]]:
+    """
+    El callejero viene como lista de filas; según la versión del servicio cada fila
+    es una lista [cod, nombre, ...] o un dict. Nos quedamos con (cod_calle, nombre).
+    """
+    if isinstance(data, dict):
+        data = data.get("callejero") or data.get("calles") or data.get("instancias") or []
+
+    calles = []
+    for fila in data or []:
+        cod = nombre = None
+        if isinstance(fila, (list, tuple)) and len(fila) >= 2:
+            cod, nombre = fila[0], fila[1]
+        elif isinstance(fila, dict):
+            cod = fila.get("cod_calle") or fila.get("codigo") or fila.get("id")
+            nombre = fila.get("nombre_calle") or fila.get("nombre")
+        if isinstance(nombre, str) and nombre.strip():
+            calles.append((cod, nombre.strip()))
+
+    # dedupe conservando el orden
+    vistos = set()
+    return [c for c in calles if not (c in vistos or vistos.add(c))]
+
+
+def _guardar(calles) -> None:
+    CALLEJERO_PATH.parent.mkdir(parents=True, exist_ok=True)
+    tmp = CALLEJERO_PATH.with_suffix(f".{os.getpid()}.tmp")
+    tmp.write_text(json.dumps(calles, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, CALLEJERO_PATH)
+
+
+def construir(partido: str = PARTIDO_CABA) -> IndiceCalles | None:
+    """
+    Descarga el callejero, lo guarda en disco y reemplaza el índice en memoria.
+    """
+    global _indice
+    res = obtener_callejero_partido(partido)
+    calles = _parsear_callejero(res.get("callejero"))
+    if not calles:
+        return None
+    _guardar(calles)
+    _indice = IndiceCalles(calles)
+    return _indice
+
+
+def _construir_en_background() -> None:
+    global _construyendo
+    try:
+        construir()
+    except Exception:
+        pass
+    finally:
+        _construyendo = False
+
+
+def obtener_indice() -> IndiceCalles | None:
+    """
+    Índice listo para usar, o None si todavía no hay (en ese caso dispara
+    la construcción en un hilo y el caller sigue con USIG).
+    """
+    global _indice, _construyendo, _ultimo_intento
+    if _indice is not None:
+        return _indice
+
+    with _lock:
+        if _indice is not None:
+            return _indice
+        try:
+            calles = json.loads(CALLEJERO_PATH.read_text(encoding="utf-8"))
+            _indice = IndiceCalles([tuple(c) for c in calles])
+            return _indice
+        except (FileNotFoundError, ValueError, TypeError):
+            pass
+        if not _construyendo and time.monotonic() - _ultimo_intento > REINTENTO_S:
+            _construyendo = True
+            _ultimo_intento = time.monotonic()
+            threading.Thread(target=_construir_en_background, daemon=True).start()
+    return None
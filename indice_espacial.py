@@ -0,0 +1,262 @@
+# indice_espacial.py
+"""
+Índice espacial en memoria de las parcelas del almacén local (almacen_parcelas).
+
+STR-tree (Sort-Tile-Recursive) sobre los bounding boxes en GKBA (SRID 97433)
++ punto-en-polígono exacto (par-impar sobre todos los anillos, así los
+agujeros quedan afuera). Responde:
+
+  - punto -> SMP de la parcela que lo contiene
+  - parcela más cercana (con distancia en metros) para puntos en la calle
+  - lotes de puntos lat/lng
+
+Se arma en un hilo a partir del almacén y se rearma cada REFRESCO_S;
+mientras no esté, obtener_indice() devuelve None y los callers van a EPOK.
+"""
+from __future__ import annotations
+
+import heapq
+import math
+import threading
+import time
+
+import almacen_parcelas
+import geometria
+import proyeccion_gkba
+
+CAPACIDAD_NODO = 16
+# rearmar el índice (en background) si tiene más de esto
+REFRESCO_S = 3600
+
+_lock = threading.Lock()
+_indice: "IndiceEspacial | None" = None
+_armado_ts = float("-inf")
+_construyendo = False
+
+
+def _dist2_bbox(x: float, y: float, b: tuple) -> float:
+    dx = max(b[0] - x, 0.0, x - b[2])
+    dy = max(b[1] - y, 0.0, y - b[3])
+    return dx * dx + dy * dy
+
+
+def _contiene(b: tuple, x: float, y: float) -> bool:
+    return b[0] <= x <= b[2] and b[1] <= y <= b[3]
+
+
+def _union(bboxes) -> tuple:
+    bboxes = list(bboxes)
+    return (min(b[0] for b in bboxes), min(b[1] for b in bboxes),
+            max(b[2] for b in bboxes), max(b[3] for b in bboxes))
+
+
+def punto_en_anillos(x: float, y: float, anillos: list[list]) -> bool:
+    """
+    Regla par-impar sobre todos los anillos (exteriores y agujeros) de la geometría.
+    """
+    dentro = False
+    for ring in anillos:
+        x0, y0 = ring[-1]
+        for x1, y1 in ring:
+            if (y1 > y) != (y0 > y) and x < (x0 - x1) * (y - y1) / (y0 - y1) + x1:
+                dentro = not dentro
+            x0, y0 = x1, y1
+    return dentro
+
+
+def distancia_a_anillos(x: float, y: float, anillos: list[list]) -> float:
+    """
+    Distancia del punto al borde más cercano (0 si está adentro).
+    """
+    if punto_en_anillos(x, y, anillos):
+        return 0.0
+    mejor = math.inf
+    for ring in anillos:
+        for (x0, y0), (x1, y1) in zip(ring, ring[1:]):
+            dx, dy = x1 - x0, y1 - y0
+            largo2 = dx * dx + dy * dy
+            t = 0.0 if largo2 == 0 else max(0.0, min(1.0, ((x - x0) * dx + (y - y0) * dy) / largo2))
+            px, py = x0 + t * dx - x, y0 + t * dy - y
+            mejor = min(mejor, px * px + py * py)
+    return math.sqrt(mejor)
+
+
+class IndiceEspacial:
+    """
+    items: [(smp, bbox (minx, miny, maxx, maxy), anillos), ...] en SRID 97433.
+    """
+
+    def __init__(self, items: list[tuple[str, tuple, list]], capacidad: int = CAPACIDAD_NODO):
+        self.smps = [smp for smp, _, _ in items]
+        self.bboxes = [tuple(b) for _, b, _ in items]
+        self.anillos = [a for _, _, a in items]
+        self.capacidad = max(2, capacidad)
+        # nodos: (bbox, es_hoja, hijos) — en las hojas los hijos son índices de items
+        self.raiz = self._armar() if items else None
+
+    def __len__(self) -> int:
+        return len(self.smps)
+
+    # --- STR ---
+    def _empaquetar(self, entradas: list[tuple[tuple, object]], es_hoja: bool) -> list[tuple]:
+        """
+        entradas: [(bbox, hijo)]. Ordena por x del centro, corta en franjas verticales,
+        cada franja por y, y agrupa de a `capacidad`.
+        """
+        n = len(entradas)
+        cap = self.capacidad
+        hojas = math.ceil(n / cap)
+        franjas = max(1, math.ceil(math.sqrt(hojas)))
+        por_franja = franjas * cap
+
+        entradas = sorted(entradas, key=lambda e: e[0][0] + e[0][2])
+        nodos = []
+        for i in range(0, n, por_franja):
+            franja = sorted(entradas[i:i + por_franja], key=lambda e: e[0][1] + e[0][3])
+            for j in range(0, len(franja), cap):
+                grupo = franja[j:j + cap]
+                nodos.append((_union(b for b, _ in grupo), es_hoja, [h for _, h in grupo]))
+        return nodos
+
+    def _armar(self) -> tuple:
+        nivel = self._empaquetar([(b, i) for i, b in enumerate(self.bboxes)], es_hoja=True)
+        while len(nivel) > 1:
+            nivel = self._empaquetar([(nodo[0], nodo) for nodo in nivel], es_hoja=False)
+        return nivel[0]
+
+    # --- consultas (x, y en 97433) ---
+    def candidatos_xy(self, x: float, y: float) -> list[int]:
+        """
+        Índices de items cuyo bbox contiene el punto.
+        """
+        out = []
+        pila = [self.raiz] if self.raiz and _contiene(self.raiz[0], x, y) else []
+        while pila:
+            _, es_hoja, hijos = pila.pop()
+            if es_hoja:
+                out.extend(i for i in hijos if _contiene(self.bboxes[i], x, y))
+            else:
+                pila.extend(h for h in hijos if _contiene(h[0], x, y))
+        return out
+
+    def smp_en_xy(self, x: float, y: float) -> str | None:
+        for i in self.candidatos_xy(x, y):
+            if punto_en_anillos(x, y, self.anillos[i]):
+                return self.smps[i]
+        return None
+
+    def mas_cercana_xy(self, x: float, y: float, max_dist: float | None = None) -> tuple[str, float] | None:
+        """
+        (smp, distancia en metros) de la parcela más cercana (0 = la contiene).
+        Branch and bound: se recorren nodos por distancia al bbox y se corta
+        cuando el próximo bbox está más lejos que la mejor parcela encontrada.
+        """
+        if self.raiz is None:
+            return None
+        limite2 = math.inf if max_dist is None else max_dist * max_dist
+        mejor: tuple[str, float] | None = None
+        mejor_d = math.inf
+        cola = [(_dist2_bbox(x, y, self.raiz[0]), 0, False, self.raiz)]
+        contador = 1
+        while cola:
+            d2, _, es_item, nodo = heapq.heappop(cola)
+            if d2 > limite2 or d2 >= mejor_d * mejor_d:
+                break
+            if es_item:
+                d = distancia_a_anillos(x, y, self.anillos[nodo])
+                if d < mejor_d and d * d <= limite2:
+                    mejor, mejor_d = (self.smps[nodo], d), d
+                    if d == 0:
+                        break
+                continue
+            _, es_hoja, hijos = nodo
+            for h in hijos:
+                b = self.bboxes[h] if es_hoja else h[0]
+                heapq.heappush(cola, (_dist2_bbox(x, y, b), contador, es_hoja, h))
+                contador += 1
+        return mejor
+
+    # --- lat/lng ---
+    def smp_en_latlng(self, lat: float, lng: float) -> str | None:
+        return self.smp_en_xy(*proyeccion_gkba.lonlat_a_gkba(lng, lat))
+
+    def mas_cercana_latlng(self, lat: float, lng: float, max_dist: float | None = None) -> tuple[str, float] | None:
+        return self.mas_cercana_xy(*proyeccion_gkba.lonlat_a_gkba(lng, lat), max_dist=max_dist)
+
+    def lote_latlng(self, puntos: list[tuple[float, float]], max_dist: float | None = 0.0) -> list[dict | None]:
+        """
+        puntos: [(lat, lng), ...]. max_dist=0 -> sólo parcelas que contienen el punto;
+        >0 -> la más cercana dentro de esa distancia (m); None -> la más cercana sin tope.
+        Cada resultado: {"smp", "distancia_m"} o None.
+        """
+        xy = proyeccion_gkba.lonlat_a_gkba_lote([(lng, lat) for lat, lng in puntos])
+        out = []
+        for x, y in xy:
+            if max_dist == 0:
+                smp = self.smp_en_xy(x, y)
+                out.append({"smp": smp, "distancia_m": 0.0} if smp else None)
+            else:
+                res = self.mas_cercana_xy(x, y, max_dist)
+                out.append({"smp": res[0], "distancia_m": round(res[1], 2)} if res else None)
+        return out
+
+
+# ====== ÍNDICE GLOBAL (desde el almacén) ======
+def construir() -> IndiceEspacial | None:
+    """
+    Arma el índice con todas las parcelas con geometría del almacén y lo publica.
+    """
+    global _indice, _armado_ts
+    items = []
+    for smp, bbox, geojson in almacen_parcelas.iterar_geometrias():
+        try:
+            anillos = [ring for ring, _ in geometria._anillos(geojson)]
+        except (ValueError, KeyError, TypeError, IndexError, AttributeError):
+            continue
+        if anillos:
+            items.append((smp, bbox, anillos))
+    if not items:
+        # sin marcar _armado_ts: se vuelve a intentar apenas la cosecha cargue algo
+        return None
+    _indice = IndiceEspacial(items)
+    _armado_ts = time.monotonic()
+    return _indice
+
+
+def _construir_en_background() -> None:
+    global _construyendo
+    try:
+        construir()
+    except Exception:
+        pass
+    finally:
+        _construyendo = False
+
+
+def obtener_indice() -> IndiceEspacial | None:
+    """
+    Índice listo para usar, o None si todavía no hay almacén / no terminó de armarse.
+    Si está viejo, lo rearma en un hilo y mientras tanto sigue sirviendo el anterior.
+    """
+    global _construyendo
+    if not almacen_parcelas.disponible():
+        return _indice
+    if time.monotonic() - _armado_ts > REFRESCO_S and not _construyendo:
+        with _lock:
+            if not _construyendo and time.monotonic() - _armado_ts > REFRESCO_S:
+                _construyendo = True
+                threading.Thread(target=_construir_en_background, daemon=True).start()
+    return _indice
+
+
+def parcela_en_latlng(lat: float, lng: float, max_dist: float = 0.0) -> tuple[str, float] | None:
+    """
+    (smp, distancia_m) local, o None si no hay índice o no hay parcela a <= max_dist metros.
+    """
+    indice = obtener_indice()
+    if indice is None:
+        return None
+    if max_dist == 0:
+        smp = indice.smp_en_latlng(lat, lng)
+        return (smp, 0.0) if smp else None
+    return indice.mas_cercana_latlng(lat, lng, max_dist)
@@ -0,0 +1,73 @@
+# json_rapido.py
+"""
+Serialización JSON rápida: usa orjson si está instalado y si no cae a json.
+También expone un JSONProvider para Flask (app.json = JSONProviderRapido(app)).
+orjson es opcional (ver requirements.txt): pip install orjson
+"""
+from __future__ import annotations
+
+import json
+
+from flask.json.provider import DefaultJSONProvider
+
+try:
+    import orjson
+except ImportError:  # orjson es opcional
+    orjson = None
+
+_OPCIONES_ORJSON = (orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY) if orjson else 0
+
+
+def dumps(obj) -> str:
+    if orjson is not None:
+        return orjson.dumps(obj, default=str, option=_OPCIONES_ORJSON).decode("utf-8")
+    return json.dumps(obj, ensure_ascii=False, default=str)
+
+
+def loads(s: str | bytes):
+    if orjson is not None:
+        return orjson.loads(s)
+    return json.loads(s)
+
+
+def _opciones_orjson(kwargs: dict) -> int | None:
+    """
+    Traduce los kwargs de json.dumps que manda Flask a opciones de orjson,
+    o None si hay alguno sin equivalente (y entonces se usa json).
+      separators=(",", ":")  -> lo que orjson hace siempre
+      indent=2               -> OPT_INDENT_2 (modo debug / compact=False)
+      sort_keys=True         -> OPT_SORT_KEYS
+    """
+    opciones = _OPCIONES_ORJSON
+    for k, v in kwargs.items():
+        if k == "separators" and tuple(v) == (",", ":"):
+            continue
+        if k == "indent" and v in (None, 2):
+            opciones |= orjson.OPT_INDENT_2 if v else 0
+        elif k == "sort_keys":
+            opciones |= orjson.OPT_SORT_KEYS if v else 0
+        elif k == "ensure_ascii" and not v:
+            continue
+        else:
+            return None
+    return opciones
+
+
+class JSONProviderRapido(DefaultJSONProvider):
+    """
+    Igual que el provider default de Flask pero serializando con orjson cuando está.
+    (No ordena claves: el orden es el de armado de la respuesta.)
+    """
+    sort_keys = False
+    ensure_ascii = False
+
+    def dumps(self, obj, **kwargs) -> str:
+        opciones = None if orjson is None else _opciones_orjson(kwargs)
+        if opciones is None:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=str, option=opciones).decode("utf-8")
+
+    def loads(self, s, **kwargs):
+        if orjson is None or kwargs:
+            return super().loads(s, **kwargs)
+        return loads(s)
@@ -0,0 +1,185 @@
+# metricas.py
+"""
+Instrumentación de llamadas a upstream (USIG / EPOK).
+
+- Por request: cada llamada queda anotada en un contextvar y se resume
+  en el header Server-Timing (ver app.py).
+- Agregado del proceso: histogramas de latencia y contadores por
+  servicio/resultado, en formato Prometheus para /metrics.
+"""
+from __future__ import annotations
+
+import contextvars
+import threading
+from collections import defaultdict
+
+import cache_local
+
+# buckets de latencia (segundos)
+BUCKETS_S = (0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# resultados que no cuentan como error ("archivo" = contestado desde archivo_upstream,
+# "coalescida" = compartió la respuesta de una llamada idéntica en vuelo)
+RESULTADOS_OK = frozenset({"ok", "archivo", "coalescida"})
+
+_llamadas_request: contextvars.ContextVar[list | None] = contextvars.ContextVar(
+    "llamadas_request", default=None
+)
+
+_lock = threading.Lock()
+
+
+class _Histograma:
+    def __init__(self):
+        self.buckets = [0] * len(BUCKETS_S)
+        self.suma = 0.0
+        self.cuenta = 0
+
+    def observar(self, segundos: float) -> None:
+        self.suma += segundos
+        self.cuenta += 1
+        for i, limite in enumerate(BUCKETS_S):
+            if segundos <= limite:
+                self.buckets[i] += 1
+
+
+_upstream_latencia: dict[str, _Histograma] = defaultdict(_Histograma)
+_upstream_total: dict[tuple[str, str], int] = defaultdict(int)
+_http_latencia: dict[str, _Histograma] = defaultdict(_Histograma)
+_http_total: dict[tuple[str, int], int] = defaultdict(int)
+_upstream_coalescidas: dict[str, int] = defaultdict(int)
+
+
+# ====== REGISTRO ======
+def registrar_upstream(servicio: str, segundos: float, resultado: str) -> None:
+    """
+    resultado: "ok", "http_<status>", "error" (excepción de red/timeout)
+    o "archivo" (respuesta servida desde archivo_upstream).
+    """
+    with _lock:
+        _upstream_latencia[servicio].observar(segundos)
+        _upstream_total[(servicio, resultado)] += 1
+    llamadas = _llamadas_request.get()
+    if llamadas is not None:
+        llamadas.append((servicio, segundos, resultado))
+
+
+def registrar_coalescida(servicio: str, segundos: float) -> None:
+    """
+    Llamada que no salió a la red porque se sumó a una idéntica en vuelo (single-flight).
+    No entra en los histogramas de upstream (no es carga para USIG/EPOK),
+    pero sí en el Server-Timing del request (es tiempo que esperó).
+    """
+    with _lock:
+        _upstream_coalescidas[servicio] += 1
+    llamadas = _llamadas_request.get()
+    if llamadas is not None:
+        llamadas.append((servicio, segundos, "coalescida"))
+
+
+def coalescidas() -> dict[str, int]:
+    with _lock:
+        return dict(_upstream_coalescidas)
+
+
+def registrar_http(endpoint: str, segundos: float, status: int) -> None:
+    with _lock:
+        _http_latencia[endpoint].observar(segundos)
+        _http_total[(endpoint, status)] += 1
+
+
+# ====== POR REQUEST ======
+def iniciar_request() -> None:
+    _llamadas_request.set([])
+
+
+def llamadas_request() -> list[tuple[str, float, str]]:
+    return list(_llamadas_request.get() or [])
+
+
+def submit(executor, fn, *args, **kwargs):
+    """
+    executor.submit que propaga el contexto del request al hilo del pool
+    (así las llamadas hechas en paralelo también cuentan en su Server-Timing).
+    """
+    ctx = contextvars.copy_context()
+    return executor.submit(ctx.run, fn, *args, **kwargs)
+
+
+def server_timing(total_s: float | None = None) -> str:
+    """
+    'epok_geometria;dur=123.4;desc="1x", usig_normalizar;dur=45.0;desc="1x", total;dur=180.2'
+    (dur = suma de las llamadas a ese servicio, en ms).
+    """
+    por_servicio: dict[str, list] = {}
+    for servicio, segundos, resultado in llamadas_request():
+        acc = por_servicio.setdefault(servicio, [0.0, 0, 0])
+        acc[0] += segundos
+        acc[1] += 1
+        acc[2] += resultado not in RESULTADOS_OK
+
+    partes = []
+    for servicio, (seg, n, errores) in por_servicio.items():
+        desc = f"{n}x" + (f", {errores} err" if errores else "")
+        partes.append(f'{servicio};dur={seg * 1000:.1f};desc="{desc}"')
+    if total_s is not None:
+        partes.append(f"total;dur={total_s * 1000:.1f}")
+    return ", ".join(partes)
+
+
+# ====== PROMETHEUS ======
+def _etiquetas(**kv) -> str:
+    return "{" + ",".join(f'{k}="{str(v)}"' for k, v in kv.items()) + "}"
+
+
+def _histograma_prometheus(nombre: str, etiqueta: str, datos: dict[str, _Histograma]) -> list[str]:
+    out = [f"# TYPE {nombre} histogram"]
+    for clave, h in sorted(datos.items()):
+        # h.buckets ya es acumulativo (cada observación suma en todos los le >= valor)
+        for limite, n in zip(BUCKETS_S, h.buckets):
+            out.append(f"{nombre}_bucket{_etiquetas(**{etiqueta: clave, 'le': limite})} {n}")
+        out.append(f"{nombre}_bucket{_etiquetas(**{etiqueta: clave, 'le': '+Inf'})} {h.cuenta}")
+        out.append(f"{nombre}_sum{_etiquetas(**{etiqueta: clave})} {h.suma:.6f}")
+        out.append(f"{nombre}_count{_etiquetas(**{etiqueta: clave})} {h.cuenta}")
+    return out
+
+
+def prometheus() -> str:
+    with _lock:
+        lineas = [
+            "# HELP upstream_request_duration_seconds Latencia de llamadas a USIG/EPOK.",
+            *_histograma_prometheus("upstream_request_duration_seconds", "servicio", _upstream_latencia),
+            "# HELP upstream_requests_total Llamadas a USIG/EPOK por resultado.",
+            "# TYPE upstream_requests_total counter",
+            *(
+                f"upstream_requests_total{_etiquetas(servicio=s, resultado=r)} {n}"
+                for (s, r), n in sorted(_upstream_total.items())
+            ),
+            "# HELP upstream_coalesced_total Llamadas resueltas con la respuesta de una idéntica en vuelo.",
+            "# TYPE upstream_coalesced_total counter",
+            *(
+                f"upstream_coalesced_total{_etiquetas(servicio=s)} {n}"
+                for s, n in sorted(_upstream_coalescidas.items())
+            ),
+            "# HELP http_request_duration_seconds Latencia de los endpoints propios.",
+            *_histograma_prometheus("http_request_duration_seconds", "endpoint", _http_latencia),
+            "# HELP http_requests_total Requests a los endpoints propios por status.",
+            "# TYPE http_requests_total counter",
+            *(
+                f"http_requests_total{_etiquetas(endpoint=e, status=st)} {n}"
+                for (e, st), n in sorted(_http_total.items())
+            ),
+        ]
+
+    caches = cache_local.estadisticas()
+    lineas += ["# HELP cache_requests_total Lookups por cache y resultado.", "# TYPE cache_requests_total counter"]
+    for nombre, st in sorted(caches.items()):
+        lineas.append(f"cache_requests_total{_etiquetas(cache=nombre, resultado='hit_memoria')} {st['hits_memoria']}")
+        lineas.append(f"cache_requests_total{_etiquetas(cache=nombre, resultado='hit_disco')} {st['hits_disco']}")
+        lineas.append(f"cache_requests_total{_etiquetas(cache=nombre, resultado='miss')} {st['misses']}")
+    lineas += ["# HELP cache_hit_ratio Hits / lookups por cache.", "# TYPE cache_hit_ratio gauge"]
+    for nombre, st in sorted(caches.items()):
+        if st["hit_rate"] is not None:
+            lineas.append(f"cache_hit_ratio{_etiquetas(cache=nombre)} {st['hit_rate']}")
+
+    return "\n".join(lineas) + "\n"
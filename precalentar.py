@@ -0,0 +1,226 @@
+# precalentar.py
+"""
+Precalentamiento de caches después de un deploy / reinicio.
+
+Toma las claves más pedidas del tráfico reciente (archivo_upstream, tabla llamadas:
+hace falta haber corrido en modo grabar o respaldo) y/o de una lista fija
+(PRECALENTAR_LISTA, JSON {"direcciones": [...], "smps": [...], "prefijos": [...]})
+y las pasa por la misma capa de cache que usan los requests:
+
+  direcciones  -> adc.resolve_smp_from_address (cache de normalizar + índice de alturas)
+  smps         -> cache_parcelas (parcela + geometría + área/centroides)
+  prefijos     -> api_buscador_caba.sugerir_calles_caba (cache de autocomplete)
+
+Sólo se consulta lo que no está ya en cache, con tope de RPS items por segundo.
+Con PRECALENTAR=1 corre al arrancar la app (iniciar()) y después cada CADA_S;
+el progreso y la cobertura (qué fracción de las claves calientes está en cache)
+salen en estado() / GET /precalentar/estado.
+
+  python precalentar.py --top 200 --rps 2
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import re
+import sys
+import threading
+import time
+from pathlib import Path
+
+import api_buscador_caba as abc
+import api_datos_catastrales as adc
+import archivo_upstream
+import cache_local
+import cache_parcelas
+import indice_calles
+from cosechar_parcelas import LimitadorTasa
+
+HABILITADO = (os.environ.get("PRECALENTAR") or "").strip().lower() in ("1", "true", "si")
+LISTA_PATH = Path(os.environ["PRECALENTAR_LISTA"]) if os.environ.get("PRECALENTAR_LISTA") else None
+CADA_S = 6 * 3600
+RPS = 2.0
+TOP_N = 500
+VENTANA_DIAS = 7
+
+TIPOS = ("direcciones", "smps", "prefijos")
+
+_RE_DIGITO = re.compile(r"\d")
+
+_estado: dict = {"corriendo": False, "corridas": 0}
+_lock = threading.Lock()
+_hilo: threading.Thread | None = None
+
+
+# ====== CLAVES ======
+def _lista_configurada(path: Path | None) -> dict[str, list[str]]:
+    if path is None or not path.exists():
+        return {}
+    try:
+        data = json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return {}
+    return {t: [str(v) for v in data.get(t) or []] for t in TIPOS} if isinstance(data, dict) else {}
+
+
+def objetivos(top_n: int = TOP_N, ventana_dias: float = VENTANA_DIAS,
+              lista: Path | None = None) -> dict[str, list[str]]:
+    """
+    Claves a precalentar por tipo: primero las de la lista fija, después las
+    más pedidas del archivo de tráfico (sin repetir, como mucho top_n de tráfico).
+    """
+    desde = time.time() - ventana_dias * 86400
+    trafico = {
+        "direcciones": archivo_upstream.frecuentes("usig_normalizar", "direccion", desde, top_n),
+        "smps": archivo_upstream.frecuentes("epok_parcela", "smp", desde, top_n),
+        "prefijos": archivo_upstream.frecuentes("usig_autocomplete", "direccion", desde, top_n),
+    }
+    fija = _lista_configurada(lista if lista is not None else LISTA_PATH)
+
+    out = {}
+    for tipo in TIPOS:
+        vistos: set[str] = set()
+        claves = []
+        for valor in fija.get(tipo, []) + [v for v, _ in trafico[tipo]]:
+            clave = valor.strip().upper() if tipo == "smps" else cache_local.canonizar_direccion(valor)
+            if clave and clave not in vistos:
+                vistos.add(clave)
+                claves.append(valor.strip())
+        out[tipo] = claves
+    return out
+
+
+# ====== COBERTURA ======
+def _en_cache(tipo: str, valor: str) -> bool:
+    if tipo == "smps":
+        return cache_parcelas.fresca(valor.upper())
+    clave = cache_local.canonizar_direccion(valor)
+    if tipo == "direcciones":
+        return adc.CACHE_NORMALIZAR.get(clave, contar=False) is not None
+    # prefijos sin altura ni cruce los contesta el índice de calles (si está armado)
+    if (not _RE_DIGITO.search(valor) and not abc.es_interseccion(valor)
+            and indice_calles.obtener_indice() is not None):
+        return True
+    return abc.CACHE_AUTOCOMPLETE.get(clave, contar=False) is not None
+
+
+def cobertura(objs: dict[str, list[str]]) -> dict[str, dict]:
+    out = {}
+    for tipo, valores in objs.items():
+        n = sum(_en_cache(tipo, v) for v in valores)
+        out[tipo] = {"claves": len(valores), "en_cache": n,
+                     "ratio": round(n / len(valores), 4) if valores else None}
+    return out
+
+
+# ====== PRECALENTAR ======
+def _calentar(tipo: str, valor: str, smps_extra: list[str]) -> bool:
+    """
+    False si el upstream no dio nada cacheable (dirección sin SMP, parcela incompleta...).
+    """
+    if tipo == "direcciones":
+        smp, _ = adc.resolve_smp_from_address(valor, hedge_delay=adc.HEDGE_DELAY_S, debug=False)
+        if smp:
+            smps_extra.append(smp)
+        return smp is not None
+    if tipo == "smps":
+        return cache_parcelas.refrescar(valor.upper(), remoto=False) is not None
+    return "error" not in abc.sugerir_calles_caba(valor, contar=False)
+
+
+def precalentar(top_n: int = TOP_N, rps: float = RPS, ventana_dias: float = VENTANA_DIAS,
+                lista: Path | None = None, reporte_cada_s: float | None = None) -> dict:
+    """
+    Una pasada completa. Devuelve (y deja en estado()) progreso y cobertura antes / después.
+    Los SMPs que salen de resolver las direcciones se suman a los de la pasada.
+    Por tipo, "ultimo_error" guarda la última clave que falló y por qué.
+    reporte_cada_s: cada cuánto imprimir el progreso a stderr (None = nunca; lo usa el CLI).
+    """
+    objs = objetivos(top_n, ventana_dias, lista)
+    antes = cobertura(objs)
+    limitador = LimitadorTasa(rps)
+    t0 = ultimo_reporte = time.monotonic()
+    progreso = {t: {"pendientes": 0, "calentadas": 0, "sin_resultado": 0, "errores": 0, "ultimo_error": None}
+                for t in TIPOS}
+    _estado.update({"inicio": time.time(), "fin": None, "cobertura_antes": antes,
+                    "cobertura_despues": None, "progreso": progreso})
+
+    smps_extra: list[str] = []
+    for tipo in TIPOS:
+        valores = objs[tipo]
+        if tipo == "smps":
+            vistos = {v.upper() for v in valores}
+            valores = valores + [s for s in smps_extra if not (s in vistos or vistos.add(s))]
+            objs["smps"] = valores
+        pendientes = [v for v in valores if not _en_cache(tipo, v)]
+        progreso[tipo]["pendientes"] = len(pendientes)
+
+        for valor in pendientes:
+            limitador.esperar()
+            try:
+                progreso[tipo]["calentadas" if _calentar(tipo, valor, smps_extra) else "sin_resultado"] += 1
+            except Exception as e:
+                progreso[tipo]["errores"] += 1
+                progreso[tipo]["ultimo_error"] = {"clave": valor, "error": f"{type(e).__name__}: {e}"}
+            if reporte_cada_s is not None and time.monotonic() - ultimo_reporte >= reporte_cada_s:
+                ultimo_reporte = time.monotonic()
+                print(f"precalentar: {progreso}", file=sys.stderr)
+
+    _estado.update({"fin": time.time(), "segundos": round(time.monotonic() - t0, 1),
+                    "cobertura_despues": cobertura(objs)})
+    return estado()
+
+
+# ====== EN LA APP ======
+def _correr_para_siempre(cada_s: float) -> None:
+    while True:
+        _estado["corriendo"] = True
+        try:
+            precalentar()
+        except Exception as e:
+            _estado["ultimo_error"] = str(e)
+        finally:
+            _estado["corriendo"] = False
+            _estado["corridas"] += 1
+        time.sleep(cada_s)
+
+
+def iniciar(cada_s: float = CADA_S) -> None:
+    """
+    Arranca (una sola vez por proceso) el hilo que precalienta al inicio y cada cada_s.
+    """
+    global _hilo
+    with _lock:
+        if _hilo is not None and _hilo.is_alive():
+            return
+        _hilo = threading.Thread(target=_correr_para_siempre, args=(cada_s,), daemon=True, name="precalentar")
+        _hilo.start()
+
+
+def estado() -> dict:
+    return json.loads(json.dumps(_estado))
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Precalienta los caches con las claves más pedidas.")
+    p.add_argument("--top", type=int, default=TOP_N, help="claves por tipo tomadas del tráfico")
+    p.add_argument("--rps", type=float, default=RPS, help="tope de claves calentadas por segundo")
+    p.add_argument("--ventana-dias", type=float, default=VENTANA_DIAS, help="tráfico de los últimos N días")
+    p.add_argument("--lista", type=Path, default=None, help='JSON {"direcciones": [...], "smps": [...], "prefijos": [...]}')
+    args = p.parse_args(argv)
+
+    res = precalentar(args.top, args.rps, args.ventana_dias, args.lista, reporte_cada_s=10.0)
+    if all(not v["claves"] for v in res["cobertura_antes"].values()):
+        print("Sin claves: grabá tráfico (UPSTREAM_MODO=grabar / respaldo) o pasá --lista", file=sys.stderr)
+    for tipo in TIPOS:
+        a, d = res["cobertura_antes"][tipo], res["cobertura_despues"][tipo]
+        print(f"{tipo:<12} {d['claves']:>6} claves | en cache {a['en_cache']} -> {d['en_cache']} | "
+              f"calentadas {res['progreso'][tipo]['calentadas']} | sin resultado {res['progreso'][tipo]['sin_resultado']} | "
+              f"errores {res['progreso'][tipo]['errores']}")
+        if res["progreso"][tipo]["ultimo_error"]:
+            print(f"{'':<12} último error: {res['progreso'][tipo]['ultimo_error']}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,168 @@
+# proyeccion_gkba.py
+"""
+Gauss-Krüger Buenos Aires (GKBA, SRID 97433) <-> WGS84 lon/lat, local y sin red.
+
+Es la definición que usa USIG (la misma que publican para proj4):
+  +proj=tmerc +lat_0=-34.629269 +lon_0=-58.4633 +k=0.9999980000000001
+  +x_0=100000 +y_0=100000 +ellps=intl +units=m +no_defs
+
+Implementación: Transversa Mercator con las series de Krüger hasta n^4
+(precisión submilimétrica a la escala de CABA).
+
+Los lotes (*_lote) con NumPy instalado se convierten vectorizados, todos los
+puntos juntos; si no, punto por punto con las mismas fórmulas.
+"""
+from __future__ import annotations
+
+import math
+
+try:
+    import numpy as np
+except ImportError:  # NumPy es opcional
+    np = None
+
+# ====== PARÁMETROS GKBA ======
+LAT_0 = -34.629269
+LON_0 = -58.4633
+K_0 = 0.9999980000000001
+X_0 = 100000.0
+Y_0 = 100000.0
+
+# Elipsoide Internacional 1924 (+ellps=intl)
+_A = 6378388.0
+_F = 1 / 297.0
+
+# ====== CONSTANTES DE LA SERIE ======
+_N = _F / (2 - _F)
+_N2, _N3, _N4 = _N ** 2, _N ** 3, _N ** 4
+_RADIO_RECTIFICANTE = _A / (1 + _N) * (1 + _N2 / 4 + _N4 / 64)
+_KA = K_0 * _RADIO_RECTIFICANTE
+_E_2RAIZ = 2 * math.sqrt(_N) / (1 + _N)
+
+_ALFA = (
+    _N / 2 - 2 * _N2 / 3 + 5 * _N3 / 16 + 41 * _N4 / 180,
+    13 * _N2 / 48 - 3 * _N3 / 5 + 557 * _N4 / 1440,
+    61 * _N3 / 240 - 103 * _N4 / 140,
+    49561 * _N4 / 161280,
+)
+_BETA = (
+    _N / 2 - 2 * _N2 / 3 + 37 * _N3 / 96 - _N4 / 360,
+    _N2 / 48 + _N3 / 15 - 437 * _N4 / 1440,
+    17 * _N3 / 480 - 37 * _N4 / 840,
+    4397 * _N4 / 161280,
+)
+_DELTA = (
+    2 * _N - 2 * _N2 / 3 - 2 * _N3 + 116 * _N4 / 45,
+    7 * _N2 / 3 - 8 * _N3 / 5 - 227 * _N4 / 45,
+    56 * _N3 / 15 - 136 * _N4 / 35,
+    4279 * _N4 / 630,
+)
+
+_LON_0_RAD = math.radians(LON_0)
+
+
+def _xi_eta(lon: float, lat: float) -> tuple[float, float]:
+    phi = math.radians(lat)
+    dlam = math.radians(lon) - _LON_0_RAD
+    sin_phi = math.sin(phi)
+    t = math.sinh(math.atanh(sin_phi) - _E_2RAIZ * math.atanh(_E_2RAIZ * sin_phi))
+    xi_p = math.atan2(t, math.cos(dlam))
+    eta_p = math.atanh(math.sin(dlam) / math.sqrt(1 + t * t))
+
+    xi, eta = xi_p, eta_p
+    for j, a in enumerate(_ALFA, start=1):
+        xi += a * math.sin(2 * j * xi_p) * math.cosh(2 * j * eta_p)
+        eta += a * math.cos(2 * j * xi_p) * math.sinh(2 * j * eta_p)
+    return xi, eta
+
+
+_XI_0, _ = _xi_eta(LON_0, LAT_0)
+
+
+def lonlat_a_gkba(lon: float, lat: float) -> tuple[float, float]:
+    """
+    WGS84 (lon, lat) en grados -> GKBA (x, y) en metros.
+    """
+    xi, eta = _xi_eta(lon, lat)
+    return X_0 + _KA * eta, Y_0 + _KA * (xi - _XI_0)
+
+
+def gkba_a_lonlat(x: float, y: float) -> tuple[float, float]:
+    """
+    GKBA (x, y) en metros -> WGS84 (lon, lat) en grados.
+    """
+    xi = (y - Y_0) / _KA + _XI_0
+    eta = (x - X_0) / _KA
+
+    xi_p, eta_p = xi, eta
+    for j, b in enumerate(_BETA, start=1):
+        xi_p -= b * math.sin(2 * j * xi) * math.cosh(2 * j * eta)
+        eta_p -= b * math.cos(2 * j * xi) * math.sinh(2 * j * eta)
+
+    chi = math.asin(math.sin(xi_p) / math.cosh(eta_p))
+    phi = chi
+    for j, d in enumerate(_DELTA, start=1):
+        phi += d * math.sin(2 * j * chi)
+
+    lam = _LON_0_RAD + math.atan2(math.sinh(eta_p), math.cos(xi_p))
+    return math.degrees(lam), math.degrees(phi)
+
+
+# ====== LOTES ======
+def _como_array(puntos):
+    return np.asarray(list(puntos), dtype=float).reshape(-1, 2)
+
+
+def _lonlat_a_gkba_np(lon, lat):
+    phi = np.radians(lat)
+    dlam = np.radians(lon) - _LON_0_RAD
+    sin_phi = np.sin(phi)
+    t = np.sinh(np.arctanh(sin_phi) - _E_2RAIZ * np.arctanh(_E_2RAIZ * sin_phi))
+    xi_p = np.arctan2(t, np.cos(dlam))
+    eta_p = np.arctanh(np.sin(dlam) / np.sqrt(1 + t * t))
+
+    xi, eta = xi_p.copy(), eta_p.copy()
+    for j, a in enumerate(_ALFA, start=1):
+        xi += a * np.sin(2 * j * xi_p) * np.cosh(2 * j * eta_p)
+        eta += a * np.cos(2 * j * xi_p) * np.sinh(2 * j * eta_p)
+    return X_0 + _KA * eta, Y_0 + _KA * (xi - _XI_0)
+
+
+def _gkba_a_lonlat_np(x, y):
+    xi = (y - Y_0) / _KA + _XI_0
+    eta = (x - X_0) / _KA
+
+    xi_p, eta_p = xi.copy(), eta.copy()
+    for j, b in enumerate(_BETA, start=1):
+        xi_p -= b * np.sin(2 * j * xi) * np.cosh(2 * j * eta)
+        eta_p -= b * np.cos(2 * j * xi) * np.sinh(2 * j * eta)
+
+    chi = np.arcsin(np.sin(xi_p) / np.cosh(eta_p))
+    phi = chi.copy()
+    for j, d in enumerate(_DELTA, start=1):
+        phi += d * np.sin(2 * j * chi)
+
+    lam = _LON_0_RAD + np.arctan2(np.sinh(eta_p), np.cos(xi_p))
+    return np.degrees(lam), np.degrees(phi)
+
+
+def gkba_a_lonlat_lote(puntos) -> list[tuple[float, float]]:
+    """
+    puntos: iterable de (x, y) GKBA -> lista de (lon, lat).
+    """
+    if np is None:
+        return [gkba_a_lonlat(float(x), float(y)) for x, y in puntos]
+    xy = _como_array(puntos)
+    lon, lat = _gkba_a_lonlat_np(xy[:, 0], xy[:, 1])
+    return list(zip(lon.tolist(), lat.tolist()))
+
+
+def lonlat_a_gkba_lote(puntos) -> list[tuple[float, float]]:
+    """
+    puntos: iterable de (lon, lat) -> lista de (x, y) GKBA.
+    """
+    if np is None:
+        return [lonlat_a_gkba(float(lon), float(lat)) for lon, lat in puntos]
+    ll = _como_array(puntos)
+    x, y = _lonlat_a_gkba_np(ll[:, 0], ll[:, 1])
+    return list(zip(x.tolist(), y.tolist()))
@@ -0,0 +1,441 @@
+# stub_upstream.py
+"""
+Stub local de USIG / EPOK para medir performance sin depender de las APIs de la Ciudad.
+
+  python stub_upstream.py --port 8765 --latencia-ms 80 --tasa-error 0.01
+  UPSTREAM_STUB_URL=http://127.0.0.1:8765 python app.py
+
+Las URLs llegan con el host original como primer segmento del path
+(ver http_client.STUB_URL): /epok.buenosaires.gob.ar/catastro/parcela/?smp=...
+
+Sirve normalizar, catastro/parcela, catastro/geometria, catastroinformal,
+datos_utiles, convertir_coordenadas, reversegeocoding y el callejero.
+Las respuestas se arman a partir de los dumps de salida_epok_test/*.json:
+la dirección del fixture (DAVILA 1130) devuelve exactamente lo grabado y
+cualquier otra "CALLE ALTURA" genera una parcela sintética determinística.
+
+Cada altura con (altura % 100) >= ALTURA_HUECO_DESDE no tiene parcela:
+así el camino de alturas cercanas se puede ejercitar a voluntad.
+"""
+from __future__ import annotations
+
+import argparse
+import copy
+import json
+import random
+import re
+import threading
+import time
+import zlib
+from dataclasses import dataclass, field
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from urllib.parse import parse_qs, urlsplit
+
+import proyeccion_gkba
+
+FIXTURES_DIR = Path("salida_epok_test")
+ALTURA_HUECO_DESDE = 80
+# vértices por lado de la parcela sintética (para que simplificar tenga trabajo)
+VERTICES_POR_LADO = 12
+
+# calles del callejero sintético (además de las del fixture)
+CALLES_BASE = [
+    "AV. RIVADAVIA", "AV. CORRIENTES", "AV. SANTA FE", "AV. CORDOBA", "AV. DE MAYO",
+    "AV. BELGRANO", "AV. INDEPENDENCIA", "AV. SAN JUAN", "AV. JUAN B. JUSTO", "AV. CABILDO",
+    "AV. LA PLATA", "AV. ACOYTE", "AV. DIRECTORIO", "AV. PEDRO GOYENA", "BOEDO",
+    "MEXICO", "VENEZUELA", "TUCUMAN", "LAVALLE", "FLORIDA", "MAIPU", "ESMERALDA",
+    "SUIPACHA", "PARAGUAY", "URUGUAY", "TALCAHUANO", "MITRE, BARTOLOME", "PERU", "BOLIVAR",
+    "DEFENSA", "CHACABUCO", "PIEDRAS", "TACUARI", "SALTA", "SANTIAGO DEL ESTERO",
+    "DAVILA", "VIDAL", "CONDARCO", "NAZCA", "EMILIO MITRE", "JOSE BONIFACIO",
+]
+
+
+@dataclass
+class Latencia:
+    media_ms: float = 50.0
+    # sigma de la lognormal (0 = latencia fija)
+    jitter: float = 0.5
+    tasa_error: float = 0.0
+
+    def demorar(self) -> None:
+        if self.media_ms <= 0:
+            return
+        ms = self.media_ms
+        if self.jitter > 0:
+            # lognormal con media `media_ms`
+            ms = self.media_ms * random.lognormvariate(-self.jitter ** 2 / 2, self.jitter)
+        time.sleep(ms / 1000.0)
+
+    def falla(self) -> bool:
+        return self.tasa_error > 0 and random.random() < self.tasa_error
+
+
+@dataclass
+class ConfigStub:
+    default: Latencia = field(default_factory=Latencia)
+    # overrides por servicio (ver _RUTAS): {"epok_geometria": Latencia(200, 0.3, 0.05)}
+    # Los nombres son las etiquetas servicio= de http_client (las de /metrics).
+    por_servicio: dict[str, Latencia] = field(default_factory=dict)
+
+    def para(self, servicio: str) -> Latencia:
+        return self.por_servicio.get(servicio, self.default)
+
+
+# ====== FIXTURES ======
+def _cargar_fixture() -> tuple[dict, dict]:
+    """
+    (dirección USIG, parcela EPOK) grabadas en debug_resolver_smp.json.
+    """
+    dbg = json.loads((FIXTURES_DIR / "debug_resolver_smp.json").read_text(encoding="utf-8"))
+    return dbg["usig_direccion_elegida"], dbg["catastro_parcela_por_codcalle_altura"]
+
+
+class Mundo:
+    """
+    Calles, direcciones y parcelas sintéticas. Todo sale de (cod_calle, altura),
+    así dos corridas del stub contestan lo mismo.
+    """
+
+    def __init__(self):
+        self.dir_fixture, self.parcela_fixture = _cargar_fixture()
+        self.cod_fixture = int(self.dir_fixture["cod_calle"])
+        self.calle_fixture = self.dir_fixture["nombre_calle"]
+        self.altura_fixture = int(self.dir_fixture["altura"])
+        self._lock = threading.Lock()
+        # lo ya servido: cod_calle -> nombre, smp -> (cod_calle, altura), lat/lng -> (cod_calle, altura)
+        self._nombres: dict[int, str] = {cod: nombre for cod, nombre in self.callejero()}
+        self._por_smp: dict[str, tuple[int, int]] = {}
+        self._por_punto: dict[tuple[float, float], tuple[int, int]] = {}
+
+    # --- calles
+    def cod_calle(self, nombre: str) -> int:
+        nombre = nombre.strip().upper()
+        if nombre == self.calle_fixture:
+            return self.cod_fixture
+        return 10_000 + zlib.crc32(nombre.encode("utf-8")) % 90_000
+
+    def callejero(self) -> list[list]:
+        return [[self.cod_calle(n), n] for n in sorted(set(CALLES_BASE) | {self.calle_fixture})]
+
+    # --- direcciones
+    def lat_lng(self, cod: int, altura: int) -> tuple[float, float]:
+        if (cod, altura) == (self.cod_fixture, self.altura_fixture):
+            c = self.dir_fixture["coordenadas"]
+            return float(c["y"]), float(c["x"])
+        # caja de CABA, determinística por calle y corrida por altura
+        h = zlib.crc32(str(cod).encode())
+        lat = -34.70 + (h % 10_000) / 10_000 * 0.16 + altura * 1e-6
+        lng = -58.52 + (h // 10_000 % 10_000) / 10_000 * 0.18 + altura * 1e-6
+        return round(lat, 6), round(lng, 6)
+
+    def direccion_normalizada(self, calle: str, altura: int) -> dict:
+        calle = calle.strip().upper()
+        cod = self.cod_calle(calle)
+        lat, lng = self.lat_lng(cod, altura)
+        with self._lock:
+            self._nombres.setdefault(cod, calle)
+            self._por_punto[(lat, lng)] = (cod, altura)
+        d = copy.deepcopy(self.dir_fixture)
+        d.update({
+            "altura": altura,
+            "cod_calle": cod,
+            "coordenadas": {"srid": 4326, "x": f"{lng:.6f}", "y": f"{lat:.6f}"},
+            "direccion": f"{calle} {altura}, CABA",
+            "nombre_calle": calle,
+        })
+        return d
+
+    def punto(self, lat: float, lng: float) -> tuple[int, int] | None:
+        with self._lock:
+            return self._por_punto.get((round(lat, 6), round(lng, 6)))
+
+    # --- parcelas
+    @staticmethod
+    def tiene_parcela(altura: int) -> bool:
+        return altura > 0 and altura % 100 < ALTURA_HUECO_DESDE
+
+    def smp(self, cod: int, altura: int) -> str:
+        if (cod, altura) == (self.cod_fixture, self.altura_fixture):
+            return self.parcela_fixture["smp"]
+        seccion = cod % 90 + 1
+        # veredas opuestas = manzanas distintas
+        manzana = (cod * 7 + (altura // 100) * 2 + altura % 2) % 1000
+        parcela = (altura % 100) // 4 + 1
+        return f"{seccion:03d}-{manzana:03d}-{parcela:03d}"
+
+    def parcela(self, cod: int, altura: int) -> dict:
+        if not self.tiene_parcela(altura):
+            return {}
+        smp = self.smp(cod, altura)
+        with self._lock:
+            self._por_smp[smp] = (cod, altura)
+        if (cod, altura) == (self.cod_fixture, self.altura_fixture):
+            return copy.deepcopy(self.parcela_fixture)
+
+        seccion, manzana, parcela = smp.split("-")
+        lat, lng = self.lat_lng(cod, altura)
+        calle = self._nombres.get(cod, f"CALLE {cod}")
+        p = copy.deepcopy(self.parcela_fixture)
+        p.update({
+            "direccion": f"{calle} {altura}",
+            "smp": smp,
+            "seccion": seccion,
+            "manzana": manzana,
+            "parcela": parcela,
+            "centroide": [lng, lat],
+            "smp_anterior": f"{seccion}-{manzana}-{max(1, int(parcela) - 1):03d}",
+            "smp_siguiente": f"{seccion}-{manzana}-{int(parcela) + 1:03d}",
+        })
+        return p
+
+    def parcela_por_smp(self, smp: str) -> dict:
+        with self._lock:
+            clave = self._por_smp.get(smp)
+        if clave is None:
+            return {}
+        return self.parcela(*clave)
+
+    def geometria(self, smp: str) -> dict:
+        """
+        Rectángulo frente x fondo (SRID 97433) alrededor del centroide de la parcela,
+        con VERTICES_POR_LADO puntos por lado.
+        """
+        p = self.parcela_por_smp(smp)
+        if not p:
+            return {"type": "FeatureCollection", "features": []}
+        lng, lat = p["centroide"]
+        cx, cy = proyeccion_gkba.lonlat_a_gkba(float(lng), float(lat))
+        fx = float(p.get("frente") or 10) / 2
+        fy = float(p.get("fondo") or 30) / 2
+        esquinas = [(cx - fx, cy - fy), (cx + fx, cy - fy), (cx + fx, cy + fy), (cx - fx, cy + fy)]
+        anillo = []
+        for (x0, y0), (x1, y1) in zip(esquinas, esquinas[1:] + esquinas[:1]):
+            for k in range(VERTICES_POR_LADO):
+                t = k / VERTICES_POR_LADO
+                anillo.append([round(x0 + (x1 - x0) * t, 3), round(y0 + (y1 - y0) * t, 3)])
+        anillo.append(anillo[0])
+        return {
+            "type": "FeatureCollection",
+            "features": [{
+                "type": "Feature",
+                "geometry": {"type": "MultiPolygon", "coordinates": [[anillo]]},
+                "properties": {"smp": smp},
+            }],
+        }
+
+
+# ====== HANDLERS ======
+_RE_CALLE_ALTURA = re.compile(r"^\s*(.*\D)\s+(\d{1,5})\s*$")
+
+
+def _normalizar(mundo: Mundo, q: dict) -> dict:
+    texto = (q.get("direccion") or "").split(",")[0].strip()
+    m = _RE_CALLE_ALTURA.match(texto)
+    if m:
+        return {"direccionesNormalizadas": [mundo.direccion_normalizada(m.group(1), int(m.group(2)))]}
+
+    # sin altura: calles que contienen el texto
+    t = texto.upper()
+    out = []
+    for cod, nombre in mundo.callejero():
+        if t and t in nombre:
+            d = mundo.direccion_normalizada(nombre, 0)
+            d.update({"altura": None, "direccion": f"{nombre}, CABA", "tipo": "calle", "coordenadas": None})
+            out.append(d)
+    return {"direccionesNormalizadas": out[:10]}
+
+
+def _parcela(mundo: Mundo, q: dict) -> dict:
+    if q.get("smp"):
+        return mundo.parcela_por_smp(q["smp"])
+    cod = q.get("codigo_calle") or q.get("cod_calle")
+    if cod and q.get("altura"):
+        return mundo.parcela(int(cod), int(q["altura"]))
+    if q.get("lat") and q.get("lng"):
+        clave = mundo.punto(float(q["lat"]), float(q["lng"]))
+        return mundo.parcela(*clave) if clave else {}
+    return {}
+
+
+def _datos_utiles(mundo: Mundo, q: dict) -> dict:
+    semilla = q.get("calle") or q.get("x") or ""
+    comuna = zlib.crc32(str(semilla).encode()) % 15 + 1
+    return {
+        "comuna": f"Comuna {comuna}",
+        "barrio": "FLORES",
+        "codigo_postal": "1406",
+        "codigo_postal_argentino": "C1406GZB",
+        "comisaria": f"{comuna}A",
+        "area_hospitalaria": "HOSPITAL ALVAREZ",
+        "region_sanitaria": "IV",
+        "distrito_escolar": "VIII",
+        "seccion_catastral": f"{zlib.crc32(str(semilla).encode()) % 90 + 1:03d}",
+    }
+
+
+def _convertir(mundo: Mundo, q: dict) -> dict:
+    x, y = float(q["x"]), float(q["y"])
+    if (q.get("output") or "").lower() == "lonlat":
+        rx, ry = proyeccion_gkba.gkba_a_lonlat(x, y)
+    else:
+        rx, ry = proyeccion_gkba.lonlat_a_gkba(x, y)
+    return {"tipo_resultado": "Ok", "resultado": {"x": str(rx), "y": str(ry)}}
+
+
+def _servicio_normalizar(q: dict) -> str:
+    # adc.usig_normalizar pide geocodificar; el autocomplete (api_buscador_caba) no
+    return "usig_normalizar" if "geocodificar" in q else "usig_autocomplete"
+
+
+def _servicio_parcela(q: dict) -> str:
+    if q.get("smp"):
+        return "epok_parcela"
+    if q.get("codigo_calle") or q.get("cod_calle"):
+        return "epok_parcela_codcalle"
+    return "epok_parcela_latlng_aprox" if "aprox" in q else "epok_parcela_latlng"
+
+
+# (prefijo de path, servicio, handler). El servicio es la misma etiqueta que pasa el
+# cliente a http_client.get(servicio=...) para esa llamada (un str, o una función de
+# los parámetros cuando el mismo endpoint se usa con varias etiquetas), así se
+# pueden configurar latencias / errores por servicio con los nombres de /metrics.
+_RUTAS = [
+    ("/servicios.usig.buenosaires.gob.ar/normalizar", _servicio_normalizar, _normalizar),
+    ("/servicios.usig.buenosaires.gob.ar/callejero-amba/callejero", "usig_callejero",
+     lambda m, q: m.callejero()),
+    ("/epok.buenosaires.gob.ar/catastro/parcela", _servicio_parcela, _parcela),
+    ("/epok.buenosaires.gob.ar/catastro/geometria", "epok_geometria",
+     lambda m, q: m.geometria(q.get("smp") or "")),
+    ("/epok.buenosaires.gob.ar/catastroinformal", "epok_catastroinformal", lambda m, q: {}),
+    ("/datosabiertos-usig-apis.buenosaires.gob.ar/datos_utiles", "usig_datos_utiles", _datos_utiles),
+    ("/ws.usig.buenosaires.gob.ar/rest/convertir_coordenadas", "usig_convertir_coordenadas", _convertir),
+    ("/ws.usig.buenosaires.gob.ar/geocoder/2.2/reversegeocoding", "usig_geocoder", lambda m, q: {}),
+]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, como los upstream reales
+    # headers y body salen en dos writes: sin esto Nagle + delayed ACK suman ~40 ms
+    disable_nagle_algorithm = True
+
+    def do_GET(self):
+        partes = urlsplit(self.path)
+        q = {k: v[-1] for k, v in parse_qs(partes.query, keep_blank_values=True).items()}
+        ruta = next((r for r in _RUTAS if partes.path.startswith(r[0])), None)
+        if ruta is None:
+            return self._responder(404, {"error": f"ruta no soportada por el stub: {partes.path}"})
+
+        _, servicio, handler = ruta
+        if callable(servicio):
+            servicio = servicio(q)
+        lat = self.server.config.para(servicio)
+        lat.demorar()
+        falla = lat.falla()
+        self.server.contar(servicio, falla)
+        if falla:
+            return self._responder(503, {"error": "error inyectado por el stub"})
+        try:
+            return self._responder(200, handler(self.server.mundo, q))
+        except (KeyError, ValueError, TypeError) as e:
+            return self._responder(400, {"error": str(e)})
+
+    def _responder(self, status: int, obj) -> None:
+        body = json.dumps(obj, ensure_ascii=False).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+# ====== SERVIDOR ======
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self, direccion: tuple[str, int], config: ConfigStub):
+        super().__init__(direccion, _Handler)
+        self.config = config
+        self.mundo = Mundo()
+        self._contadores: dict[str, list[int]] = {}
+        self._contadores_lock = threading.Lock()
+
+    def contar(self, servicio: str, error_inyectado: bool) -> None:
+        with self._contadores_lock:
+            c = self._contadores.setdefault(servicio, [0, 0])
+            c[0] += 1
+            c[1] += error_inyectado
+
+    def contadores(self) -> dict[str, dict[str, int]]:
+        """
+        Por servicio: llamadas recibidas (reintentos del cliente incluidos) y 503 inyectados.
+        """
+        with self._contadores_lock:
+            return {s: {"llamadas": c[0], "errores_inyectados": c[1]} for s, c in sorted(self._contadores.items())}
+
+
+def crear_servidor(host: str = "127.0.0.1", port: int = 0,
+                   config: ConfigStub | None = None) -> StubServer:
+    return StubServer((host, port), config or ConfigStub())
+
+
+def iniciar_en_hilo(config: ConfigStub | None = None, host: str = "127.0.0.1",
+                    port: int = 0) -> tuple[StubServer, str]:
+    """
+    Levanta el stub en un hilo daemon. Devuelve (servidor, url_base).
+    """
+    srv = crear_servidor(host, port, config)
+    threading.Thread(target=srv.serve_forever, daemon=True, name="stub_upstream").start()
+    h, p = srv.server_address[:2]
+    return srv, f"http://{h}:{p}"
+
+
+def _parsear_servicio(valor: str) -> tuple[str, Latencia]:
+    """
+    "epok_geometria=200" | "epok_geometria=200:0.05" (latencia media ms[:tasa de error])
+    """
+    nombre, _, resto = valor.partition("=")
+    media, _, error = resto.partition(":")
+    return nombre.strip(), Latencia(float(media), tasa_error=float(error or 0))
+
+
+def config_desde_args(args) -> ConfigStub:
+    default = Latencia(args.latencia_ms, args.jitter, args.tasa_error)
+    por_servicio = {}
+    for valor in args.servicio or []:
+        nombre, lat = _parsear_servicio(valor)
+        lat.jitter = args.jitter
+        por_servicio[nombre] = lat
+    return ConfigStub(default, por_servicio)
+
+
+def agregar_args(p: argparse.ArgumentParser) -> None:
+    p.add_argument("--latencia-ms", type=float, default=50.0, help="latencia media por llamada (ms)")
+    p.add_argument("--jitter", type=float, default=0.5, help="sigma lognormal de la latencia (0 = fija)")
+    p.add_argument("--tasa-error", type=float, default=0.0, help="fracción de respuestas 503")
+    p.add_argument("--servicio", action="append", metavar="NOMBRE=MS[:ERROR]",
+                   help="override por servicio, ej. epok_geometria=200:0.05 (repetible)")
+
+
+def main(argv: list[str] | None = None) -> None:
+    p = argparse.ArgumentParser(description="Stub local de USIG / EPOK.")
+    p.add_argument("--host", default="127.0.0.1")
+    p.add_argument("--port", type=int, default=8765)
+    agregar_args(p)
+    args = p.parse_args(argv)
+
+    srv = crear_servidor(args.host, args.port, config_desde_args(args))
+    print(f"Stub USIG/EPOK en http://{args.host}:{args.port} (UPSTREAM_STUB_URL)")
+    try:
+        srv.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        srv.server_close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+# Los módulos del proyecto están sueltos en la raíz del repo.
+import sys
+from pathlib import Path
+
+RAIZ = Path(__file__).resolve().parent.parent
+if str(RAIZ) not in sys.path:
+    sys.path.insert(0, str(RAIZ))
+
+import pytest
+
+
+@pytest.fixture(autouse=True)
+def _directorio_temporal(tmp_path, monkeypatch):
+    # los caches / archivos en disco (cache/*.sqlite3) van a parar a un directorio temporal
+    monkeypatch.chdir(tmp_path)
+
+
+@pytest.fixture
+def upstream(tmp_path, monkeypatch):
+    """
+    Levanta stub_upstream y manda todo http_client ahí, con caches, índices y
+    circuitos vacíos (nada de lo que dejó otro test contesta por el stub).
+    upstream(config=None) -> servidor (con .contadores()); una vez por test.
+    """
+    import almacen_parcelas
+    import archivo_upstream
+    import cache_local
+    import circuito
+    import http_client
+    import indice_alturas
+    import indice_calles
+    import indice_espacial
+    import stub_upstream
+
+    monkeypatch.setattr(stub_upstream, "FIXTURES_DIR", RAIZ / "salida_epok_test")
+    for cache in list(cache_local._caches.values()):
+        monkeypatch.setattr(cache, "persistente", False)
+        cache.limpiar_memoria()
+    monkeypatch.setattr(almacen_parcelas, "ALMACEN_PATH", tmp_path / "sin_almacen.sqlite3")
+    monkeypatch.setattr(almacen_parcelas, "_existe", False)
+    monkeypatch.setattr(almacen_parcelas, "_ultimo_chequeo", float("-inf"))
+    monkeypatch.setattr(indice_alturas, "INDICE_PATH", tmp_path / "indice_alturas.sqlite3")
+    monkeypatch.setattr(indice_alturas, "_indice", {})
+    monkeypatch.setattr(indice_alturas, "_cargado", False)
+    monkeypatch.setattr(indice_calles, "obtener_indice", lambda: None)
+    monkeypatch.setattr(indice_espacial, "_indice", None)
+    monkeypatch.setattr(circuito, "_circuitos", {})
+    # llamadas lentas que dejó otro test siguen en vuelo: que nadie se cuelgue de ellas
+    monkeypatch.setattr(http_client, "_en_vuelo", {})
+    monkeypatch.setattr(archivo_upstream, "_modo", "off")
+
+    servidores = []
+
+    def arrancar(config=None):
+        srv, url = stub_upstream.iniciar_en_hilo(config or stub_upstream.ConfigStub(default=stub_upstream.Latencia(0, 0)))
+        servidores.append(srv)
+        http_client.usar_stub(url)
+        return srv
+
+    yield arrancar
+
+    http_client.usar_stub(None)
+    for srv in servidores:
+        srv.shutdown()
+        srv.server_close()
+    for cache in list(cache_local._caches.values()):
+        cache.limpiar_memoria()
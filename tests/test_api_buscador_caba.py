@@ -0,0 +1,128 @@
+import threading
+
+import pytest
+
+import api_buscador_caba as abc
+import cache_local
+import http_client
+import indice_calles
+
+
+class _Respuesta:
+    def __init__(self, data):
+        self._data = data
+
+    def raise_for_status(self):
+        pass
+
+    def json(self):
+        return self._data
+
+
+def _calle(nombre, cod):
+    return {"tipo": "calle", "nombre_calle": nombre, "cod_calle": cod, "cod_partido": "caba"}
+
+
+@pytest.fixture
+def usig(monkeypatch):
+    monkeypatch.setattr(abc, "CACHE_AUTOCOMPLETE", cache_local.CacheTTL("test_autocomplete", 60, persistente=False))
+    monkeypatch.setattr(indice_calles, "obtener_indice", lambda: None)
+    llamadas = []
+    respuestas = {}
+
+    def get(url, params=None, **kwargs):
+        llamadas.append(params["direccion"])
+        return _Respuesta(respuestas[params["direccion"]])
+
+    monkeypatch.setattr(http_client, "get", get)
+    return llamadas, respuestas
+
+
+def test_prefijo_simple_sale_de_cache(usig):
+    llamadas, respuestas = usig
+    respuestas["corr"] = {"direccionesNormalizadas": [
+        _calle("CORRIENTES AV.", 3006), _calle("CORRO", 3010), _calle("CORREA", 3009),
+    ]}
+    abc.sugerir_calles_caba("corr", contar=False)
+    out = abc.sugerir_calles_caba("corrie", contar=False)
+    assert llamadas == ["corr"]
+    assert [s["nombre_calle"] for s in out["sugerencias"]] == ["CORRIENTES AV."]
+
+
+def test_interseccion_va_a_usig(usig):
+    llamadas, respuestas = usig
+    respuestas["corrientes"] = {"direccionesNormalizadas": [_calle("CORRIENTES AV.", 3006)]}
+    respuestas["Corrientes y Cal"] = {"direccionesNormalizadas": [{
+        "tipo": "calle_y_calle", "nombre_calle": "CORRIENTES AV.", "nombre_calle_cruce": "CALLAO AV.",
+        "direccion": "CORRIENTES AV. y CALLAO AV.", "cod_partido": "caba",
+    }]}
+    abc.sugerir_calles_caba("corrientes", contar=False)
+    out = abc.sugerir_calles_caba("Corrientes y Cal", contar=False)
+    assert llamadas == ["corrientes", "Corrientes y Cal"]
+    assert [s["tipo"] for s in out["sugerencias"]] == ["calle_y_calle"]
+
+
+def test_prefijo_sin_coincidencias_no_se_deriva_ni_cachea(usig):
+    llamadas, respuestas = usig
+    respuestas["davi"] = {"direccionesNormalizadas": [_calle("DAVILA", 4040)]}
+    respuestas["davix"] = {"direccionesNormalizadas": []}
+    abc.sugerir_calles_caba("davi", contar=False)
+    abc.sugerir_calles_caba("davix", contar=False)
+    assert llamadas == ["davi", "davix"]
+
+
+@pytest.fixture
+def con_indice(usig, monkeypatch):
+    indice = indice_calles.IndiceCalles([(3006, "CORRIENTES AV."), (3010, "CORRO"), (1106, "CALLAO AV.")])
+    monkeypatch.setattr(indice_calles, "obtener_indice", lambda: indice)
+    return usig
+
+
+def test_con_indice_las_calles_no_van_a_usig(con_indice):
+    llamadas, _ = con_indice
+    out = abc.sugerir_calles_caba("corri", contar=False)
+    assert llamadas == []
+    assert [s["nombre_calle"] for s in out["sugerencias"]] == ["CORRIENTES AV."]
+
+
+@pytest.mark.parametrize("query", ["Corrientes y Cal", "Corrientes & Callao", "corrientes e"])
+def test_con_indice_las_intersecciones_van_a_usig(con_indice, query):
+    llamadas, respuestas = con_indice
+    respuestas[query] = {"direccionesNormalizadas": [{
+        "tipo": "calle_y_calle", "nombre_calle": "CORRIENTES AV.", "nombre_calle_cruce": "CALLAO AV.",
+        "direccion": "CORRIENTES AV. y CALLAO AV.", "cod_partido": "caba",
+    }]}
+    out = abc.sugerir_calles_caba(query, contar=False)
+    assert llamadas == [query]
+    assert [s["tipo"] for s in out["sugerencias"]] == ["calle_y_calle"]
+
+
+def test_respuesta_de_error_no_se_cachea(usig):
+    llamadas, respuestas = usig
+    respuestas["davila 11"] = {"errorMessage": "Servicio no disponible"}
+    assert abc.sugerir_calles_caba("davila 11", contar=False)["sugerencias"] == []
+    respuestas["davila 11"] = {"direccionesNormalizadas": [{
+        "tipo": "calle_altura", "nombre_calle": "DAVILA", "direccion": "DAVILA 1100", "altura": 1100,
+        "cod_partido": "caba",
+    }]}
+    out = abc.sugerir_calles_caba("davila 11", contar=False)
+    assert llamadas == ["davila 11", "davila 11"]
+    assert [s["label"] for s in out["sugerencias"]] == ["DAVILA 1100"]
+
+
+def test_contadores_con_hilos_concurrentes(con_indice, monkeypatch):
+    monkeypatch.setattr(abc, "_stats", dict.fromkeys(abc._stats, 0))
+    hilos, vueltas = 8, 500
+
+    def trabajar():
+        for _ in range(vueltas):
+            abc.sugerir_calles_caba("corri")
+
+    ts = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    stats = abc.estadisticas()
+    assert stats["consultas"] == stats["indice_calles"] == hilos * vueltas
+    assert stats["sin_upstream_ratio"] == 1.0
@@ -0,0 +1,144 @@
+import time
+
+import pytest
+
+import almacen_parcelas
+import api_datos_catastrales as adc
+import http_client
+import indice_espacial
+import stub_upstream
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_parcelas, "ALMACEN_PATH", tmp_path / "parcelas.sqlite3")
+    monkeypatch.setattr(almacen_parcelas, "_existe", False)
+    monkeypatch.setattr(almacen_parcelas, "_ultimo_chequeo", float("-inf"))
+    almacen_parcelas.guardar("044-097A-001", {"smp": "044-097A-001"})
+    return almacen_parcelas
+
+
+def _indice_devuelve(monkeypatch, res):
+    monkeypatch.setattr(indice_espacial, "parcela_en_latlng", lambda lat, lng, max_dist=0.0: res)
+
+
+def test_parcela_que_contiene_el_punto_sale_local(almacen, monkeypatch):
+    _indice_devuelve(monkeypatch, ("044-097A-001", 0.0))
+    assert adc._parcela_local_por_latlng(-34.6, -58.4, adc.APROX_LOCAL_M) == {"smp": "044-097A-001"}
+
+
+def test_mas_cercana_en_manzana_a_medio_cosechar_va_a_epok(almacen, monkeypatch):
+    _indice_devuelve(monkeypatch, ("044-097A-001", 12.0))
+    assert adc._parcela_local_por_latlng(-34.6, -58.4, adc.APROX_LOCAL_M) is None
+
+
+def test_mas_cercana_en_manzana_cosechada_sale_local(almacen, monkeypatch):
+    almacen.marcar_manzana("044", "097A", 1, "h")
+    _indice_devuelve(monkeypatch, ("044-097A-001", 12.0))
+    assert adc._parcela_local_por_latlng(-34.6, -58.4, adc.APROX_LOCAL_M) == {"smp": "044-097A-001"}
+
+
+@pytest.mark.parametrize("smp", ["01-001-010", "044-097A-029", "056-066A-014A", "044-098-001", "015-040-013B"])
+def test_re_smp_acepta(smp):
+    assert adc.RE_SMP.fullmatch(smp)
+    assert adc.RE_SMP.search(f"parcela {smp}, CABA").group(0) == smp
+
+
+@pytest.mark.parametrize("texto", ["1044-097A-029", "044-97A-029", "044-097AB-029", "2024-01-15", "4342-1234",
+                                   "044-097a-029", "044-097A-0291"])
+def test_re_smp_rechaza(texto):
+    assert adc.RE_SMP.search(texto) is None
+
+
+def test_extraer_smp_clave_antes_que_texto_mas_arriba():
+    payload = {"direccion": "frente a 044-097A-028", "datos": {"parcela": {"smp": "044-097A-029"}}}
+    assert adc.extraer_smp(payload) == adc.SmpEncontrado("044-097A-029", "datos.parcela.smp", True)
+
+
+def test_extraer_smp_partes_sueltas_y_listas():
+    payload = [{"otra": 1}, {"seccion": "044", "manzana": "097A", "parcela": "029"}]
+    assert adc.extraer_smp(payload) == adc.SmpEncontrado("044-097A-029", "[1].seccion+manzana+parcela", True)
+    # partes que no arman un SMP válido no cuentan
+    assert adc.extraer_smp({"seccion": "44", "manzana": "97", "parcela": "29"}) is None
+
+
+def test_extraer_smp_ignora_vecinas():
+    payload = {"smp_anterior": "044-097A-028", "smp_siguiente": "044-097A-030",
+               "vecinas": {"smp_siguiente": {"smp": "044-097A-031"}}}
+    assert adc.extraer_smp(payload) is None
+    assert adc.find_smp_anywhere({**payload, "nota": "parcela 044-097A-029"}) == "044-097A-029"
+
+
+def test_extraer_smp_desde_texto():
+    got = adc.extraer_smp({"resultado": [{"descripcion": "SMP 044-098-001 (sin letra)"}]})
+    assert got == adc.SmpEncontrado("044-098-001", "texto:resultado[0].descripcion", False)
+    assert (got.smp, got.origen, got.por_clave) == tuple(got)
+
+
+# ====== resolve_smp_from_address contra stub_upstream ======
+CODCALLE = "catastro_parcela_por_codcalle_altura"
+LATLNG = "catastro_parcela_por_latlng_aprox"
+INFORMAL = "catastroinformal"
+
+
+@pytest.fixture
+def stub(upstream, monkeypatch):
+    # sin reintentos: un 503 del stub es un error enseguida
+    monkeypatch.setitem(http_client.HOST_CONFIG, "epok.buenosaires.gob.ar", {"retries": 0, "timeout": (3.05, 30)})
+
+    def arrancar(**por_servicio):
+        return upstream(stub_upstream.ConfigStub(default=stub_upstream.Latencia(0, 0), por_servicio=por_servicio))
+    return arrancar
+
+
+def test_secuencial_sigue_el_orden_y_para_en_el_primer_smp(stub):
+    srv = stub(epok_parcela_codcalle=stub_upstream.Latencia(0, 0, tasa_error=1.0))
+    smp, dbg = adc.resolve_smp_from_address("Davila 1130")
+
+    assert smp == "044-097A-029"
+    assert dbg["estrategia_ganadora"] == LATLNG
+    assert list(dbg["estrategias_tiempos"]) == [CODCALLE, LATLNG]
+    assert dbg["estrategias_tiempos"][CODCALLE]["estado"] == "error"
+    assert dbg["estrategias_tiempos"][LATLNG]["estado"] == "ok"
+    assert "epok_catastroinformal" not in srv.contadores()
+
+
+def test_hedged_lanza_la_siguiente_si_la_primera_tarda(stub):
+    srv = stub(epok_parcela_codcalle=stub_upstream.Latencia(2000, 0))
+    t0 = time.perf_counter()
+    smp, dbg = adc.resolve_smp_from_address("Davila 1130", hedge_delay=0.2)
+    dt = time.perf_counter() - t0
+
+    assert smp == "044-097A-029"
+    assert dbg["estrategia_ganadora"] == LATLNG
+    assert dbg["estrategias_tiempos"][CODCALLE]["estado"] == "cancelada"
+    assert dbg["estrategias_tiempos"][LATLNG]["estado"] == "ok"
+    # ganó antes de que venciera el segundo hedge: la tercera ni arrancó
+    assert INFORMAL not in dbg["estrategias_tiempos"]
+    assert "epok_catastroinformal" not in srv.contadores()
+    assert 0.2 <= dt < 1.0
+
+
+def test_hedged_no_espera_el_delay_si_la_primera_falla(stub):
+    stub(epok_parcela_codcalle=stub_upstream.Latencia(0, 0, tasa_error=1.0))
+    t0 = time.perf_counter()
+    smp, dbg = adc.resolve_smp_from_address("Davila 1130", hedge_delay=5.0)
+
+    assert smp == "044-097A-029"
+    assert dbg["estrategia_ganadora"] == LATLNG
+    assert dbg["estrategias_tiempos"][CODCALLE]["estado"] == "error"
+    assert time.perf_counter() - t0 < 1.0
+
+
+def test_hedge_cero_lanza_todas_a_la_vez(stub):
+    srv = stub(epok_parcela_codcalle=stub_upstream.Latencia(1500, 0),
+               epok_parcela_latlng_aprox=stub_upstream.Latencia(200, 0))
+    smp, dbg = adc.resolve_smp_from_address("Davila 1130", hedge_delay=0)
+
+    assert smp == "044-097A-029"
+    assert dbg["estrategia_ganadora"] == LATLNG
+    # catastroinformal contesta {} enseguida: sin SMP, pero no corta la carrera
+    assert dbg["estrategias_tiempos"][INFORMAL]["estado"] == "sin_smp"
+    assert dbg["estrategias_tiempos"][CODCALLE]["estado"] == "cancelada"
+    # (el stub cuenta al contestar: la de codcalle, que sigue durmiendo, todavía no figura)
+    assert {"epok_parcela_latlng_aprox", "epok_catastroinformal"} <= set(srv.contadores())
@@ -0,0 +1,32 @@
+import pytest
+
+import api_datos_utiles as du
+import cache_local
+
+
+@pytest.fixture
+def usig(monkeypatch):
+    for nombre in ("CACHE_MANZANA", "CACHE_FRENTE", "CACHE_DIRECCION"):
+        monkeypatch.setattr(du, nombre, cache_local.CacheTTL(f"test_{nombre}", 60, persistente=False))
+    llamadas = []
+
+    def remoto(calle, altura):
+        llamadas.append((calle, altura))
+        return {"barrio": "FLORES", "comuna": "Comuna 7", "codigo_postal_argentino": f"C1406{calle[:3].upper()}"}
+
+    monkeypatch.setattr(du, "_consultar_datos_utiles_remoto", remoto)
+    return llamadas
+
+
+def test_misma_manzana_otro_frente_trae_su_codigo_postal(usig):
+    du.consultar_datos_utiles("Davila", 1130, "044-097A-029")
+    data = du.consultar_datos_utiles("Yerbal", 2201, "044-097A-010")
+    assert data["codigo_postal_argentino"] == "C1406YER"
+    assert len(usig) == 2
+
+
+def test_misma_manzana_mismo_frente_sale_de_cache_completa(usig):
+    primera = du.consultar_datos_utiles("Davila", 1130, "044-097A-029")
+    segunda = du.consultar_datos_utiles("Davila", 1150, "044-097A-030")
+    assert segunda == primera
+    assert len(usig) == 1
@@ -0,0 +1,310 @@
+import json
+import re
+import threading
+import time
+
+import pytest
+import requests
+
+import app as app_module
+import stub_upstream
+
+
+def _no_deberia_probar(*args, **kwargs):
+    raise AssertionError("no debería probar alturas")
+
+
+def test_alturas_cercanas_desde_el_indice_traen_la_parcela(monkeypatch):
+    conocidas = [{"altura": 1100 + 2 * i, "smp": f"044-097A-0{10 + i}", "direccion": None} for i in range(3)]
+    monkeypatch.setattr(app_module.indice_alturas, "alturas_cercanas", lambda *a, **k: conocidas)
+    monkeypatch.setattr(app_module.adc, "catastro_parcela_by_smp",
+                        lambda smp: {"smp": smp, "direccion": f"DAVILA {smp[-2:]}"})
+    monkeypatch.setattr(app_module, "_probar_alturas", _no_deberia_probar)
+
+    out = app_module.sugerir_alturas_validas_cercanas(17071, "DAVILA", 1102, limit=3)
+    assert [s["parcela"]["smp"] for s in out] == [c["smp"] for c in conocidas]
+    assert set(out[0]) == {"altura", "direccion", "smp", "parcela"}
+
+
+# ====== contra stub_upstream ======
+def _config(**por_servicio_ms):
+    return stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={s: stub_upstream.Latencia(ms, 0) for s, ms in por_servicio_ms.items()},
+    )
+
+
+def test_fan_out_por_smp_corre_en_paralelo(upstream):
+    srv = upstream(_config(epok_parcela=300, epok_geometria=300, usig_datos_utiles=300))
+    t0 = time.perf_counter()
+    data, status = app_module.consultar_catastro("Davila 1130", debug=True)
+    dt = time.perf_counter() - t0
+
+    assert status == 200
+    assert data["smp"] == "044-097A-029"
+    assert data["parcela"]["smp"] == "044-097A-029"
+    assert data["geometria"]["features"]
+    assert data["centroide_lonlat"] is not None
+    assert data["datos_utiles"]["barrio"] == "FLORES"
+    contadores = srv.contadores()
+    for servicio in ("epok_parcela", "epok_geometria", "usig_datos_utiles"):
+        assert contadores[servicio]["llamadas"] == 1
+    # en serie serían 0.9 s; en paralelo manda la más lenta
+    assert dt < 0.75
+
+
+def test_datos_utiles_lentos_no_pasan_el_deadline(upstream, monkeypatch):
+    upstream(_config(usig_datos_utiles=3000))
+    monkeypatch.setattr(app_module, "REQUEST_DEADLINE_S", 0.8)
+    t0 = time.perf_counter()
+    data, status = app_module.consultar_catastro("Davila 1130", debug=True)
+    dt = time.perf_counter() - t0
+
+    assert status == 200
+    assert data["parcela"]["smp"] == "044-097A-029"
+    assert data["datos_utiles"] is None
+    assert data["debug"]["datos_utiles_omitido"] == "deadline"
+    assert dt < 1.3
+
+
+def test_datos_utiles_con_circuito_abierto_no_se_esperan(upstream, monkeypatch):
+    srv = upstream()
+    monkeypatch.setattr(app_module.circuito, "disponible", lambda servicio: servicio != "usig_datos_utiles")
+    data, status = app_module.consultar_catastro("Davila 1130", debug=True)
+
+    assert status == 200
+    assert data["datos_utiles"] is None
+    assert data["debug"]["datos_utiles_omitido"] == "circuito_abierto"
+    assert "usig_datos_utiles" not in srv.contadores()
+
+
+def test_alturas_radiales():
+    assert app_module._alturas_radiales(1130, 6, 2) == [1130, 1128, 1132, 1126, 1134, 1124, 1136]
+    assert app_module._alturas_radiales(1130, 2, 1) == [1130, 1129, 1131, 1128, 1132]
+    # sólo alturas > 0
+    assert app_module._alturas_radiales(3, 6, 2) == [3, 1, 5, 7, 9]
+
+
+@pytest.fixture
+def sondas(upstream, monkeypatch):
+    """Stub sin latencia, alturas inválidas vacías y registro de las alturas probadas."""
+    upstream()
+    monkeypatch.setattr(app_module, "_alturas_invalidas", {})
+    probadas = []
+    real = app_module._catastro_parcela_por_codcalle_altura
+
+    def espia(cod_calle, altura):
+        probadas.append(altura)
+        return real(cod_calle, altura)
+
+    monkeypatch.setattr(app_module, "_catastro_parcela_por_codcalle_altura", espia)
+    return probadas
+
+
+def test_probing_radial_por_vereda_corta_en_limit(sondas):
+    # en el stub las alturas con altura % 100 >= 80 no tienen parcela
+    out = app_module.sugerir_alturas_validas_cercanas(4012, "DAVILA", 1184, limit=3, max_delta=20, concurrencia=4)
+
+    assert [s["altura"] for s in out] == [1178, 1176, 1174]
+    assert all(s["smp"] for s in out)
+    # tres lotes de 4 en orden radial, sólo la misma vereda; el resto ni se prueba
+    assert sondas == [1184, 1182, 1186, 1180, 1188, 1178, 1190, 1176, 1192, 1174, 1194, 1172]
+    assert all(alt % 2 == 0 for alt in sondas)
+
+
+def test_probing_saltea_alturas_invalidas_conocidas(sondas):
+    alturas = app_module._alturas_radiales(1184, 20, 2)
+    app_module._probar_alturas(4012, "DAVILA", alturas, limit=3, concurrencia=4)
+    sondas.clear()
+
+    out = app_module._probar_alturas(4012, "DAVILA", alturas, limit=3, concurrencia=4)
+    assert [s["altura"] for s in out] == [1178, 1176, 1174]
+    assert sondas == [1178, 1176, 1174, 1172]
+
+
+def test_probing_sin_nada_en_la_vereda_prueba_la_de_enfrente(sondas, monkeypatch):
+    monkeypatch.setattr(app_module, "_is_parcela_valida",
+                        lambda p: bool(p) and p["direccion"].endswith(("1151", "1153")))
+    out = app_module.sugerir_alturas_validas_cercanas(4012, "DAVILA", 1152, limit=2, max_delta=4, concurrencia=8)
+
+    assert [s["altura"] for s in out] == [1153, 1151]
+    assert sondas == [1152, 1150, 1154, 1148, 1156, 1153, 1151, 1155, 1149, 1157]
+
+
+def test_parcela_codcalle_recuerda_la_url_que_anduvo(upstream, monkeypatch):
+    upstream()
+    sin_barra, con_barra = app_module._EPOK_PARCELA_URLS
+    monkeypatch.setattr(app_module, "_epok_parcela_url_preferida", sin_barra)
+    urls = []
+    real = app_module.http_client.get
+
+    def get(url, *args, **kwargs):
+        urls.append(url)
+        if url == sin_barra:
+            raise requests.exceptions.ConnectionError("variante caída")
+        return real(url, *args, **kwargs)
+
+    monkeypatch.setattr(app_module.http_client, "get", get)
+
+    assert app_module._catastro_parcela_por_codcalle_altura(4012, 1130)["smp"] == "044-097A-029"
+    assert urls == [sin_barra, con_barra]
+    assert app_module._epok_parcela_url_preferida == con_barra
+
+    urls.clear()
+    assert app_module._catastro_parcela_por_codcalle_altura(4012, 1132)["smp"]
+    assert urls == [con_barra]
+
+
+def test_parcela_codcalle_sin_ninguna_variante_devuelve_none(upstream, monkeypatch):
+    upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela_codcalle": stub_upstream.Latencia(0, 0, tasa_error=1.0)},
+    ))
+    monkeypatch.setitem(app_module.http_client.HOST_CONFIG, "epok.buenosaires.gob.ar", {"retries": 0})
+    preferida = app_module._epok_parcela_url_preferida
+    assert app_module._catastro_parcela_por_codcalle_altura(4012, 1130) is None
+    assert app_module._epok_parcela_url_preferida == preferida
+
+
+# ====== /api/catastro/batch ======
+def _batch(payload):
+    resp = app_module.app.test_client().post("/api/catastro/batch", json=payload)
+    assert resp.status_code == 200
+    assert resp.mimetype == "application/x-ndjson"
+    return [json.loads(linea) for linea in resp.get_data(as_text=True).splitlines()]
+
+
+def test_batch_dedupe_e_invalidas_primero(upstream):
+    srv = upstream()
+    lineas = _batch({"direcciones": ["Davila 1130", "  DÁVILA   1130, CABA", "", "Davila 1132", 5, "davila 1130"]})
+
+    assert [linea["indices"] for linea in lineas[:2]] == [[2], [4]]
+    assert all(linea["status"] == 400 for linea in lineas[:2])
+    por_direccion = {linea["direccion"]: linea for linea in lineas[2:]}
+    assert set(por_direccion) == {"Davila 1130", "Davila 1132"}
+    assert por_direccion["Davila 1130"]["indices"] == [0, 1, 5]
+    assert por_direccion["Davila 1130"]["status"] == 200
+    assert por_direccion["Davila 1130"]["smp"] == "044-097A-029"
+    assert por_direccion["Davila 1132"]["indices"] == [3]
+    assert sorted(i for linea in lineas for i in linea["indices"]) == list(range(6))
+    # una consulta upstream por dirección distinta
+    assert srv.contadores()["usig_normalizar"]["llamadas"] == 2
+
+
+def test_batch_sin_direcciones_es_400():
+    resp = app_module.app.test_client().post("/api/catastro/batch", json={"direcciones": []})
+    assert resp.status_code == 400
+
+
+class _ConsultaLenta:
+    """consultar_catastro falso: cuenta cuántas hay en vuelo a la vez."""
+
+    def __init__(self, demoras=None):
+        self.demoras = demoras or {}
+        self.en_vuelo = 0
+        self.maximo = 0
+        self.lock = threading.Lock()
+
+    def __call__(self, direccion, opciones_geometria=None, debug=False):
+        with self.lock:
+            self.en_vuelo += 1
+            self.maximo = max(self.maximo, self.en_vuelo)
+        time.sleep(self.demoras.get(direccion, 0.05))
+        with self.lock:
+            self.en_vuelo -= 1
+        return {"ok": True, "smp": direccion}, 200
+
+
+@pytest.mark.parametrize("pedida, esperada", [
+    (3, 3),
+    (None, app_module.BATCH_CONCURRENCIA),
+    (1000, app_module.BATCH_CONCURRENCIA_MAX),
+    (0, app_module.BATCH_CONCURRENCIA),
+    (-5, 1),
+])
+def test_batch_ventana_de_concurrencia(monkeypatch, pedida, esperada):
+    consulta = _ConsultaLenta()
+    monkeypatch.setattr(app_module, "consultar_catastro", consulta)
+    direcciones = [f"Calle {i}" for i in range(app_module.BATCH_CONCURRENCIA_MAX + 8)]
+    lineas = _batch({"direcciones": direcciones, "concurrencia": pedida})
+
+    assert len(lineas) == len(direcciones)
+    assert consulta.maximo == esperada
+
+
+def test_batch_emite_cada_resultado_apenas_termina(monkeypatch):
+    monkeypatch.setattr(app_module, "consultar_catastro", _ConsultaLenta({"Lenta 1": 0.5, "Rapida 2": 0.0}))
+    lineas = _batch({"direcciones": ["Lenta 1", "Rapida 2"], "concurrencia": 2})
+    assert [linea["direccion"] for linea in lineas] == ["Rapida 2", "Lenta 1"]
+
+
+# ====== Server-Timing y /metrics ======
+def _server_timing(header):
+    """'a;dur=1.0;desc="1x", total;dur=3.0' -> {"a": {"dur": 1.0, "desc": "1x"}, "total": {...}}"""
+    out = {}
+    for parte in re.split(r", (?=\w+;)", header):
+        nombre, *campos = parte.split(";")
+        out[nombre] = {}
+        for campo in campos:
+            clave, valor = campo.split("=", 1)
+            out[nombre][clave] = float(valor) if clave == "dur" else valor.strip('"')
+    return out
+
+
+def _contador_http(endpoint, status):
+    linea = f'http_requests_total{{endpoint="{endpoint}",status="{status}"}} '
+    texto = app_module.app.test_client().get("/metrics").get_data(as_text=True)
+    return next((int(l[len(linea):]) for l in texto.splitlines() if l.startswith(linea)), 0)
+
+
+def test_server_timing_por_upstream(upstream):
+    upstream(_config(epok_geometria=100))
+    resp = app_module.app.test_client().post("/api/catastro", json={"direccion": "Davila 1130"})
+    assert resp.status_code == 200
+
+    tiempos = _server_timing(resp.headers["Server-Timing"])
+    for servicio in ("usig_normalizar", "epok_parcela_codcalle", "epok_parcela", "epok_geometria",
+                     "usig_datos_utiles"):
+        assert tiempos[servicio]["desc"] == "1x"
+    assert tiempos["epok_geometria"]["dur"] >= 100
+    assert tiempos["total"]["dur"] >= tiempos["epok_geometria"]["dur"]
+
+
+def test_server_timing_marca_los_errores(upstream, monkeypatch):
+    upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"usig_datos_utiles": stub_upstream.Latencia(0, 0, tasa_error=1.0)},
+    ))
+    monkeypatch.setitem(app_module.http_client.HOST_CONFIG, "datosabiertos-usig-apis.buenosaires.gob.ar",
+                        {"retries": 0})
+    resp = app_module.app.test_client().post("/api/catastro", json={"direccion": "Davila 1130"})
+    assert resp.status_code == 200
+    assert _server_timing(resp.headers["Server-Timing"])["usig_datos_utiles"]["desc"] == "1x, 1 err"
+
+
+def test_metrics_expone_upstream_endpoints_y_caches(upstream):
+    upstream()
+    antes = _contador_http("/api/catastro", 200)
+    app_module.app.test_client().post("/api/catastro", json={"direccion": "Davila 1130"})
+
+    resp = app_module.app.test_client().get("/metrics")
+    assert resp.status_code == 200
+    assert resp.mimetype == "text/plain"
+    texto = resp.get_data(as_text=True)
+    assert 'upstream_requests_total{servicio="usig_normalizar",resultado="ok"}' in texto
+    assert 'upstream_request_duration_seconds_bucket{servicio="epok_geometria",le="+Inf"}' in texto
+    assert 'http_request_duration_seconds_count{endpoint="/api/catastro"}' in texto
+    assert 'cache_requests_total{cache="parcelas_smp",resultado="miss"}' in texto
+    assert 'upstream_circuito_abierto{servicio="epok_parcela"} 0' in texto
+    assert _contador_http("/api/catastro", 200) == antes + 1
+
+
+def test_batch_sin_server_timing_parcial(upstream):
+    upstream()
+    antes = _contador_http("/api/catastro/batch", 200)
+    resp = app_module.app.test_client().post("/api/catastro/batch", json={"direcciones": ["Davila 1130"]})
+    assert "Server-Timing" not in resp.headers
+    assert json.loads(resp.get_data(as_text=True))["smp"] == "044-097A-029"
+    resp.close()
+    # la latencia del batch se registra cuando se terminó de mandar el body
+    assert _contador_http("/api/catastro/batch", 200) == antes + 1
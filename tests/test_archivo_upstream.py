@@ -0,0 +1,33 @@
+import time
+
+import pytest
+
+import archivo_upstream
+
+
+@pytest.fixture
+def archivo(tmp_path, monkeypatch):
+    monkeypatch.setattr(archivo_upstream, "ARCHIVO_PATH", tmp_path / "archivo.sqlite3")
+    return archivo_upstream
+
+
+def _llamada(direccion, ts):
+    return (f"servicios.usig.buenosaires.gob.ar/normalizar/?direccion={direccion}", "usig_normalizar",
+            200, "application/json", b"{}", 12.0, ts)
+
+
+def test_podar_borra_solo_llamadas_viejas(archivo):
+    ahora = time.time()
+    archivo._escribir_lote([_llamada("vieja", ahora - 40 * 86400), _llamada("nueva", ahora)])
+    assert archivo.podar(retencion_dias=30) == 1
+    assert archivo.frecuentes("usig_normalizar", "direccion") == [("nueva", 1)]
+    # la respuesta grabada de la vieja sigue sirviendo de respaldo
+    assert archivo.buscar("https://servicios.usig.buenosaires.gob.ar/normalizar/", {"direccion": "vieja"})
+
+
+def test_frecuentes_usa_el_indice_por_servicio_y_ts(archivo):
+    plan = archivo._conexion().execute(
+        "EXPLAIN QUERY PLAN SELECT clave, COUNT(*) FROM llamadas WHERE servicio = ? AND ts >= ? GROUP BY clave",
+        ("usig_normalizar", 0),
+    ).fetchall()
+    assert any("llamadas_servicio_ts" in fila[-1] for fila in plan)
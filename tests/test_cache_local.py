@@ -0,0 +1,48 @@
+import threading
+
+import api_datos_catastrales as adc
+import cache_local
+
+
+def test_obtener_o_calcular_no_guarda_lo_no_cacheable():
+    cache = cache_local.CacheTTL("test_cacheable", 60, persistente=False)
+    respuestas = iter([{"error": "timeout"}, {"direccionesNormalizadas": [1]}])
+    llamadas = []
+
+    def fn():
+        llamadas.append(1)
+        return next(respuestas)
+
+    assert cache.obtener_o_calcular("k", fn, cacheable=adc._normalizar_cacheable) == {"error": "timeout"}
+    assert cache.obtener_o_calcular("k", fn, cacheable=adc._normalizar_cacheable) == {"direccionesNormalizadas": [1]}
+    assert cache.obtener_o_calcular("k", fn, cacheable=adc._normalizar_cacheable) == {"direccionesNormalizadas": [1]}
+    assert len(llamadas) == 2
+
+
+def test_normalizar_cacheable():
+    assert not adc._normalizar_cacheable({})
+    assert not adc._normalizar_cacheable(None)
+    assert not adc._normalizar_cacheable({"errorMessage": "Calle inexistente"})
+    assert adc._normalizar_cacheable({"direccionesNormalizadas": []})
+
+
+def test_contadores_con_hilos_concurrentes():
+    cache = cache_local.CacheTTL("test_contadores", 60, persistente=False)
+    cache.set("esta", 1)
+    hilos, vueltas = 8, 2000
+
+    def trabajar():
+        for _ in range(vueltas):
+            cache.get("esta")
+            cache.get("no_esta")
+
+    ts = [threading.Thread(target=trabajar) for _ in range(hilos)]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+
+    stats = cache.stats()
+    assert stats["hits_memoria"] == hilos * vueltas
+    assert stats["misses"] == hilos * vueltas
+    assert stats["hit_rate"] == 0.5
@@ -0,0 +1,97 @@
+import threading
+import time
+
+import pytest
+
+import api_datos_catastrales as adc
+import app as app_module
+import cache_local
+import cache_parcelas
+
+SMP = "044-097A-029"
+
+
+def _geometria(lado=10.0):
+    anillo = [[100000, 100000], [100000 + lado, 100000], [100000 + lado, 100000 + lado],
+              [100000, 100000 + lado], [100000, 100000]]
+    return {"type": "FeatureCollection", "features": [
+        {"type": "Feature", "geometry": {"type": "Polygon", "coordinates": [anillo]}, "properties": {}},
+    ]}
+
+
+@pytest.fixture
+def epok(monkeypatch):
+    monkeypatch.setattr(cache_parcelas, "CACHE", cache_local.CacheTTL("test_parcelas", 3600, persistente=False))
+    monkeypatch.setattr(cache_parcelas, "_stats", dict.fromkeys(cache_parcelas._stats, 0))
+    monkeypatch.setattr(cache_parcelas, "_en_refresco", set())
+    estado = {"version": 1, "llamadas": 0, "soltar": threading.Event()}
+    estado["soltar"].set()
+
+    def parcela(smp):
+        estado["llamadas"] += 1
+        estado["soltar"].wait(5)
+        return {"smp": smp, "version": estado["version"]}
+
+    monkeypatch.setattr(adc, "catastro_parcela_by_smp_remoto", parcela)
+    monkeypatch.setattr(adc, "catastro_geometria_by_smp_remoto", lambda smp: _geometria())
+    return estado
+
+
+def _guardar(version=1, edad_s=0.0):
+    der, _ = cache_parcelas.derivados(_geometria())
+    cache_parcelas.guardar(SMP, {"smp": SMP, "version": version}, _geometria(), der)
+    entrada = cache_parcelas.CACHE.get(SMP, contar=False)
+    cache_parcelas.CACHE.set(SMP, {**entrada, "ts": entrada["ts"] - edad_s})
+
+
+def _esperar_refrescos():
+    limite = time.monotonic() + 5
+    while cache_parcelas.estadisticas()["en_refresco"] and time.monotonic() < limite:
+        time.sleep(0.01)
+
+
+def test_fresca_se_sirve_sin_ir_a_epok(epok):
+    _guardar()
+    entrada = cache_parcelas.leer(SMP)
+    assert not entrada["vencida"]
+    assert entrada["area_m2"] == pytest.approx(100.0)
+    assert epok["llamadas"] == 0
+    assert cache_parcelas.estadisticas()["frescas"] == 1
+
+
+def test_faltante(epok):
+    assert cache_parcelas.leer(SMP) is None
+    assert cache_parcelas.estadisticas()["faltantes"] == 1
+    assert epok["llamadas"] == 0
+
+
+def test_vencida_se_sirve_y_encola_un_solo_refresco(epok):
+    _guardar(version=1, edad_s=cache_parcelas.FRESCO_S + 60)
+    epok["version"] = 2
+    epok["soltar"].clear()
+
+    primera = cache_parcelas.leer(SMP)
+    segunda = cache_parcelas.leer(SMP)
+    assert primera["vencida"] and segunda["vencida"]
+    assert primera["parcela"]["version"] == segunda["parcela"]["version"] == 1
+    assert cache_parcelas.estadisticas()["en_refresco"] == 1
+
+    epok["soltar"].set()
+    _esperar_refrescos()
+    assert epok["llamadas"] == 1
+    stats = cache_parcelas.estadisticas()
+    assert (stats["vencidas"], stats["refrescos"], stats["refrescos_error"]) == (2, 1, 0)
+    nueva = cache_parcelas.leer(SMP)
+    assert not nueva["vencida"] and nueva["parcela"]["version"] == 2
+
+
+def test_refresco_forzado_va_a_epok_aunque_este_fresca(epok, monkeypatch):
+    _guardar(version=1)
+    epok["version"] = 2
+    monkeypatch.setattr(adc, "resolve_smp_from_address", lambda *a, **k: (SMP, {}))
+
+    data, status = app_module.consultar_catastro("Davila 1130", refrescar=True)
+    assert status == 200
+    assert data["parcela"]["version"] == 2
+    assert epok["llamadas"] == 1
+    assert cache_parcelas.leer(SMP)["parcela"]["version"] == 2
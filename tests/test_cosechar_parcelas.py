@@ -0,0 +1,109 @@
+import pytest
+import requests
+
+import almacen_parcelas
+import api_datos_catastrales as adc
+import api_datos_utiles
+import cache_local
+import cosechar_parcelas
+
+
+@pytest.fixture
+def epok(tmp_path, monkeypatch):
+    monkeypatch.setattr(almacen_parcelas, "ALMACEN_PATH", tmp_path / "parcelas.sqlite3")
+    monkeypatch.setattr(almacen_parcelas, "_existe", False)
+    monkeypatch.setattr(almacen_parcelas, "_ultimo_chequeo", float("-inf"))
+    parcelas: dict[str, dict | Exception] = {}
+
+    def parcela(smp):
+        p = parcelas.get(smp, {})
+        if isinstance(p, Exception):
+            raise p
+        return p
+
+    monkeypatch.setattr(adc, "catastro_parcela_by_smp_remoto", parcela)
+    monkeypatch.setattr(adc, "catastro_geometria_by_smp_remoto", lambda smp: None)
+    return parcelas
+
+
+def _cadena(parcelas, smps, ultima_siguiente=None):
+    for smp, sig in zip(smps, smps[1:] + [ultima_siguiente]):
+        parcelas[smp] = {"smp": smp, "smp_siguiente": sig}
+
+
+def _cosechar():
+    return cosechar_parcelas.cosechar_manzana("044", "097A", cosechar_parcelas.LimitadorTasa(0), forzar=True)
+
+
+def test_recorrido_completo_borra_las_que_faltan(epok):
+    _cadena(epok, ["044-097A-001", "044-097A-002", "044-097A-003"], "044-098-001")
+    assert _cosechar()["estado"] == "nueva"
+    epok.clear()
+    _cadena(epok, ["044-097A-001", "044-097A-002"], "044-098-001")
+    res = _cosechar()
+    assert (res["estado"], res["borradas"], res["vencidas"]) == ("cambiada", 1, 0)
+    assert "044-097A-003" not in almacen_parcelas.huellas_de_manzana("044", "097A")
+
+
+def test_recorrido_cortado_por_error_no_borra(epok):
+    _cadena(epok, ["044-097A-001", "044-097A-002", "044-097A-003"], "044-098-001")
+    _cosechar()
+    marcada = almacen_parcelas.manzana("044", "097A")
+    epok["044-097A-002"] = requests.exceptions.ConnectionError("EPOK caído")
+    epok.pop("044-097A-003")
+    epok.pop("044-097A-004", None)
+    res = _cosechar()
+    assert (res["estado"], res["borradas"], res["vencidas"]) == ("incompleta", 0, 2)
+    assert set(almacen_parcelas.huellas_de_manzana("044", "097A")) == {"044-097A-001", "044-097A-002", "044-097A-003"}
+    # siguen en el almacén pero no se sirven, y la marca de la manzana no se tocó
+    assert almacen_parcelas.parcela("044-097A-003") is None
+    assert almacen_parcelas.parcela("044-097A-001") is not None
+    assert almacen_parcelas.manzana("044", "097A") == marcada
+
+
+def test_manzana_que_queda_vacia_no_se_borra(epok):
+    _cadena(epok, ["044-097A-001"], "044-098-001")
+    _cosechar()
+    epok.clear()
+    assert _cosechar()["estado"] == "incompleta"
+    assert almacen_parcelas.huellas_de_manzana("044", "097A")
+
+
+def test_tope_de_parcelas_es_incompleto(epok, monkeypatch):
+    monkeypatch.setattr(cosechar_parcelas, "MAX_PARCELAS_MANZANA", 2)
+    _cadena(epok, ["044-097A-001", "044-097A-002", "044-097A-003"], "044-098-001")
+    _, completa = cosechar_parcelas.recorrer_manzana("044", "097A", cosechar_parcelas.LimitadorTasa(0))
+    assert not completa
+
+
+@pytest.fixture
+def datos_utiles(monkeypatch):
+    for nombre in ("CACHE_MANZANA", "CACHE_FRENTE", "CACHE_DIRECCION"):
+        monkeypatch.setattr(api_datos_utiles, nombre, cache_local.CacheTTL(f"test_{nombre}", 60, persistente=False))
+    llamadas = []
+
+    def por_direccion(calle, altura):
+        llamadas.append((calle, altura))
+        return {"barrio": "FLORES", "comuna": "Comuna 7", "codigo_postal_argentino": f"C1406{calle[:3]}"}
+
+    monkeypatch.setattr(cosechar_parcelas, "usig_datos_utiles_por_direccion", por_direccion)
+    return llamadas
+
+
+def test_manzana_precargada_contesta_vecinas_sin_red(epok, datos_utiles, monkeypatch):
+    for smp, direccion in (("044-097A-029", "DAVILA 1130"), ("044-097A-030", "DAVILA 1150"),
+                           ("044-097A-010", "YERBAL 2201")):
+        almacen_parcelas.guardar(smp, {"smp": smp, "direccion": direccion})
+    limitador = cosechar_parcelas.LimitadorTasa(0)
+
+    assert cosechar_parcelas.precargar_datos_utiles_manzana("044", "097A", limitador) == "cargada"
+    assert sorted(datos_utiles) == [("DAVILA", 1130), ("YERBAL", 2201)]
+    assert cosechar_parcelas.precargar_datos_utiles_manzana("044", "097A", limitador) == "en_cache"
+
+    def sin_red(calle, altura):
+        raise AssertionError("no debería consultar USIG")
+
+    monkeypatch.setattr(api_datos_utiles, "_consultar_datos_utiles_remoto", sin_red)
+    data = api_datos_utiles.consultar_datos_utiles("Davila", 1170, "044-097A-031")
+    assert data == {"barrio": "FLORES", "comuna": "Comuna 7", "codigo_postal_argentino": "C1406DAV"}
+    assert api_datos_utiles.consultar_datos_utiles("Yerbal", 2251, "044-097A-011")["codigo_postal_argentino"] == "C1406YER"
@@ -0,0 +1,42 @@
+import csv
+import json
+
+import pytest
+
+import api_datos_catastrales as adc
+import geocodificar_csv
+
+
+@pytest.fixture
+def entrada(tmp_path, monkeypatch):
+    monkeypatch.setattr(adc, "resolver_paquete_catastro", lambda d: {"ok": True, "smp": f"SMP {d}"})
+    path = tmp_path / "entrada.csv"
+    with path.open("w", newline="") as f:
+        w = csv.writer(f)
+        w.writerow(["direccion"])
+        w.writerows([f"CALLE {i}"] for i in range(5))
+    return path
+
+
+def test_retomar_no_repite_filas_escritas_despues_del_checkpoint(entrada, tmp_path):
+    salida = tmp_path / "salida.jsonl"
+    # murió después de escribir las filas 0-2 (checkpoint sólo hasta la 0) y a mitad de la 3
+    lineas = [json.dumps({"fila": i, "direccion": f"CALLE {i}", "ok": True}) for i in range(3)]
+    salida.write_text("\n".join(lineas) + '\n{"fila": 3, "dire', encoding="utf-8")
+    (tmp_path / "salida.jsonl.checkpoint.json").write_text(json.dumps({"marca": 1, "hechas": []}))
+
+    geocodificar_csv.geocodificar_csv(entrada, salida, workers=2, reporte_cada_s=999)
+
+    filas = [json.loads(l)["fila"] for l in salida.read_text(encoding="utf-8").splitlines()]
+    assert sorted(filas) == [0, 1, 2, 3, 4]
+
+
+def test_retomar_csv(entrada, tmp_path):
+    salida = tmp_path / "salida.csv"
+    geocodificar_csv.geocodificar_csv(entrada, salida, workers=2, reporte_cada_s=999)
+    (tmp_path / "salida.csv.checkpoint.json").unlink()
+
+    geocodificar_csv.geocodificar_csv(entrada, salida, workers=2, reporte_cada_s=999)
+
+    with salida.open(newline="") as f:
+        assert sorted(int(r["fila"]) for r in csv.DictReader(f)) == [0, 1, 2, 3, 4]
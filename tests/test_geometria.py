@@ -0,0 +1,103 @@
+from itertools import accumulate
+
+import pytest
+
+import api_datos_catastrales as adc
+import geometria
+
+X0, Y0 = 102000.0, 101000.0
+
+
+def _feature(ring):
+    return {"type": "Feature", "properties": {}, "geometry": {"type": "Polygon", "coordinates": [ring]}}
+
+
+def _decodificar(ring, origen, escala):
+    xs = accumulate(ring[0::2], initial=origen[0])
+    ys = accumulate(ring[1::2], initial=origen[1])
+    return [[x / escala, y / escala] for x, y in list(zip(xs, ys))[1:]]
+
+
+def test_codificar_delta_ida_y_vuelta_con_varias_features():
+    a = [[102000.12, 101000.5], [102010.0, 101000.5], [102010.0, 101010.25], [102000.12, 101000.5]]
+    # la segunda feature está más abajo / a la izquierda que la primera
+    b = [[101990.0, 100990.0], [101995.5, 100990.0], [101995.5, 100995.0], [101990.0, 100990.0]]
+    fc = {"type": "FeatureCollection", "features": [_feature(a), _feature(b)]}
+
+    out = geometria.codificar_delta(fc, 2)
+    assert out["origen"] == [10199000, 10099000]
+    for feature, original in zip(out["geometria"]["features"], (a, b)):
+        ring = feature["geometry"]["coordinates"][0]
+        assert min(ring[0:2]) >= 0
+        assert _decodificar(ring, out["origen"], out["escala"]) == original
+
+
+def _cuadrado(x, y, lado, horario=False):
+    ring = [[X0 + x, Y0 + y], [X0 + x + lado, Y0 + y], [X0 + x + lado, Y0 + y + lado],
+            [X0 + x, Y0 + y + lado], [X0 + x, Y0 + y]]
+    return ring[::-1] if horario else ring
+
+
+# parcelas "comunes": frentes de 8.66 a 10 m, fondos irregulares, en coordenadas GKBA
+_PARCELAS = [
+    {"type": "Polygon", "coordinates": [[[X0, Y0], [X0 + 8.66, Y0 + 0.12], [X0 + 8.41, Y0 + 32.9],
+                                         [X0 - 0.3, Y0 + 32.75], [X0, Y0]]]},
+    {"type": "Polygon", "coordinates": [[[X0 + 10, Y0], [X0 + 10.02, Y0 + 25.4], [X0 + 14.7, Y0 + 31.1],
+                                         [X0 + 20.1, Y0 + 30.8], [X0 + 19.95, Y0 - 0.05], [X0 + 10, Y0]]]},
+    {"type": "MultiPolygon", "coordinates": [[_cuadrado(0, 0, 9.5)], [_cuadrado(30, 4, 3.25, horario=True)]]},
+]
+
+
+@pytest.mark.parametrize("geom", _PARCELAS)
+def test_area_coincide_con_geojson_area_m2(geom):
+    fc = {"type": "FeatureCollection", "features": [{"type": "Feature", "properties": {}, "geometry": geom}]}
+    # geojson_area_m2 hace el shoelace en coordenadas absolutas (~1e5): difiere en ~1e-6 m²
+    assert geometria.area(fc) == pytest.approx(adc.geojson_area_m2(fc), rel=1e-8)
+    assert geometria.area(geom) == pytest.approx(adc.geojson_area_m2(geom), rel=1e-8)
+
+
+@pytest.mark.parametrize("horario", [False, True])
+def test_poligono_con_agujero(horario):
+    # 20x20 con un agujero 10x10 en [2, 12]: área 300, centroide (400*10 - 100*7) / 300 = 11
+    geom = {"type": "Polygon", "coordinates": [_cuadrado(0, 0, 20), _cuadrado(2, 2, 10, horario=horario)]}
+    m = geometria.metricas(geom)
+    assert m["area"] == pytest.approx(300.0)
+    assert m["area"] == pytest.approx(adc.geojson_area_m2(geom))
+    assert m["centroide"] == pytest.approx((X0 + 11, Y0 + 11))
+    assert m["perimetro"] == pytest.approx(120.0)
+    assert m["bbox"] == pytest.approx([X0, Y0, X0 + 20, Y0 + 20])
+
+
+def test_centroide_multipolygon_ponderado_por_area():
+    # dos partes disjuntas: 10x10 con centroide (5, 5) y 20x10 con centroide (30, 5)
+    geom = {"type": "MultiPolygon", "coordinates": [
+        [_cuadrado(0, 0, 10)],
+        [[[X0 + 20, Y0], [X0 + 40, Y0], [X0 + 40, Y0 + 10], [X0 + 20, Y0 + 10], [X0 + 20, Y0]]],
+    ]}
+    m = geometria.metricas(geom)
+    assert m["area"] == pytest.approx(300.0)
+    assert m["centroide"] == pytest.approx((X0 + (100 * 5 + 200 * 30) / 300, Y0 + 5))
+
+
+def test_sumas_numpy_y_python_coinciden():
+    pytest.importorskip("numpy")
+    anillos = [ring for geom in _PARCELAS + [{"type": "Polygon", "coordinates": [_cuadrado(0, 0, 20),
+                                                                                 _cuadrado(2, 2, 10, True)]}]
+               for ring, _ in geometria._anillos(geom)]
+    vectorizadas = geometria._sumas_anillos_np(anillos)
+    for ring, np_sumas in zip(anillos, vectorizadas):
+        assert np_sumas == pytest.approx(geometria._sumas_anillo_py(ring), rel=1e-9, abs=1e-9)
+
+
+def test_metricas_lote_igual_sin_numpy(monkeypatch):
+    pytest.importorskip("numpy")
+    lote = _PARCELAS + [{"type": "Point", "coordinates": [X0, Y0]}]
+    con_numpy = geometria.metricas_lote(lote)
+    monkeypatch.setattr(geometria, "np", None)
+    sin_numpy = geometria.metricas_lote(lote)
+    assert "error" in con_numpy[-1] and "error" in sin_numpy[-1]
+    for a, b in zip(con_numpy[:-1], sin_numpy[:-1]):
+        assert a["area"] == pytest.approx(b["area"], rel=1e-12)
+        assert a["centroide"] == pytest.approx(b["centroide"], rel=1e-12)
+        assert a["perimetro"] == pytest.approx(b["perimetro"], rel=1e-12)
+        assert a["bbox"] == b["bbox"]
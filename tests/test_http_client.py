@@ -0,0 +1,239 @@
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+import requests
+
+import api_datos_catastrales as adc
+import api_procesos_geograficos
+import circuito
+import http_client
+import metricas
+import stub_upstream
+
+
+class _Handler(BaseHTTPRequestHandler):
+    demora_s = 0.0
+    status = 200
+    pedidos = 0
+
+    def do_GET(self):
+        type(self).pedidos += 1
+        time.sleep(self.demora_s)
+        cuerpo = b'{"ok": true}'
+        try:
+            self.send_response(self.status)
+            if self.status == 503:
+                self.send_header("Retry-After", "5")
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(cuerpo)))
+            self.end_headers()
+            self.wfile.write(cuerpo)
+        except OSError:
+            pass
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def servidor():
+    handler = type("Handler", (_Handler,), {"pedidos": 0})
+    srv = ThreadingHTTPServer(("127.0.0.1", 0), handler)
+    srv.daemon_threads = True
+    hilo = threading.Thread(target=srv.serve_forever, daemon=True)
+    hilo.start()
+    yield handler, f"http://127.0.0.1:{srv.server_address[1]}/"
+    srv.shutdown()
+    srv.server_close()
+    http_client.cerrar()
+
+
+def test_deadline_acota_reintentos_de_lectura(servidor):
+    handler, url = servidor
+    handler.demora_s = 3.0
+    t0 = time.monotonic()
+    with circuito.deadline(1.0):
+        with pytest.raises(requests.exceptions.Timeout):
+            http_client.get(url, servicio="test_lento")
+    assert time.monotonic() - t0 < 1.3
+
+
+def test_deadline_acota_reintentos_de_5xx(servidor):
+    handler, url = servidor
+    handler.status = 503
+    handler.demora_s = 0.4
+    t0 = time.monotonic()
+    with circuito.deadline(1.0):
+        r = http_client.get(url, servicio="test_503")
+    assert r.status_code == 503
+    assert time.monotonic() - t0 < 1.3
+
+
+def test_sin_deadline_reintenta_status_forcelist(servidor):
+    handler, url = servidor
+    handler.status = 503
+    r = http_client.get(url, servicio="test_503_sin_deadline")
+    assert r.status_code == 503
+    assert handler.pedidos == http_client.DEFAULT_HOST_CONFIG["retries"] + 1
+
+
+def test_timeouts_por_deadline_no_abren_el_circuito(servidor):
+    handler, url = servidor
+    handler.demora_s = 1.0
+    for _ in range(circuito.UMBRAL_FALLAS + 1):
+        with circuito.deadline(0.2):
+            with pytest.raises(circuito.DeadlineExcedido):
+                http_client.get(url, servicio="test_deadline_sano")
+    assert circuito.estadisticas()["test_deadline_sano"]["estado"] == circuito.CERRADO
+    assert circuito.disponible("test_deadline_sano")
+
+
+def test_timeouts_del_upstream_abren_el_circuito(servidor, monkeypatch):
+    handler, url = servidor
+    handler.demora_s = 1.0
+    monkeypatch.setitem(http_client.HOST_CONFIG, "127.0.0.1", {"timeout": (1.0, 0.2), "retries": 0})
+    for _ in range(circuito.UMBRAL_FALLAS):
+        with circuito.deadline(5.0):
+            with pytest.raises(requests.exceptions.Timeout):
+                http_client.get(url, servicio="test_timeout_upstream")
+    assert circuito.estadisticas()["test_timeout_upstream"]["estado"] == circuito.ABIERTO
+
+
+# ====== contra stub_upstream ======
+EPOK_PARCELA = "https://epok.buenosaires.gob.ar/catastro/parcela/"
+USIG_NORMALIZAR = "https://servicios.usig.buenosaires.gob.ar/normalizar/"
+
+
+def test_una_session_por_host(upstream):
+    upstream()
+    epok = http_client.session_para(EPOK_PARCELA)
+    assert http_client.session_para("https://epok.buenosaires.gob.ar/catastro/geometria/") is epok
+    assert http_client.session_para(USIG_NORMALIZAR) is not epok
+    adapter = epok.get_adapter(EPOK_PARCELA)
+    assert adapter._pool_maxsize == http_client.host_config("epok.buenosaires.gob.ar")["pool_maxsize"]
+
+
+def test_llamadas_seguidas_reusan_la_conexion(upstream):
+    srv = upstream()
+    for altura in (1130, 1132, 1134, 1136):
+        r = http_client.get(EPOK_PARCELA, params={"codigo_calle": 4012, "altura": altura},
+                            servicio="epok_parcela_codcalle")
+        assert r.status_code == 200
+    assert srv.contadores()["epok_parcela_codcalle"]["llamadas"] == 4
+    pm = http_client.session_para(EPOK_PARCELA).get_adapter(EPOK_PARCELA).poolmanager
+    pools = [pm.pools[k] for k in pm.pools.keys()]
+    # keep-alive: un solo pool y un solo handshake para las cuatro
+    assert len(pools) == 1
+    assert pools[0].num_connections == 1
+
+
+def test_reintenta_503_del_upstream(upstream):
+    srv = upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela": stub_upstream.Latencia(0, 0, tasa_error=1.0)},
+    ))
+    r = http_client.get(EPOK_PARCELA, params={"smp": "044-097A-029"}, servicio="epok_parcela")
+    assert r.status_code == 503
+    intentos = http_client.host_config("epok.buenosaires.gob.ar")["retries"] + 1
+    assert srv.contadores()["epok_parcela"] == {"llamadas": intentos, "errores_inyectados": intentos}
+
+
+def test_no_reintenta_errores_que_no_son_de_status_forcelist(upstream):
+    srv = upstream()
+    r = http_client.get("https://ws.usig.buenosaires.gob.ar/rest/convertir_coordenadas",
+                        params={"x": "no-es-numero", "y": "1"}, servicio="usig_convertir_coordenadas")
+    assert r.status_code == 400
+    assert srv.contadores()["usig_convertir_coordenadas"]["llamadas"] == 1
+
+
+def test_modulos_api_salen_por_el_cliente_compartido(upstream):
+    srv = upstream()
+    norm = adc.usig_normalizar("Davila 1130")
+    assert norm["direccionesNormalizadas"][0]["cod_calle"] == 4012
+    assert adc.catastro_parcela_by_codigo_calle_altura(4012, 1130)["smp"] == "044-097A-029"
+    assert adc.catastro_parcela_by_smp("044-097A-029")["smp"] == "044-097A-029"
+    assert api_procesos_geograficos.convertir_coordenadas(-58.44, -34.63, "gkba")["tipo_resultado"] == "Ok"
+    contadores = srv.contadores()
+    assert {"usig_normalizar", "epok_parcela_codcalle", "epok_parcela",
+            "usig_convertir_coordenadas"} <= set(contadores)
+    assert set(http_client._sessions) >= {"servicios.usig.buenosaires.gob.ar", "epok.buenosaires.gob.ar",
+                                          "ws.usig.buenosaires.gob.ar"}
+
+
+# ====== single-flight ======
+def _en_paralelo(n, fn):
+    """Corre fn() en n hilos que arrancan juntos; devuelve [(resultado, excepción)]."""
+    barrera = threading.Barrier(n)
+    salida = [None] * n
+
+    def correr(i):
+        barrera.wait()
+        try:
+            salida[i] = (fn(), None)
+        except Exception as e:
+            salida[i] = (None, e)
+
+    hilos = [threading.Thread(target=correr, args=(i,)) for i in range(n)]
+    for h in hilos:
+        h.start()
+    for h in hilos:
+        h.join()
+    return salida
+
+
+def _get_codcalle(altura=1130):
+    return http_client.get(EPOK_PARCELA, params={"codigo_calle": 4012, "altura": altura},
+                           servicio="epok_parcela_codcalle")
+
+
+def test_llamadas_identicas_concurrentes_salen_una_vez(upstream):
+    srv = upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela_codcalle": stub_upstream.Latencia(300, 0)},
+    ))
+    antes = metricas.coalescidas().get("epok_parcela_codcalle", 0)
+    salida = _en_paralelo(8, _get_codcalle)
+
+    assert all(e is None for _, e in salida)
+    respuestas = {id(r) for r, _ in salida}
+    assert len(respuestas) == 1
+    assert salida[0][0].json()["smp"] == "044-097A-029"
+    assert srv.contadores()["epok_parcela_codcalle"]["llamadas"] == 1
+    assert metricas.coalescidas()["epok_parcela_codcalle"] == antes + 7
+
+    # terminada la llamada no queda nada en vuelo: la próxima sale de nuevo
+    _get_codcalle()
+    assert srv.contadores()["epok_parcela_codcalle"]["llamadas"] == 2
+
+
+def test_params_distintos_no_se_coalescen(upstream):
+    srv = upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela_codcalle": stub_upstream.Latencia(200, 0)},
+    ))
+    alturas = iter([1130, 1132])
+    lock = threading.Lock()
+
+    def pedir():
+        with lock:
+            altura = next(alturas)
+        return _get_codcalle(altura)
+
+    salida = _en_paralelo(2, pedir)
+    assert len({r.json()["smp"] for r, _ in salida}) == 2
+    assert srv.contadores()["epok_parcela_codcalle"]["llamadas"] == 2
+
+
+def test_el_error_del_lider_es_el_de_todos(upstream, monkeypatch):
+    upstream(stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela_codcalle": stub_upstream.Latencia(1000, 0)},
+    ))
+    monkeypatch.setitem(http_client.HOST_CONFIG, "epok.buenosaires.gob.ar", {"retries": 0, "timeout": (1.0, 0.2)})
+    salida = _en_paralelo(4, _get_codcalle)
+
+    errores = [e for _, e in salida]
+    assert all(isinstance(e, requests.exceptions.Timeout) for e in errores)
+    assert len({id(e) for e in errores}) == 1
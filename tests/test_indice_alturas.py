@@ -0,0 +1,60 @@
+import pytest
+
+import indice_alturas
+
+
+@pytest.fixture
+def indice(tmp_path, monkeypatch):
+    monkeypatch.setattr(indice_alturas, "INDICE_PATH", tmp_path / "indice_alturas.sqlite3")
+    monkeypatch.setattr(indice_alturas, "_indice", {})
+    monkeypatch.setattr(indice_alturas, "_cargado", False)
+    return indice_alturas
+
+
+def _recargar(indice):
+    indice._indice.clear()
+    indice._cargado = False
+
+
+def test_intervalo_entre_alturas_con_el_mismo_smp(indice):
+    indice.registrar(17071, 1100, "044-097A-010", "DAVILA 1100")
+    indice.registrar(17071, 1140, "044-097A-010", "DAVILA 1140")
+    assert indice.smp_para_altura(17071, 1120) == "044-097A-010"
+    assert indice.smp_para_altura(17071, 1121) is None
+
+
+def test_registros_persisten_fila_por_fila(indice):
+    indice.registrar(17071, 1100, "044-097A-010", "DAVILA 1100")
+    indice.registrar_varios(17071, [{"altura": 1130, "smp": "044-097A-011", "direccion": "DAVILA 1130"}])
+    _recargar(indice)
+    assert indice.alturas_cercanas(17071, 1110) == [
+        {"altura": 1100, "smp": "044-097A-010", "direccion": "DAVILA 1100"},
+        {"altura": 1130, "smp": "044-097A-011", "direccion": "DAVILA 1130"},
+    ]
+
+
+def test_intervalo_solo_con_puntos_de_la_misma_vereda(indice):
+    # 1101 y 1141 son de la vereda de enfrente: no arman intervalo para las pares
+    indice.registrar(17071, 1101, "044-098-005")
+    indice.registrar(17071, 1141, "044-098-005")
+    assert indice.smp_para_altura(17071, 1120) is None
+    assert indice.smp_para_altura(17071, 1121) == "044-098-005"
+
+
+def test_sin_intervalo_entre_smps_distintos_ni_afuera(indice):
+    indice.registrar(17071, 1100, "044-097A-010")
+    indice.registrar(17071, 1140, "044-097A-011")
+    assert indice.smp_para_altura(17071, 1120) is None
+    assert indice.smp_para_altura(17071, 1098) is None
+    assert indice.smp_para_altura(17071, 1142) is None
+    assert indice.smp_para_altura(17072, 1100) is None
+
+
+def test_alturas_cercanas_por_distancia_vereda_y_tope(indice):
+    indice.registrar_varios(17071, [{"altura": a, "smp": f"044-097A-{a}"} for a in (1000, 1090, 1095, 1110, 1120, 1300)])
+    cercanas = indice.alturas_cercanas(17071, 1100, limit=6, max_delta=120)
+    # empate de distancia (1090 / 1110): primero la más baja; 1095 es de la otra vereda
+    assert [c["altura"] for c in cercanas] == [1090, 1110, 1120, 1000]
+    assert [c["altura"] for c in indice.alturas_cercanas(17071, 1100, limit=2)] == [1090, 1110]
+    assert [c["altura"] for c in indice.alturas_cercanas(17071, 1100, max_delta=10, misma_vereda=False)] == [
+        1095, 1090, 1110]
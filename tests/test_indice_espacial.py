@@ -0,0 +1,15 @@
+import indice_espacial
+
+
+def test_indice_vacio_no_cuenta_como_armado(monkeypatch):
+    monkeypatch.setattr(indice_espacial, "_armado_ts", float("-inf"))
+    monkeypatch.setattr(indice_espacial.almacen_parcelas, "iterar_geometrias", lambda: iter(()))
+    assert indice_espacial.construir() is None
+    assert indice_espacial._armado_ts == float("-inf")
+
+
+def test_punto_en_anillos_con_agujero():
+    exterior = [(0, 0), (10, 0), (10, 10), (0, 10), (0, 0)]
+    agujero = [(4, 4), (6, 4), (6, 6), (4, 6), (4, 4)]
+    assert indice_espacial.punto_en_anillos(1, 1, [exterior, agujero])
+    assert not indice_espacial.punto_en_anillos(5, 5, [exterior, agujero])
@@ -0,0 +1,46 @@
+import pytest
+from flask import Flask
+
+import json_rapido
+
+orjson = pytest.importorskip("orjson")
+
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+    app.json = json_rapido.JSONProviderRapido(app)
+    return app
+
+
+@pytest.fixture
+def llamadas_orjson(monkeypatch):
+    llamadas = []
+    original = orjson.dumps
+
+    def dumps(obj, **kwargs):
+        llamadas.append(kwargs.get("option", 0))
+        return original(obj, **kwargs)
+
+    monkeypatch.setattr(json_rapido.orjson, "dumps", dumps)
+    return llamadas
+
+
+def test_response_compacta_usa_orjson(app, llamadas_orjson):
+    with app.app_context():
+        r = app.json.response({"smp": "044-097A-029", "área": 1.5})
+    assert llamadas_orjson
+    assert r.get_data(as_text=True) == '{"smp":"044-097A-029","área":1.5}\n'
+
+
+def test_response_indentada_usa_orjson(app, llamadas_orjson):
+    app.json.compact = False
+    with app.app_context():
+        r = app.json.response({"a": [1]})
+    assert llamadas_orjson and llamadas_orjson[0] & orjson.OPT_INDENT_2
+    assert r.get_data(as_text=True) == '{\n  "a": [\n    1\n  ]\n}\n'
+
+
+def test_kwargs_sin_equivalente_caen_a_json(app, llamadas_orjson):
+    assert app.json.dumps({"a": 1}, indent=4) == '{\n    "a": 1\n}'
+    assert not llamadas_orjson
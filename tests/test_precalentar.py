@@ -0,0 +1,87 @@
+import json
+
+import pytest
+
+import api_buscador_caba as abc
+import api_datos_catastrales as adc
+import archivo_upstream
+import cache_local
+import cache_parcelas
+import indice_calles
+import precalentar
+
+
+@pytest.fixture
+def trafico(monkeypatch):
+    por_servicio = {"usig_normalizar": [], "epok_parcela": [], "usig_autocomplete": []}
+    monkeypatch.setattr(archivo_upstream, "frecuentes",
+                        lambda servicio, parametro, desde, n: por_servicio[servicio][:n])
+    monkeypatch.setattr(precalentar, "LISTA_PATH", None)
+    return por_servicio
+
+
+@pytest.fixture
+def caches(monkeypatch):
+    monkeypatch.setattr(adc, "CACHE_NORMALIZAR", cache_local.CacheTTL("test_normalizar", 60, persistente=False))
+    monkeypatch.setattr(abc, "CACHE_AUTOCOMPLETE", cache_local.CacheTTL("test_autocomplete", 60, persistente=False))
+    frescas = set()
+    monkeypatch.setattr(cache_parcelas, "fresca", lambda smp: smp in frescas)
+    monkeypatch.setattr(indice_calles, "obtener_indice", lambda: None)
+    return frescas
+
+
+def test_objetivos_lista_fija_primero_y_sin_repetidos(trafico, tmp_path):
+    trafico["usig_normalizar"] = [("davila  1130, CABA", 9), ("Yerbal 2201", 4), ("Dávila 1130", 2)]
+    trafico["epok_parcela"] = [("044-097a-029", 5), ("044-097A-030", 1)]
+    lista = tmp_path / "lista.json"
+    lista.write_text(json.dumps({"direcciones": ["Rivadavia 5000", "DAVILA 1130"], "smps": ["044-097A-029"]}))
+
+    objs = precalentar.objetivos(top_n=10, lista=lista)
+    assert objs["direcciones"] == ["Rivadavia 5000", "DAVILA 1130", "Yerbal 2201"]
+    assert objs["smps"] == ["044-097A-029", "044-097A-030"]
+    assert objs["prefijos"] == []
+    assert precalentar.objetivos(top_n=1, lista=tmp_path / "no_existe.json")["direcciones"] == ["davila  1130, CABA"]
+
+
+def test_en_cache_por_tipo(caches, monkeypatch):
+    adc.CACHE_NORMALIZAR.set("davila 1130", {"direccionesNormalizadas": []})
+    caches.add("044-097A-029")
+    abc.CACHE_AUTOCOMPLETE.set("davila 11", {"direccionesNormalizadas": []})
+    assert precalentar._en_cache("direcciones", "Dávila 1130, CABA")
+    assert not precalentar._en_cache("direcciones", "Yerbal 2201")
+    assert precalentar._en_cache("smps", "044-097a-029")
+    assert not precalentar._en_cache("smps", "044-097A-030")
+    assert precalentar._en_cache("prefijos", "Davila 11")
+    assert not precalentar._en_cache("prefijos", "corri")
+
+    indice = indice_calles.IndiceCalles([(3006, "CORRIENTES AV.")])
+    monkeypatch.setattr(indice_calles, "obtener_indice", lambda: indice)
+    assert precalentar._en_cache("prefijos", "corri")
+    # con altura o con cruce no los contesta el índice
+    assert not precalentar._en_cache("prefijos", "corrientes 10")
+    assert not precalentar._en_cache("prefijos", "corrientes y cal")
+
+
+def test_precalentar_saltea_lo_cacheado_y_guarda_el_ultimo_error(trafico, caches, monkeypatch, capsys):
+    trafico["usig_normalizar"] = [("Davila 1130", 3), ("Yerbal 2201", 2), ("Rivadavia 0", 1)]
+    adc.CACHE_NORMALIZAR.set("davila 1130", {"direccionesNormalizadas": []})
+    calentadas = []
+
+    def calentar(tipo, valor, smps_extra):
+        calentadas.append(valor)
+        if valor == "Rivadavia 0":
+            raise ValueError("altura inválida")
+        adc.CACHE_NORMALIZAR.set(cache_local.canonizar_direccion(valor), {"direccionesNormalizadas": []})
+        return True
+
+    monkeypatch.setattr(precalentar, "_calentar", calentar)
+    res = precalentar.precalentar(rps=0, reporte_cada_s=None)
+
+    assert calentadas == ["Yerbal 2201", "Rivadavia 0"]
+    prog = res["progreso"]["direcciones"]
+    assert (prog["pendientes"], prog["calentadas"], prog["errores"]) == (2, 1, 1)
+    assert prog["ultimo_error"] == {"clave": "Rivadavia 0", "error": "ValueError: altura inválida"}
+    assert res["cobertura_antes"]["direcciones"]["en_cache"] == 1
+    assert res["cobertura_despues"]["direcciones"]["en_cache"] == 2
+    # desde la app (sin reporte_cada_s) no escribe nada
+    assert capsys.readouterr().err == ""
@@ -0,0 +1,41 @@
+import pytest
+
+import proyeccion_gkba
+
+# (lon, lat) -> (x, y) GKBA: el origen de la proyección y puntos de CABA calculados
+# con PROJ sobre la misma definición que publica USIG (ver proyeccion_gkba.py)
+_REFERENCIAS = [
+    ((-58.4633, -34.629269), (100000.0, 100000.0)),
+    ((-58.448736, -34.637417), (101335.4149, 99095.9939)),  # Dávila 1130
+    ((-58.3816, -34.6037), (107494.3383, 102833.4901)),
+    ((-58.5315, -34.5395), (93739.2061, 109956.4553)),
+    ((-58.4620, -34.7050), (100119.1040, 91598.6290)),
+]
+
+
+@pytest.mark.parametrize("lonlat, xy", _REFERENCIAS)
+def test_puntos_de_referencia(lonlat, xy):
+    assert proyeccion_gkba.lonlat_a_gkba(*lonlat) == pytest.approx(xy, abs=1e-3)
+    assert proyeccion_gkba.gkba_a_lonlat(*xy) == pytest.approx(lonlat, abs=1e-8)
+
+
+def test_ida_y_vuelta():
+    for lon in (-58.53, -58.47, -58.41, -58.35):
+        for lat in (-34.70, -34.63, -34.56):
+            x, y = proyeccion_gkba.lonlat_a_gkba(lon, lat)
+            assert proyeccion_gkba.gkba_a_lonlat(x, y) == pytest.approx((lon, lat), abs=1e-10)
+
+
+@pytest.mark.parametrize("con_numpy", [True, False])
+def test_lotes_igual_que_punto_por_punto(con_numpy, monkeypatch):
+    if con_numpy:
+        pytest.importorskip("numpy")
+    else:
+        monkeypatch.setattr(proyeccion_gkba, "np", None)
+    lonlats = [lonlat for lonlat, _ in _REFERENCIAS]
+    xys = proyeccion_gkba.lonlat_a_gkba_lote(iter(lonlats))
+    assert [pytest.approx(p, abs=1e-6) for p in xys] == [proyeccion_gkba.lonlat_a_gkba(*p) for p in lonlats]
+    vuelta = proyeccion_gkba.gkba_a_lonlat_lote(xys)
+    assert [pytest.approx(p, abs=1e-10) for p in vuelta] == lonlats
+    assert proyeccion_gkba.lonlat_a_gkba_lote([]) == []
+    assert proyeccion_gkba.gkba_a_lonlat_lote([]) == []
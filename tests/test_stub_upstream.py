@@ -0,0 +1,36 @@
+import pytest
+import requests
+
+import stub_upstream
+from conftest import RAIZ
+
+
+@pytest.fixture
+def stub(monkeypatch):
+    monkeypatch.setattr(stub_upstream, "FIXTURES_DIR", RAIZ / "salida_epok_test")
+    config = stub_upstream.ConfigStub(
+        default=stub_upstream.Latencia(0, 0),
+        por_servicio={"epok_parcela_codcalle": stub_upstream.Latencia(0, 0, tasa_error=1.0),
+                      "usig_autocomplete": stub_upstream.Latencia(0, 0, tasa_error=1.0)},
+    )
+    srv, url = stub_upstream.iniciar_en_hilo(config)
+    yield srv, url
+    srv.shutdown()
+    srv.server_close()
+
+
+def test_overrides_con_las_etiquetas_del_cliente(stub):
+    srv, url = stub
+    epok = f"{url}/epok.buenosaires.gob.ar/catastro/parcela/"
+    usig = f"{url}/servicios.usig.buenosaires.gob.ar/normalizar/"
+    assert requests.get(epok, params={"codigo_calle": 17071, "altura": 1130}).status_code == 503
+    assert requests.get(epok, params={"smp": "044-097A-029"}).status_code != 503
+    assert requests.get(usig, params={"direccion": "davila"}).status_code == 503
+    assert requests.get(usig, params={"direccion": "davila 1130", "geocodificar": "true"}).status_code == 200
+
+    assert srv.contadores() == {
+        "epok_parcela": {"llamadas": 1, "errores_inyectados": 0},
+        "epok_parcela_codcalle": {"llamadas": 1, "errores_inyectados": 1},
+        "usig_autocomplete": {"llamadas": 1, "errores_inyectados": 1},
+        "usig_normalizar": {"llamadas": 1, "errores_inyectados": 0},
+    }